@@ -0,0 +1,25 @@
+r"""
+Benchmarks of the digitization hot paths.
+
+The benchmarks follow the asv conventions (classes with ``params``, ``param_names``,
+``setup`` and ``time_*`` methods) and can be run without asv by::
+
+    python -m benchmarks.run
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
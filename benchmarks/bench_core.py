@@ -0,0 +1,457 @@
+r"""
+Benchmarks of the Tk-free digitization code paths.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import pathlib
+import tempfile
+import numpy as np
+
+from datadigitizer import (cache, core, export, extraction, kernels, pages, palette, preprocessing, settings,
+                           shared, templates, tracing, vector)
+
+NPOINTS = [10, 1000, 100000]
+IMAGE_SIZES = [(480, 640), (2000, 3000)]
+
+
+def _random_data(n: int, shape=(480, 640), seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    row, col = shape
+    data = core.add_points(core.new_data(),
+                           rng.uniform(0, row - 1, n), rng.uniform(0, col - 1, n), row)
+    data['series'] = rng.integers(0, 3, n)
+    limits = core.add_points(core.new_data(),
+                             [row - 10, row - 10, row - 10, 10],
+                             [10, col - 10, 10, 10], row)
+    limits['type'] = core.LIMITS
+    return np.concatenate((limits, data))
+
+
+class TransformSuite:
+    params = [NPOINTS, ['linear', 'log']]
+    param_names = ['npoints', 'which']
+
+    def setup(self, npoints, which):
+        self.trans = core.Transform(values_min=1.0, values_max=1000.0,
+                                    pix_min=10, pix_max=630, which=which)
+        self.values = np.logspace(0, 3, npoints)
+        self.pixels = self.trans.forward(self.values)
+
+    def time_forward(self, npoints, which):
+        self.trans.forward(self.values)
+
+    def time_backward(self, npoints, which):
+        self.trans.backward(self.pixels)
+
+
+class PointsSuite:
+    params = [NPOINTS]
+    param_names = ['npoints']
+
+    def setup(self, npoints):
+        self.data = _random_data(npoints)
+        self.rng = np.random.default_rng(1)
+        self.clicks = self.rng.uniform(0, 480, (100, 2))
+
+    def time_insert_one(self, npoints):
+        core.add_points(self.data, 240.0, 320.0, 480)
+
+    def time_insert_bulk(self, npoints):
+        core.add_points(self.data, self.clicks[:, 0], self.clicks[:, 1], 480)
+
+    def time_nearest_point(self, npoints):
+        for i, j in self.clicks:
+            core.nearest_point(self.data, i, j)
+
+
+class OverlaySuite:
+    params = [[10, 1000, 10000], IMAGE_SIZES]
+    param_names = ['npoints', 'shape']
+
+    def setup(self, npoints, shape):
+        self.data = _random_data(npoints, shape)
+        self.overlay = np.zeros(shape=shape + (4,))
+        self.dx = int(shape[0] * 0.01)
+        self.dy = int(shape[1] * 0.01)
+
+    def time_paint_overlay(self, npoints, shape):
+        core.paint_overlay(self.overlay, self.data, self.dx, self.dy)
+
+
+class MeasureSuite:
+    params = [NPOINTS]
+    param_names = ['npoints']
+
+    def setup(self, npoints):
+        self.data = _random_data(npoints)
+
+    def time_measure(self, npoints):
+        core.measure(self.data, xvalues=(1.0, 100.0), yvalues=(0.0, 1.0), xlog=True)
+
+
+class SaveSuite:
+    params = [NPOINTS, list(export.EXPORT_FORMATS)]
+    param_names = ['npoints', 'fmt']
+
+    def setup(self, npoints, fmt):
+        self.data = _random_data(npoints)
+        core.measure(self.data, xvalues=(0.0, 1.0), yvalues=(0.0, 1.0))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fpath = pathlib.Path(self.tmpdir.name) / 'data.txt'
+        self.grid = export.make_grid(0.0, 1.0, 1000)
+
+    def teardown(self, npoints, fmt):
+        self.tmpdir.cleanup()
+
+    def time_save(self, npoints, fmt):
+        export.save_data(self.fpath, self.data, ['a', 'b', 'c'], fmt=fmt, grid=self.grid)
+
+
+class DecimateSuite:
+    params = [NPOINTS, ['uniform', 'rdp', 'max']]
+    param_names = ['npoints', 'method']
+
+    def setup(self, npoints, method):
+        self.data = _random_data(npoints)
+        core.measure(self.data, xvalues=(0.0, 1.0), yvalues=(0.0, 1.0))
+        self.value = {'uniform': 0.01, 'rdp': 0.01, 'max': 100}[method]
+
+    def time_decimate(self, npoints, method):
+        export.decimate(self.data, method, self.value)
+
+
+class ResampleSuite:
+    params = [NPOINTS]
+    param_names = ['npoints']
+
+    def setup(self, npoints):
+        self.data = _random_data(npoints)
+        core.measure(self.data, xvalues=(1.0, 100.0), yvalues=(0.0, 1.0), xlog=True)
+        self.grid = export.make_grid(1.0, 100.0, 1000, 'log')
+
+    def time_resample(self, npoints):
+        export.resample(self.data, ['a', 'b', 'c'], self.grid, xlog=True)
+
+
+class MarkersSuite:
+    params = [[100, 10000], [(1000, 1000), (4000, 5000)]]
+    param_names = ['nmarkers', 'shape']
+
+    def setup(self, nmarkers, shape):
+        rng = np.random.default_rng(0)
+        self.image = np.ones(shape + (3,), dtype=np.float32)
+        yy, xx = np.mgrid[-3:4, -3:4]
+        disk = (yy**2 + xx**2) <= 9
+        for i, j in zip(rng.integers(10, shape[0] - 10, nmarkers),
+                        rng.integers(10, shape[1] - 10, nmarkers)):
+            self.image[i-3:i+4, j-3:j+4][disk] = 0.0
+        self.mask = extraction.dark_mask(self.image)
+
+    def time_dark_mask(self, nmarkers, shape):
+        extraction.dark_mask(self.image)
+
+    def time_detect_markers(self, nmarkers, shape):
+        extraction.detect_markers(self.mask)
+
+
+class PreprocessingSuite:
+    params = [IMAGE_SIZES, list(preprocessing.Pipeline.STAGES)]
+    param_names = ['shape', 'stage']
+
+    def setup(self, shape, stage):
+        rng = np.random.default_rng(0)
+        image = rng.uniform(0.8, 1.0, shape + (3,))
+        image[::50] = 0.5
+        image[:, ::50] = 0.5
+        self.pipeline = preprocessing.Pipeline(image, background_size=31, grid_length=shape[0] // 4)
+
+    def time_stage(self, shape, stage):
+        # the inputs are cached: only the timed stage is recomputed
+        self.pipeline.get(stage)
+        self.pipeline._cache.pop(stage)
+
+    def time_cached(self, shape, stage):
+        self.pipeline.get(stage)
+
+
+class PaletteSuite:
+    params = [IMAGE_SIZES + [(4000, 5000)]]
+    param_names = ['shape']
+
+    def setup(self, shape):
+        # the pixels are subsampled: the cost must not depend on the image size
+        self.image = np.ones(shape + (3,), dtype=np.float32)
+        for k, color in enumerate([(0.1, 0.4, 0.8), (0.9, 0.1, 0.1), (0.2, 0.6, 0.2)]):
+            i = (k + 1) * shape[0] // 4
+            self.image[i - 2:i + 3, 10:-10] = color
+
+    def time_discover_colors(self, shape):
+        palette.discover_colors(self.image)
+
+
+class TraceSuite:
+    params = [[(1000, 1000), (4000, 5000)]]
+    param_names = ['shape']
+
+    def setup(self, shape):
+        # dashed sine wave across the image: the cost must not depend on the image size
+        self.image = np.ones(shape + (3,), dtype=np.float32)
+        j = np.arange(10, shape[1] - 10)
+        i = np.rint(shape[0] / 2 + shape[0] / 8 * np.sin(2 * np.pi * j / shape[1])).astype(int)
+        dashes = (j // 10) % 3 != 2
+        for di in (-1, 0, 1):
+            self.image[i[dashes] + di, j[dashes]] = (0.0, 0.0, 1.0)
+        self.seed = (i[0], j[0])
+
+    def time_trace(self, shape):
+        tracing.trace(self.image, [self.seed], step=3.0)
+
+
+class VectorSuite:
+    params = [[1000, 100000], list(vector.VECTOR_FORMATS)]
+    param_names = ['npoints', 'suffix']
+
+    def setup(self, npoints, suffix):
+        from matplotlib.figure import Figure
+        x = np.linspace(0, 10, npoints)
+        fig = Figure(figsize=(6, 4))
+        ax = fig.add_subplot(111)
+        ax.plot(x, np.sin(x), 'b-')
+        ax.plot(x[::max(npoints // 100, 1)], np.cos(x[::max(npoints // 100, 1)]), 'ro')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fpath = pathlib.Path(self.tmpdir.name) / f'figure{suffix}'
+        fig.savefig(self.fpath)
+        self.figure = vector.read(self.fpath)
+
+    def teardown(self, npoints, suffix):
+        self.tmpdir.cleanup()
+
+    def time_read(self, npoints, suffix):
+        vector.read(self.fpath)
+
+    def time_to_data(self, npoints, suffix):
+        self.figure.to_data()
+
+
+class PagesSuite:
+    params = [[10, 100], ['.tif', '.pdf']]
+    param_names = ['npages', 'suffix']
+
+    def setup(self, npages, suffix):
+        from PIL import Image
+        i, j = np.mgrid[0:1100, 0:850]
+        frames = [Image.fromarray(((i + j + k) % 256).astype(np.uint8)) for k in range(npages)]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fpath = pathlib.Path(self.tmpdir.name) / f'report{suffix}'
+        frames[0].save(self.fpath, save_all=True, append_images=frames[1:])
+
+    def teardown(self, npages, suffix):
+        self.tmpdir.cleanup()
+
+    def time_open(self, npages, suffix):
+        pages.Document(self.fpath).close()
+
+    def time_iterate(self, npages, suffix):
+        with pages.Document(self.fpath) as document:
+            for image_array, _ in document:
+                pass
+
+    def peakmem_iterate(self, npages, suffix):
+        with pages.Document(self.fpath) as document:
+            for image_array, _ in document:
+                pass
+
+
+class TemplateSuite:
+    params = [IMAGE_SIZES]
+    param_names = ['shape']
+
+    def setup(self, shape):
+        rng = np.random.default_rng(0)
+        self.image = np.full(shape, 1.0)
+        # frame of the axes and a noisy curve
+        self.image[shape[0] // 10, shape[1] // 8:-shape[1] // 8] = 0.0
+        self.image[-shape[0] // 10, shape[1] // 8:-shape[1] // 8] = 0.0
+        self.image[shape[0] // 10:-shape[0] // 10, shape[1] // 8] = 0.0
+        self.image[shape[0] // 10:-shape[0] // 10, -shape[1] // 8] = 0.0
+        j = np.arange(shape[1] // 8, shape[1] - shape[1] // 8)
+        self.image[(shape[0] // 2 + shape[0] // 4 * np.sin(j / 50) + rng.normal(0, 2, j.size)).astype(int), j] = 0.0
+        self.data = core.new_data()
+        for which, (i, j) in zip(core.LIMITS, [(0.9, 0.125), (0.9, 0.875), (0.9, 0.125), (0.1, 0.125)]):
+            self.data = core.add_points(self.data, i * shape[0], j * shape[1], shape[0], which=which)
+        self.template = templates.Template.from_data(self.data, self.image, (0, 1), (0, 1))
+        self.shifted = np.roll(self.image, (7, -5), axis=(0, 1))
+
+    def time_from_data(self, shape):
+        templates.Template.from_data(self.data, self.image, (0, 1), (0, 1))
+
+    def time_apply(self, shape):
+        self.template.apply(self.shifted)
+
+
+class CacheSuite:
+    params = [NPOINTS]
+    param_names = ['npoints']
+
+    def setup(self, npoints):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = cache.ResultCache(self.tmpdir.name)
+        self.data = _random_data(npoints)
+        self.key = cache.make_key('image', 0, {'method': 'colors'})
+        self.cache.put(self.key, self.data, {'series_names': ['Series 1']})
+
+    def teardown(self, npoints):
+        self.tmpdir.cleanup()
+
+    def time_get(self, npoints):
+        self.cache.get(self.key)
+
+    def time_put(self, npoints):
+        self.cache.put(self.key, self.data, {'series_names': ['Series 1']})
+
+
+class SharedSuite:
+    params = [[(2000, 3000), (8000, 10000)]]
+    param_names = ['shape']
+
+    def setup(self, shape):
+        self.image = np.ones(shape + (3,), dtype=np.float32)
+        self.args = [((0.1, 0.4, 0.8), 0.25), ((0.9, 0.1, 0.1), 0.25), ((0.2, 0.6, 0.2), 0.25),
+                     ((0.5, 0.5, 0.0), 0.25)]
+        for k, (color, _) in enumerate(self.args):
+            i = (k + 1) * shape[0] // 5
+            self.image[i - 2:i + 3, 10:-10] = color
+
+    def time_map_image(self, shape):
+        shared.map_image(extraction.extract_color, self.image, self.args, workers=4)
+
+    def peakmem_map_image(self, shape):
+        shared.map_image(extraction.extract_color, self.image, self.args, workers=4)
+
+
+class TilingSuite:
+    params = [[(4000, 5000), (10000, 10000)], [1, 2, 4, 8]]
+    param_names = ['shape', 'workers']
+
+    def setup(self, shape, workers):
+        rng = np.random.default_rng(0)
+        self.image = np.ones(shape + (3,), dtype=np.float32)
+        self.image[rng.random(shape) < 0.05] = (0.9, 0.1, 0.1)
+        self.mask = extraction.color_mask(self.image, (0.9, 0.1, 0.1))
+
+    def time_color_mask(self, shape, workers):
+        extraction.color_mask(self.image, (0.9, 0.1, 0.1), workers=workers)
+
+    def time_binarize(self, shape, workers):
+        preprocessing.binarize(self.image[:, :, 0], 'adaptive', workers=workers)
+
+    def time_label_runs(self, shape, workers):
+        extraction.label_runs(self.mask, workers=workers)
+
+
+class KernelSuite:
+    params = [['numpy', 'numba']]
+    param_names = ['backend']
+
+    def setup(self, backend):
+        if backend == 'numba' and not kernels.available():
+            raise NotImplementedError('Numba is not installed.')
+        self.backend = kernels.get_backend()
+        kernels.set_backend(backend)
+        self.data = _random_data(10000, (2000, 3000))
+        self.overlay = np.zeros((2000, 3000, 4))
+        self.mask = np.random.default_rng(0).random((2000, 2000)) < 0.45
+        self.image = np.ones((1000, 4000, 3))
+        j = np.arange(10, 3990)
+        self.image[np.rint(500 + 300 * np.sin(j / 200)).astype(int), j] = (0.9, 0.1, 0.1)
+        # compilation outside of the timings
+        self.time_paint_overlay(backend)
+        self.time_label_runs(backend)
+        self.time_trace(backend)
+
+    def teardown(self, backend):
+        kernels.set_backend(self.backend)
+
+    def time_paint_overlay(self, backend):
+        core.paint_overlay(self.overlay, self.data, 10, 10)
+
+    def time_label_runs(self, backend):
+        extraction.label_runs(self.mask, workers=1)
+
+    def time_trace(self, backend):
+        tracing.trace(self.image, [(500, 2000)])
+
+
+class DataTableSuite:
+    params = [[10, 100]]
+    param_names = ['npoints']
+
+    def setup(self, npoints):
+        # the data table is a Tk widget: skipped when no display is available
+        try:
+            from datadigitizer.gui import DataTable, tk
+            self.root = tk.Tk()
+        except Exception as error:
+            raise NotImplementedError('no display available') from error
+        self.root.withdraw()
+        self.data = _random_data(npoints)
+        self.DataTable = DataTable
+
+    def teardown(self, npoints):
+        self.root.destroy()
+
+    def time_set_new_data(self, npoints):
+        table = self.DataTable(self.root)
+        table.set_new_data(self.data)
+        table.destroy()
+
+
+class SettingsSuite:
+    params = [[True, False]]
+    param_names = ['update']
+
+    def setup(self, update):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.defaults = settings.DEFAULT_PROFILE_VALUES['folders']
+        settings.read_cfg(self.tmpdir.name, 'folders', self.defaults)
+
+    def teardown(self, update):
+        self.tmpdir.cleanup()
+
+    def time_read_cfg(self, update):
+        settings.read_cfg(self.tmpdir.name, 'folders', self.defaults, update=update)
+
+
+class SettingsStoreSuite:
+
+    def setup(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = settings.SettingsStore(self.tmpdir.name)
+        self.store.flush()
+
+    def teardown(self):
+        self.tmpdir.cleanup()
+
+    def time_get(self):
+        self.store.get('folders', 'LAST', 'image folder')
+
+    def time_set_and_save(self):
+        self.store.set('folders', 'LAST', 'image name', 'a.png')
+        self.store.save('folders')
+        self.store.set('folders', 'LAST', 'image name', 'b.png')
+        self.store.save('folders')
@@ -0,0 +1,87 @@
+r"""
+Benchmarks of the start up of the application.
+
+The cumulative import times are measured with ``python -X importtime`` in fresh
+interpreters so that they are not hidden by the modules already imported. The
+benchmarks fail if a module loads one of the modules deferred after the start up.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import subprocess
+import sys
+from typing import List
+
+from datadigitizer.tests import STARTUP_BANNED_MODULES
+
+
+def importtime(module: str, repeat: int = 3) -> int:
+    r"""
+    Measure the cumulative import time of a module.
+
+    Parameters
+    ----------
+    module: str
+        Name of the module.
+    repeat: int, optional
+        Number of fresh interpreters. The shortest time is returned.
+
+    Returns
+    -------
+    elapsed: int
+        Cumulative import time in microseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 universal_newlines=True, check=True)
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                timings.append(int(fields[1]))
+    return min(timings)
+
+
+def banned_imports(module: str) -> List[str]:
+    r"""
+    Return the modules of STARTUP_BANNED_MODULES loaded by a module in a fresh interpreter.
+
+    Parameters
+    ----------
+    module: str
+        Name of the module.
+    """
+    code = f'import sys, {module}; print(" ".join(m for m in {STARTUP_BANNED_MODULES!r} if m in sys.modules))'
+    process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    return process.stdout.split()
+
+
+class StartupSuite:
+    params = [['datadigitizer', 'datadigitizer.core', 'datadigitizer.gui']]
+    param_names = ['module']
+
+    def setup(self, module):
+        banned = banned_imports(module)
+        if banned:
+            raise RuntimeError(f'{module} imports {", ".join(banned)} at start up.')
+
+    def track_importtime(self, module):
+        return importtime(module)
+
+    track_importtime.unit = 'us'
@@ -0,0 +1,341 @@
+r"""
+End-to-end accuracy and throughput harness.
+
+A synthetic corpus is digitized headlessly: the limits are placed from the ground truth,
+the points are extracted, the values are computed with the calibration transforms and
+saved as the GUI does. The throughput, the latency per image, the peak memory and the
+error versus the ground truth are reported and compared with a baseline::
+
+    python -m benchmarks.harness --count 50
+    python -m benchmarks.harness --count 50 --compare benchmarks/results/harness-1.1.2.json
+
+The exit code is 1 when the throughput or the accuracy regressed beyond the thresholds.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from matplotlib import colors, image
+
+from datadigitizer import core, corpus, export, extraction, tracing, version
+
+from .run import RESULTS_FOLDER
+
+
+def _extract_color(image_array: np.ndarray, truth: Dict, bounds) -> List:
+    return [extraction.extract_color(image_array, colors.to_rgb(series['color']), bounds=bounds)
+            for series in truth['series']]
+
+
+def _extract_markers(image_array: np.ndarray, truth: Dict, bounds) -> List:
+    return [extraction.detect_markers(extraction.color_mask(image_array, colors.to_rgb(series['color']),
+                                                            bounds=bounds))
+            for series in truth['series']]
+
+
+def _trace(image_array: np.ndarray, truth: Dict, bounds) -> List:
+    points = []
+    for series in truth['series']:
+        # the user clicks on the curve: the middle of its longest segment
+        k = np.argmax(np.hypot(np.diff(series['i']), np.diff(series['j']))) if series['i'].size > 1 else 0
+        seed = (series['i'][k:k+2].mean(), series['j'][k:k+2].mean())
+        points.append(tracing.trace(image_array, [seed], colors.to_rgb(series['color']), bounds=bounds))
+    return points
+
+
+EXTRACTORS = {'color': _extract_color, 'markers': _extract_markers, 'trace': _trace}
+
+
+def segment_distance(points: np.ndarray, polyline: np.ndarray) -> np.ndarray:
+    r"""
+    Compute the distance of points to a polyline.
+
+    Parameters
+    ----------
+    points: array-like, shape (n, 2)
+        Coordinates of the points.
+    polyline: array-like, shape (m, 2)
+        Vertexes of the polyline.
+
+    Returns
+    -------
+    distance: array-like, shape (n,)
+        Distance of each point to the closest segment.
+    """
+    if polyline.shape[0] == 1:
+        return np.hypot(*(points - polyline[0]).T)
+    a = polyline[:-1][np.newaxis]
+    ab = np.diff(polyline, axis=0)[np.newaxis]
+    ap = points[:, np.newaxis] - a
+    norm2 = np.maximum(np.sum(ab ** 2, axis=2), 1e-12)
+    t = np.clip(np.sum(ap * ab, axis=2) / norm2, 0, 1)
+    d = ap - t[:, :, np.newaxis] * ab
+    return np.sqrt(np.min(np.sum(d ** 2, axis=2), axis=1))
+
+
+def digitize_image(truth: Dict, extractor: Callable, fpath: pathlib.Path) -> np.ndarray:
+    r"""
+    Digitize an image of the corpus as the GUI does.
+
+    Parameters
+    ----------
+    truth: dict
+        Sidecar as returned by datadigitizer.corpus.load.
+    extractor: callable
+        Function returning the indexes i, j of the points of each series.
+    fpath: Path
+        Path of the exported data.
+
+    Returns
+    -------
+    data: array-like
+        Limits and extracted points with their values.
+    """
+    image_array = image.imread(str(truth['image']))
+    row = image_array.shape[0]
+    limits_i, limits_j = np.array([truth['limits'][which] for which in core.LIMITS]).T
+    data = core.add_points(core.new_data(), limits_i, limits_j, row)
+    data['type'] = core.LIMITS
+    bounds = extraction.crop_bounds(limits_i, limits_j, image_array.shape)
+
+    for series, (i, j) in enumerate(extractor(image_array, truth, bounds)):
+        data = core.add_points(data, i, j, row, series=series)
+
+    axes = truth['axes']
+    core.measure(data, axes['xvalues'], axes['yvalues'], axes['xlog'], axes['ylog'])
+    names = [f'series{k}' for k in range(len(truth['series']))]
+    export.save_data(fpath, data, names)
+    return data
+
+
+def evaluate(truth: Dict, data: np.ndarray) -> Dict:
+    r"""
+    Compare the digitized data with the ground truth.
+
+    Parameters
+    ----------
+    truth: dict
+        Sidecar as returned by datadigitizer.corpus.load.
+    data: array-like
+        Data as returned by digitize_image.
+
+    Returns
+    -------
+    result: dict
+        Number of points, distances in pixels of the points to the true curves,
+        recall of the true points within 2 pixels and maximal error of the calibration
+        relative to the span of the axes. The calibration error is None for the rotated
+        plots, which no calibration represents: they are compared in pixels only.
+    """
+    axes = truth['axes']
+    measured = core.Calibration.from_data(data, axes['xvalues'], axes['yvalues'], axes['xlog'], axes['ylog'])
+    row = truth['shape'][0]
+    distances, recall, calibration_error = [], [], 0.0
+    points = data[data['type'] == 'data']
+    for k, series in enumerate(truth['series']):
+        curve = np.column_stack((series['i'], series['j']))
+        found = points[points['series'] == k]
+        found = np.column_stack((found['i'], found['j']))
+        if found.size:
+            distances.append(segment_distance(found, curve))
+            nearest = np.min(np.hypot(*(curve[:, np.newaxis] - found[np.newaxis]).transpose(2, 0, 1)), axis=1)
+            recall.append(nearest <= 2.0)
+        else:
+            recall.append(np.zeros(curve.shape[0], dtype=bool))
+
+        if truth['calibration'] is None:
+            continue
+        check = core.add_points(core.new_data(), series['i'], series['j'], row)
+        measured.apply(check)
+        for key, log, span in (('x', measured.xlog, measured.xvalues),
+                               ('y', measured.ylog, measured.yvalues)):
+            values, expected = (np.log10(check[key]), np.log10(series[key])) if log \
+                else (check[key], series[key])
+            span = np.ptp(np.log10(span)) if log else np.ptp(span)
+            calibration_error = max(calibration_error, float(np.max(np.abs(values - expected)) / span))
+
+    distances = np.concatenate(distances) if distances else np.zeros(0)
+    return {'points': int(points.size),
+            'distances': distances,
+            'recall': float(np.mean(np.concatenate(recall))),
+            'calibration_error': None if truth['calibration'] is None else calibration_error}
+
+
+def run(sidecars: Sequence[pathlib.Path], extractor: str = 'color') -> Dict:
+    r"""
+    Run the harness on a corpus.
+
+    Parameters
+    ----------
+    sidecars: list of Path
+        Sidecars of the corpus.
+    extractor: str, optional
+        Name of the extractor in EXTRACTORS.
+
+    Returns
+    -------
+    metrics: dict
+        Throughput in points per second, latency percentiles in milliseconds,
+        peak memory in MiB and errors versus the ground truth.
+    """
+    func = EXTRACTORS[extractor]
+    latencies, distances, recalls, calibration_errors = [], [], [], []
+    npoints = 0
+    peak = 0
+    with tempfile.TemporaryDirectory() as folder:
+        fpath = pathlib.Path(folder) / 'data.txt'
+        for sidecar in sidecars:
+            truth = corpus.load(sidecar)
+            t0 = time.perf_counter()
+            data = digitize_image(truth, func, fpath)
+            latencies.append(time.perf_counter() - t0)
+            result = evaluate(truth, data)
+            npoints += result['points']
+            distances.append(result['distances'])
+            recalls.append(result['recall'])
+            if result['calibration_error'] is not None:
+                calibration_errors.append(result['calibration_error'])
+
+            # separate pass: tracing the allocations slows down the timed one
+            tracemalloc.start()
+            try:
+                digitize_image(truth, func, fpath)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+    latencies = np.array(latencies) * 1e3
+    distances = np.concatenate(distances)
+    return {'images': len(latencies),
+            'points': npoints,
+            'throughput': npoints / max(latencies.sum() / 1e3, 1e-12),
+            'latency_median': float(np.median(latencies)),
+            'latency_p95': float(np.percentile(latencies, 95)),
+            'latency_max': float(latencies.max()),
+            'peak_memory': peak / 2**20,
+            'error_median': float(np.median(distances)) if distances.size else float('nan'),
+            'error_p95': float(np.percentile(distances, 95)) if distances.size else float('nan'),
+            'recall': float(np.mean(recalls)),
+            'calibration_error': float(np.max(calibration_errors)) if calibration_errors else 0.0}
+
+
+def compare(metrics: Dict, baseline: Dict, threshold: float, tolerance: float) -> List[str]:
+    r"""
+    Compare the metrics with a baseline.
+
+    Parameters
+    ----------
+    metrics: dict
+        Metrics of the current run.
+    baseline: dict
+        Metrics of the reference run.
+    threshold: float
+        Maximal accepted ratio between the reference and the current throughputs.
+    tolerance: float
+        Maximal accepted increase of the errors in pixels and decrease of the recall.
+
+    Returns
+    -------
+    regressions: list of str
+        Description of the regressions.
+    """
+    regressions = []
+    ratio = baseline['throughput'] / max(metrics['throughput'], 1e-12)
+    if ratio > threshold:
+        regressions.append(f'throughput: {ratio:.2f}x slower')
+    for key in ('error_median', 'error_p95'):
+        if metrics[key] > baseline[key] + tolerance:
+            regressions.append(f'{key}: {metrics[key]:.3f} px > {baseline[key]:.3f} px')
+    if metrics['recall'] < baseline['recall'] - tolerance / 10:
+        regressions.append(f'recall: {metrics["recall"]:.3f} < {baseline["recall"]:.3f}')
+    if metrics['calibration_error'] > max(baseline['calibration_error'] * threshold, 1e-9):
+        regressions.append(f'calibration_error: {metrics["calibration_error"]:.2e} > '
+                           f'{baseline["calibration_error"]:.2e}')
+    return regressions
+
+
+def main(argv=None):
+    r"""Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('Copyright')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=50, help='number of plots in the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus')
+    parser.add_argument('--corpus', type=pathlib.Path, default=None,
+                        help='folder of an existing corpus (default: generated in a temporary folder)')
+    parser.add_argument('--extractor', default='color', choices=sorted(EXTRACTORS))
+    parser.add_argument('--output', type=pathlib.Path, default=None,
+                        help='JSON file for the metrics (default: results/harness-<version>.json)')
+    parser.add_argument('--compare', type=pathlib.Path, default=None,
+                        help='JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='maximal accepted slow down ratio when comparing')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='maximal accepted increase of the errors in pixels when comparing')
+    args = parser.parse_args(argv)
+
+    if args.corpus is None:
+        with tempfile.TemporaryDirectory() as folder:
+            sidecars = corpus.generate(args.count, folder, seed=args.seed)
+            metrics = run(sidecars, args.extractor)
+    else:
+        metrics = run(sorted(args.corpus.glob('*.json'))[:args.count], args.extractor)
+
+    for key, value in metrics.items():
+        print(f'{key}: {value:.6g}' if isinstance(value, float) else f'{key}: {value}')
+
+    output = args.output
+    if output is None:
+        output = RESULTS_FOLDER / f'harness-{version.__version__}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    document = {'version': version.__version__,
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'machine': platform.node(),
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'extractor': args.extractor,
+                'count': metrics['images'],
+                'seed': args.seed,
+                'metrics': metrics}
+    with open(output, 'w') as fobj:
+        json.dump(document, fobj, indent=1)
+    print(f'Results saved in {output}')
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as fobj:
+            baseline = json.load(fobj)['metrics']
+        regressions = compare(metrics, baseline, args.threshold, args.tolerance)
+        for msg in regressions:
+            print(f'REGRESSION {msg}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
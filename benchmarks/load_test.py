@@ -0,0 +1,162 @@
+r"""
+Load test of the HTTP job service.
+
+The plots of a synthetic corpus are posted concurrently with their calibration to a
+server started on a free local port, or to a running one with --url. The throughput,
+the latency percentiles of the accepted requests and the number of requests rejected
+by the backpressure (status 503) are reported::
+
+    python -m benchmarks.load_test --requests 200 --concurrency 16 --workers 2 --queue 4
+    python -m benchmarks.load_test --url http://127.0.0.1:8000
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import argparse
+import concurrent.futures
+import json
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from datadigitizer import corpus
+
+
+def _request(sidecar: pathlib.Path, url: str, method: str) -> Tuple[bytes, str]:
+    r"""Build the body and the URL of the request digitizing a plot of the corpus."""
+    with open(sidecar, 'r') as fobj:
+        truth = json.load(fobj)
+    axes = truth['axes']
+    values = dict(zip(('xmin', 'xmax', 'ymin', 'ymax'), axes['xvalues'] + axes['yvalues']))
+    query = urllib.parse.urlencode({'method': method, 'limits': json.dumps(truth['limits']),
+                                    'values': json.dumps(values),
+                                    'scales': ','.join('log' if axes[key] else 'linear'
+                                                       for key in ('xlog', 'ylog'))})
+    body = (sidecar.parent / truth['image']).read_bytes()
+    return body, f'{url}/digitize?{query}'
+
+
+def _post(body: bytes, url: str) -> Tuple[int, float, int]:
+    r"""Post an image and return the status, the latency in seconds and the number of points."""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'image/png'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            count = json.load(response)['count']
+            return response.status, time.perf_counter() - start, count
+    except urllib.error.HTTPError as error:
+        error.read()
+        return error.code, time.perf_counter() - start, 0
+
+
+def run(sidecars: Sequence[pathlib.Path], url: str, requests: int = 100, concurrency: int = 8,
+        method: str = 'colors') -> Dict:
+    r"""
+    Post the plots of a corpus concurrently.
+
+    Parameters
+    ----------
+    sidecars: sequence of Path
+        JSON sidecars of the corpus, posted in turn.
+    url: str
+        Base URL of the server.
+    requests: int, optional
+        Number of requests.
+    concurrency: int, optional
+        Number of concurrent clients.
+    method: str, optional
+        Extraction method.
+
+    Returns
+    -------
+    metrics: dict
+        Requests per second, latency percentiles in milliseconds of the accepted
+        requests and counts per status.
+    """
+    jobs = [_request(sidecar, url, method) for sidecar in sidecars]
+    results: List[Tuple[int, float, int]] = []
+    lock = threading.Lock()
+
+    def client(k: int):
+        result = _post(*jobs[k % len(jobs)])
+        with lock:
+            results.append(result)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    status = np.array([result[0] for result in results])
+    latencies = np.array([result[1] for result in results if result[0] == 200]) * 1e3
+    metrics = {'requests': requests, 'concurrency': concurrency,
+               'requests_per_s': requests / elapsed,
+               'accepted_per_s': latencies.size / elapsed,
+               'points': int(sum(result[2] for result in results))}
+    for q in (50, 95, 99):
+        metrics[f'latency_p{q}'] = float(np.percentile(latencies, q)) if latencies.size else float('nan')
+    for code in np.unique(status):
+        metrics[f'status_{code}'] = int(np.count_nonzero(status == code))
+    return metrics
+
+
+def main(argv=None):
+    r"""Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('Copyright')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None,
+                        help='base URL of a running server (default: server started on a free local port)')
+    parser.add_argument('--count', type=int, default=10, help='number of plots in the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus')
+    parser.add_argument('--requests', type=int, default=100, help='number of requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--method', default='colors', choices=('colors', 'markers'))
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes of the started server (default: number of processors)')
+    parser.add_argument('--queue', type=int, default=16, help='waiting jobs of the started server')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        sidecars = corpus.generate(args.count, folder, seed=args.seed)
+        if args.url is not None:
+            metrics = run(sidecars, args.url.rstrip('/'), args.requests, args.concurrency, args.method)
+        else:
+            from datadigitizer.server import Server
+            server = Server(port=0, workers=args.workers, queue_size=args.queue)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                metrics = run(sidecars, server.url, args.requests, args.concurrency, args.method)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    for key, value in metrics.items():
+        print(f'{key}: {value:.6g}' if isinstance(value, float) else f'{key}: {value}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+r"""
+Minimal runner for the asv-style benchmarks.
+
+Each benchmark is timed (time_* methods) or tracked (track_* methods returning a value)
+for all the combinations of its parameters. The results are stored as JSON so that
+regressions between releases can be compared::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --bench Overlay --compare benchmarks/results/1.1.2.json
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import argparse
+import datetime
+import importlib
+import inspect
+import itertools
+import json
+import pathlib
+import platform
+import re
+import statistics
+import sys
+import timeit
+from typing import Dict, List
+
+import numpy as np
+
+from datadigitizer import version
+
+FOLDER = pathlib.Path(__file__).parent
+RESULTS_FOLDER = FOLDER / 'results'
+
+
+def _modules():
+    for fpath in sorted(FOLDER.glob('bench_*.py')):
+        yield importlib.import_module(f'{__package__}.{fpath.stem}')
+
+
+def _param_sets(cls):
+    params = getattr(cls, 'params', [])
+    names = getattr(cls, 'param_names', [])
+    if len(params) == 0:
+        return [()], names
+    return list(itertools.product(*params)), names
+
+
+def _time(func, args, repeat: int, min_time: float):
+    timer = timeit.Timer(lambda: func(*args))
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    timings = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'min': min(timings), 'median': statistics.median(timings),
+            'number': number, 'repeat': repeat}
+
+
+def run(pattern: str = '', repeat: int = 5, min_time: float = 0.05) -> Dict:
+    r"""
+    Run the benchmarks.
+
+    Parameters
+    ----------
+    pattern: str, optional
+        Regular expression filtering the benchmark names.
+    repeat: int, optional
+        Number of repetitions for each timing.
+    min_time: float, optional
+        Minimal duration in seconds of each repetition.
+
+    Returns
+    -------
+    results: dict
+        Timings in seconds per call indexed by benchmark name and parameters.
+    """
+    results = {}
+    for module in _modules():
+        for cls_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            methods = [name for name in dir(cls) if name.startswith(('time_', 'track_'))]
+            param_sets, param_names = _param_sets(cls)
+            for args in param_sets:
+                label = ', '.join(f'{k}={v}' for k, v in zip(param_names, args))
+                for method in methods:
+                    name = f'{module.__name__.split(".")[-1]}.{cls_name}.{method}'
+                    if not re.search(pattern, name):
+                        continue
+                    bench = cls()
+                    try:
+                        if hasattr(bench, 'setup'):
+                            bench.setup(*args)
+                    except NotImplementedError as error:
+                        print(f'{name}({label}): skipped ({error})')
+                        continue
+                    try:
+                        func = getattr(bench, method)
+                        if method.startswith('time_'):
+                            timing = _time(func, args, repeat, min_time)
+                            msg = f'{timing["median"]*1e6:.1f} us'
+                        else:
+                            unit = getattr(func, 'unit', '')
+                            timing = {'value': func(*args), 'unit': unit}
+                            msg = f'{timing["value"]} {unit}'
+                    finally:
+                        if hasattr(bench, 'teardown'):
+                            bench.teardown(*args)
+                    results.setdefault(name, {})[label] = timing
+                    print(f'{name}({label}): {msg}')
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    r"""
+    Compare the results with a baseline.
+
+    Parameters
+    ----------
+    results: dict
+        Results of the current run.
+    baseline: dict
+        Results of the reference run.
+    threshold: float
+        Maximal accepted ratio between the current and the reference timings.
+
+    Returns
+    -------
+    regressions: list of str
+        Description of the benchmarks slower than the threshold.
+    """
+    regressions = []
+    for name, timings in results.items():
+        for label, timing in timings.items():
+            try:
+                reference = baseline[name][label]
+            except KeyError:
+                continue
+            key = 'min' if 'min' in timing else 'value'
+            ratio = timing[key] / reference[key]
+            if ratio > threshold:
+                regressions.append(f'{name}({label}): {ratio:.2f}x slower')
+    return regressions
+
+
+def main(argv=None):
+    r"""Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('Copyright')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bench', default='', help='regular expression filtering the benchmarks')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetitions')
+    parser.add_argument('--output', type=pathlib.Path, default=None,
+                        help='JSON file for the results (default: results/<version>.json)')
+    parser.add_argument('--compare', type=pathlib.Path, default=None,
+                        help='JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='maximal accepted slow down ratio when comparing')
+    args = parser.parse_args(argv)
+
+    results = run(args.bench, repeat=args.repeat)
+
+    output = args.output
+    if output is None:
+        output = RESULTS_FOLDER / f'{version.__version__}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    document = {'version': version.__version__,
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'machine': platform.node(),
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'results': results}
+    with open(output, 'w') as fobj:
+        json.dump(document, fobj, indent=1)
+    print(f'Results saved in {output}')
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as fobj:
+            baseline = json.load(fobj)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for msg in regressions:
+            print(f'REGRESSION {msg}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
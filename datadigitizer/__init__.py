@@ -1,6 +1,9 @@
 r"""
 Initialization.
 
+The digitize function of the api module is imported at its first use so that importing
+the package stays fast.
+
 Copyright (C) 2020-2021 Milan Skocic.
 
 This program is free software: you can redistribute it and/or modify
@@ -19,3 +22,10 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 Author: Milan Skocic <milan.skocic@gmail.com>
 """
 from .version import *
+
+
+def __getattr__(name: str):
+    if name == 'digitize':
+        from .api import digitize
+        return digitize
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -18,8 +18,248 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 Author: Milan Skocic <milan.skocic@gmail.com>
 """
-from datadigitizer.gui import App, tk
+import argparse
+from datadigitizer import version
 
-root = tk.Tk()
-app = App(master=root)
-app.run()
+# options of the batch, watch and serve commands read from the USER section of batch.ini when not given
+SETTING_OPTIONS = {'batch': {'output': 'output folder', 'method': 'method', 'format': 'format',
+                             'cache_size': 'cache size', 'workers': 'workers'},
+                   'watch': {'method': 'method', 'format': 'format', 'workers': 'workers', 'interval': 'interval',
+                             'settle': 'settle', 'queue': 'watch queue'},
+                   'serve': {'host': 'host', 'port': 'port', 'queue': 'queue', 'max_size': 'max size',
+                             'max_connections': 'max connections'}}
+SETTING_EPILOG = 'The defaults are changed in the USER section of batch.ini in the configuration folder.'
+
+
+def main(argv=None):
+    r"""
+    Parse the command line and start the application.
+
+    Parameters
+    ----------
+    argv: list of str, optional
+        Command line arguments. The arguments of sys.argv are used by default.
+    """
+    parser = argparse.ArgumentParser(prog='python -m ' + version.__package_name__,
+                                     description='Digitize data from images.')
+    parser.add_argument('--profile', action='store_true',
+                        help='record the latency of the interactive actions '
+                             '(also enabled by DATADIGITIZER_PROFILE=1)')
+    parser.add_argument('--profile-output', default=None, metavar='FILE',
+                        help='JSON file where the recorded latencies are dumped at exit')
+    subparsers = parser.add_subparsers(dest='command')
+    corpus_parser = subparsers.add_parser('corpus', help='generate synthetic plots with their ground truth')
+    corpus_parser.add_argument('count', type=int, help='number of plots')
+    corpus_parser.add_argument('--folder', default=None,
+                               help='output folder (default: new temporary folder)')
+    corpus_parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    corpus_parser.add_argument('--workers', type=int, default=None,
+                               help='number of worker processes (default: number of processors)')
+    batch_parser = subparsers.add_parser('batch', help='digitize all the pages of documents',
+                                         epilog=SETTING_EPILOG)
+    batch_parser.add_argument('inputs', nargs='+', help='images, multi-page TIFF, PDF or SVG files')
+    batch_parser.add_argument('--output', default=None,
+                              help='output folder (default: current folder)')
+    batch_parser.add_argument('--method', default=None, choices=('auto', 'vector', 'colors', 'markers'),
+                              help='extraction method (default: auto)')
+    batch_parser.add_argument('--calibration', default=None, metavar='FILE',
+                              help='JSON file with the calibration applied to all the pages')
+    batch_parser.add_argument('--template', default=None, metavar='NAME',
+                              help='calibration template, name or file, aligned onto each page')
+    batch_parser.add_argument('--format', default=None, choices=('long', 'blocks', 'grid'),
+                              help='format of the data files (default: long)')
+    batch_parser.add_argument('--grid', default=None, metavar='GRID',
+                              help='x values of the grid format: start:stop:num or x1,x2,...')
+    batch_parser.add_argument('--grid-spacing', default='linear', choices=('linear', 'log'),
+                              help='spacing of the start:stop:num grid (default: linear)')
+    batch_parser.add_argument('--no-cache', action='store_true',
+                              help='process all the pages even if their results are cached')
+    batch_parser.add_argument('--cache-size', type=float, default=None, metavar='MB',
+                              help='maximal size of the result cache (default: 512 MB)')
+    batch_parser.add_argument('--decimate', default='none', choices=('none', 'uniform', 'rdp', 'max'),
+                              help='decimation of the saved points (default: none)')
+    batch_parser.add_argument('--decimate-value', type=float, default=None, metavar='VALUE',
+                              help='x interval or RDP tolerance in data units, or maximal number of points')
+    batch_parser.add_argument('--workers', type=int, default=None,
+                              help='worker processes sharing each page (default: 1)')
+    batch_parser.add_argument('--resume', action='store_true',
+                              help='skip the pages recorded as done or failed by a previous run')
+    batch_parser.add_argument('--retry-failed', action='store_true',
+                              help='process only the pages recorded as failed by a previous run')
+    serve_parser = subparsers.add_parser('serve', help='digitize the images posted over HTTP',
+                                         epilog=SETTING_EPILOG)
+    serve_parser.add_argument('--host', default=None, help='address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=None,
+                              help='port to listen on (default: 8000)')
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help='number of worker processes (default: number of processors)')
+    serve_parser.add_argument('--queue', type=int, default=None,
+                              help='jobs waiting for a worker before rejecting the requests (default: 16)')
+    serve_parser.add_argument('--max-size', type=float, default=None, metavar='MB',
+                              help='maximal size of the posted images (default: 64 MB)')
+    serve_parser.add_argument('--max-connections', type=int, default=None,
+                              help='connections handled at once, the other ones get 503 (default: 64)')
+    serve_parser.add_argument('--verbose', action='store_true', help='log each request')
+    watch_parser = subparsers.add_parser('watch', help='digitize the files dropped into a folder',
+                                         epilog=SETTING_EPILOG)
+    watch_parser.add_argument('folder', help='watched folder')
+    watch_parser.add_argument('--output', default=None,
+                              help='output folder (default: digitized subfolder of the watched folder)')
+    watch_parser.add_argument('--method', default=None, choices=('auto', 'vector', 'colors', 'markers'),
+                              help='extraction method (default: auto)')
+    watch_parser.add_argument('--template', default=None, metavar='NAME',
+                              help='calibration template, name or file, aligned onto each page')
+    watch_parser.add_argument('--calibration', default=None, metavar='FILE',
+                              help='JSON file with the calibration applied to all the pages')
+    watch_parser.add_argument('--format', default=None, choices=('long', 'blocks'),
+                              help='format of the data files (default: long)')
+    watch_parser.add_argument('--workers', type=int, default=None,
+                              help='worker processes sharing each page (default: 1)')
+    watch_parser.add_argument('--interval', type=float, default=None, metavar='S',
+                              help='maximal time between two scans of the folder (default: 2 s)')
+    watch_parser.add_argument('--settle', type=float, default=None, metavar='S',
+                              help='time without change before reading a file (default: 2 s)')
+    watch_parser.add_argument('--queue', type=int, default=None,
+                              help='ready files waiting to be digitized (default: 64)')
+    args = parser.parse_args(argv)
+
+    if args.command in SETTING_OPTIONS:
+        # the configuration is only read by the commands using it, not by the interface
+        from datadigitizer.settings import get_store
+        settings = get_store()
+        for dest, option in SETTING_OPTIONS[args.command].items():
+            if getattr(args, dest) is None:
+                setattr(args, dest, settings.get('batch', 'USER', option))
+        if args.command == 'watch' and args.format == 'grid':
+            # the grid format requires a grid only given to the batch command
+            args.format = 'long'
+
+    if args.command == 'corpus':
+        from datadigitizer import corpus
+        sidecars = corpus.generate(args.count, args.folder, seed=args.seed, workers=args.workers)
+        if sidecars:
+            print(f'{len(sidecars)} plots generated in {sidecars[0].parent}')
+        return
+
+    if args.command == 'serve':
+        from datadigitizer.server import Server
+        server = Server(args.host, args.port, args.workers, args.queue, int(args.max_size * 2**20),
+                        args.max_connections, args.verbose)
+        print(f'Serving on {server.url} with {server.service.workers} workers, press Ctrl-C to stop.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    if args.command == 'watch':
+        import json
+        import pathlib
+        from datadigitizer.batch import load
+        from datadigitizer.core import Calibration
+        from datadigitizer.watch import Watcher
+        calibration = None
+        if args.calibration is not None:
+            with open(args.calibration, 'r') as fobj:
+                calibration = Calibration.from_dict(json.load(fobj))
+        output = pathlib.Path(args.folder) / 'digitized' if args.output is None else args.output
+
+        def report(spath):
+            session = load(spath)
+            if 'error' in session:
+                print(f'{session["source"]} page {session["page"] + 1}: {session["error"]}', flush=True)
+            else:
+                print(f'{session["source"]} page {session["page"] + 1}: {spath}', flush=True)
+
+        with Watcher(args.folder, output, args.method, args.template, calibration, args.format, args.workers,
+                     args.interval, args.settle, args.queue, callback=report) as watcher:
+            print(f'Watching {watcher.folder}, results in {watcher.output}, press Ctrl-C to stop.', flush=True)
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                pass
+            print(f'{watcher.processed} files digitized.')
+        return
+
+    if args.command == 'batch':
+        if args.decimate != 'none' and args.decimate_value is None:
+            parser.error(f'--decimate {args.decimate} requires --decimate-value')
+        if (args.format == 'grid') != (args.grid is not None):
+            parser.error('--format grid and --grid go together')
+        import json
+        import pathlib
+        from datadigitizer import batch
+        from datadigitizer.core import Calibration
+        grid = None
+        if args.grid is not None:
+            from datadigitizer.export import parse_grid
+            try:
+                grid = parse_grid(args.grid, args.grid_spacing)
+            except ValueError as error:
+                parser.error(str(error))
+        calibration = None
+        if args.calibration is not None:
+            with open(args.calibration, 'r') as fobj:
+                calibration = Calibration.from_dict(json.load(fobj))
+        total, failed, unread = 0, 0, 0
+        template = None
+        if args.template is not None:
+            from datadigitizer.templates import Template
+            template = Template.load(args.template)
+        cache = None
+        if not args.no_cache:
+            from datadigitizer.cache import ResultCache
+            cache = ResultCache(max_bytes=int(args.cache_size * 2**20))
+        output = pathlib.Path(args.output)
+        output.mkdir(parents=True, exist_ok=True)
+        with batch.Journal(output / batch.JOURNAL_NAME, append=args.resume or args.retry_failed) as journal:
+            previous = dict(journal.entries)
+            for spath in batch.run(args.inputs, output, args.method, calibration, args.format,
+                                   template=template, cache=cache, resume=args.resume,
+                                   retry_failed=args.retry_failed, workers=args.workers,
+                                   decimation=args.decimate, decimation_value=args.decimate_value,
+                                   grid=grid, journal=journal):
+                session = batch.load(spath)
+                total += 1
+                if 'error' in session:
+                    failed += 1
+                    print(f'{session["source"]} page {session["page"] + 1}: {session["error"]}')
+            for entry in journal.failed():
+                # the files which could not be opened and the pages which could not be written,
+                # recorded by this run only: the journal also holds the earlier runs and other files
+                if previous.get((entry['source'], entry['page'])) is entry:
+                    continue
+                if entry['page'] is None:
+                    unread += 1
+                    print(f'{entry["source"]}: {entry["error"]}')
+                elif 'session' not in entry:
+                    total += 1
+                    failed += 1
+                    print(f'{entry["source"]} page {entry["page"] + 1}: {entry["error"]}')
+        print(f'{total - failed} pages digitized in {args.output}, {failed} failed.')
+        if unread:
+            print(f'{unread} files could not be opened.')
+        if cache is not None:
+            print(f'{cache.hits} pages read from the cache.')
+        return
+
+    # the window is shown before importing matplotlib and building the interface
+    import tkinter as tk
+    root = tk.Tk()
+    root.title('Data Digitizer')
+    root.update()
+
+    from datadigitizer.gui import App
+    from datadigitizer.profiling import Profiler
+
+    profiler = Profiler.from_environ(output=args.profile_output)
+    profiler.enabled = profiler.enabled or args.profile
+
+    app = App(master=root, profiler=profiler)
+    app.run()
+
+
+if __name__ == '__main__':
+    main()
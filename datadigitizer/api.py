@@ -0,0 +1,119 @@
+r"""
+API module.
+
+Digitization from Python scripts and notebooks without the graphical interface: the
+images are given as files or arrays and the points are returned as the structured
+array used by the application. Neither tkinter nor matplotlib are imported.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import pathlib
+from typing import Dict, Optional, Tuple, Union
+import numpy as np
+
+from .core import Calibration, new_data, add_points, LIMITS
+from .export import long_format
+from .batch import digitize_page
+from .pages import Document
+from .templates import Template
+
+SCALES = ('linear', 'log')
+
+
+def _calibration(limits: Dict[str, Tuple[float, float]], values: Dict[str, float],
+                 scales: Tuple[str, str], row: int) -> Tuple[np.ndarray, Calibration]:
+    r"""Create the limit points and the calibration from the limits and their values."""
+    missing = [name for name in LIMITS if name not in limits or values is None or name not in values]
+    if missing:
+        raise ValueError(f'the limits and their values require {", ".join(missing)}.')
+    if len(scales) != 2 or any(which not in SCALES for which in scales):
+        raise ValueError(f'scales must be a pair of {SCALES}.')
+    data = new_data()
+    for name in LIMITS:
+        data = add_points(data, *limits[name], row=row, which=name)
+    calibration = Calibration.from_data(data, (values['xmin'], values['xmax']), (values['ymin'], values['ymax']),
+                                        scales[0] == 'log', scales[1] == 'log')
+    return data, calibration
+
+
+def digitize(image: Union[str, pathlib.Path, np.ndarray], limits: Optional[Dict[str, Tuple[float, float]]] = None,
+             values: Optional[Dict[str, float]] = None, scales: Tuple[str, str] = ('linear', 'linear'),
+             method: str = 'auto', page: int = 0, template: Optional[Union[str, pathlib.Path, Template]] = None,
+             tolerance: float = 0.25, scale: float = 2.0, workers: int = 1, frame: bool = False):
+    r"""
+    Digitize the series of an image.
+
+    The x and y values are computed when the axes are calibrated by the limits, by a
+    template or by the ticks of a vector page. Otherwise, only the pixel positions
+    are filled in.
+
+    Parameters
+    ----------
+    image: str, Path or array-like
+        Path to an image, TIFF, PDF or SVG file, or image as returned by imread.
+    limits: dict, optional
+        Matrix indexes (i, j) of the xmin, xmax, ymin and ymax points, as the limits
+        of a template.
+    values: dict, optional
+        Values of the xmin, xmax, ymin and ymax points. Required with the limits.
+    scales: tuple of str, optional
+        linear or log for the x and y axes.
+    method: str, optional
+        vector, colors, markers or auto, see :func:`datadigitizer.batch.digitize_page`.
+    page: int, optional
+        Index of the page of a multi-page file.
+    template: str, Path or Template, optional
+        Calibration template, its name or its file, aligned onto the image. It replaces
+        the limits.
+    tolerance: float, optional
+        Maximal euclidean distance in the RGB space of the colors method.
+    scale: float, optional
+        Pixels per point of the rendered vector pages.
+    workers: int, optional
+        Number of worker processes extracting the series colors.
+    frame: bool, optional
+        Return a pandas DataFrame in the long format, with the series names, instead
+        of the structured array. Requires pandas.
+
+    Returns
+    -------
+    data: structured array, shape (n,) or DataFrame
+        Limits followed by the data points, with the fields of the application:
+        type, i, j, Xpix, Ypix, x, y, selected and series.
+    """
+    figure = None
+    if isinstance(image, (str, pathlib.Path)):
+        with Document(image, scale) as document:
+            image, figure = document.page(page)
+    image = np.asarray(image)
+    row = image.shape[0]
+    points, calibration = new_data(), None
+    if template is not None:
+        if not isinstance(template, Template):
+            template = Template.load(template)
+        points, calibration, _ = template.apply(image)
+    elif limits is not None:
+        points, calibration = _calibration(limits, values, scales, row)
+    data, series_names, used = digitize_page(image, figure, method, calibration, scale, tolerance, workers)
+    if used is not None:
+        used.apply(points)
+    data = np.concatenate((points, data))
+    if frame:
+        import pandas
+        return pandas.DataFrame(long_format(data, series_names))
+    return data
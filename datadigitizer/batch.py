@@ -0,0 +1,432 @@
+r"""
+Batch module.
+
+Unattended digitization of documents page by page. Each page is read, digitized and
+written before the next one is decoded so that the memory used does not depend on
+the number of pages. Each page gives a data file and a JSON session file recording
+how the data was obtained.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+import json
+import contextlib
+import pathlib
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+from .core import Calibration, new_data, add_points
+from .export import save_data, decimate, DECIMATION_METHODS
+from .extraction import extract_color, detect_markers
+from .palette import discover_colors
+from .preprocessing import Pipeline
+from .vector import VectorFigure
+from .pages import Document
+from .templates import Template
+from .cache import ResultCache, file_digest, make_key
+from .shared import SharedImage, map_image
+
+BATCH_METHODS = ('auto', 'vector', 'colors', 'markers')
+JOURNAL_NAME = 'journal.jsonl'
+
+
+def digitize_page(image_array: np.ndarray, figure: Optional[VectorFigure] = None,
+                  method: str = 'auto', calibration: Optional[Calibration] = None,
+                  scale: float = 2.0, tolerance: float = 0.25,
+                  workers: int = 1) -> Tuple[np.ndarray, List[str], Optional[Calibration]]:
+    r"""
+    Digitize the series of a page.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image of the page.
+    figure: VectorFigure, optional
+        Shapes of a vector page.
+    method: str, optional
+        vector for the exact paths of a vector page, colors for extracting each
+        discovered series color, markers for detecting the scatter markers, auto for
+        vector if possible or colors otherwise.
+    calibration: Calibration, optional
+        Calibration of the axes. By default, the one given by the ticks of a vector
+        page or none.
+    scale: float, optional
+        Pixels per point of the rendered vector page.
+    tolerance: float, optional
+        Maximal euclidean distance in the RGB space of the colors method.
+    workers: int, optional
+        Number of worker processes extracting the series colors, see
+        :func:`datadigitizer.shared.map_image`. The image is shared, not copied.
+
+    Returns
+    -------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    series_names: list of str
+        Names of the series.
+    calibration: Calibration or None
+        Calibration applied to the data.
+    """
+    if method not in BATCH_METHODS:
+        raise ValueError(f'{method} is not a valid batch method: {BATCH_METHODS}.')
+    if method == 'auto':
+        method = 'vector' if figure is not None else 'colors'
+    row = image_array.shape[0]
+    data = new_data()
+    nseries = 0
+    if method == 'vector':
+        if figure is None:
+            raise ValueError('the vector method requires a vector page.')
+        data, found = figure.to_data(scale, row)
+        calibration = found if calibration is None else calibration
+        nseries = int(data['series'][data['type'] == 'data'].max()) + 1 if np.any(data['type'] == 'data') else 0
+    elif method == 'colors':
+        colors, _ = discover_colors(image_array)
+        # the threads of each process are not multiplied by the processes
+        args = [(color, tolerance, None, 1 if workers != 1 else None) for color in colors]
+        for i, j in map_image(extract_color, image_array, args, workers):
+            if i.size:
+                data = add_points(data, i, j, row, series=nseries)
+                nseries += 1
+    else:
+        i, j = detect_markers(Pipeline(image_array).get('nogrid'))
+        if i.size:
+            data = add_points(data, i, j, row)
+            nseries = 1
+    if calibration is not None:
+        calibration.apply(data)
+    return data, [f'Series {k + 1}' for k in range(max(nseries, 1))], calibration
+
+
+def _digitize(document: Document, index: int, method: str, calibration: Optional[Calibration],
+              scale: float, template: Optional[Template], workers: int = 1) -> Tuple[np.ndarray, Dict]:
+    r"""Digitize a page and return the points with the limits and the session metadata."""
+    image_array, figure = document.page(index)
+    if method == 'auto':
+        method = 'vector' if figure is not None else 'colors'
+    if workers != 1 and method == 'colors':
+        # the decoded image is replaced by its shared copy handed over to the workers
+        with SharedImage.from_array(image_array) as shared:
+            del image_array
+            return _digitize_image(shared.array, figure, method, calibration, scale, template, workers)
+    return _digitize_image(image_array, figure, method, calibration, scale, template, workers)
+
+
+def _digitize_image(image_array: np.ndarray, figure: Optional[VectorFigure], method: str,
+                    calibration: Optional[Calibration], scale: float, template: Optional[Template],
+                    workers: int) -> Tuple[np.ndarray, Dict]:
+    r"""Digitize a decoded page, see _digitize."""
+    meta = {'shape': list(image_array.shape), 'method': method, 'units': ['a.u.', 'a.u.']}
+    limits = new_data()
+    if template is not None:
+        limits, calibration, meta['registration'] = template.apply(image_array)
+        meta['units'] = [template.xunit, template.yunit]
+    data, meta['series_names'], used = digitize_page(image_array, figure, method, calibration, scale,
+                                                     workers=workers)
+    if used is not None:
+        used.apply(limits)
+    meta['calibration'] = None if used is None else used.to_dict()
+    return np.concatenate((limits, data)), meta
+
+
+class Journal(object):
+    r"""Class for the journal of a batch. See __init__.__doc__."""
+
+    def __init__(self, fpath: Union[str, pathlib.Path], append: bool = True, remember: bool = True):
+        r"""
+        Append-only record of the processed pages of a batch.
+
+        Each line is a JSON entry written and flushed to the disk once the outputs of
+        the page are complete so that an interrupted batch knows what was finished.
+        A truncated last line, from an interruption while writing, is ignored. The
+        files are identified by their absolute path, size and modification time: a
+        modified file is processed again.
+
+        Parameters
+        ----------
+        fpath: str or Path
+            Path to the journal file.
+        append: bool, optional
+            Keep the existing entries. Otherwise, the journal is started again.
+        remember: bool, optional
+            Keep the recorded entries in entries. A long running process, e.g. watching
+            a folder, only writes them so that its memory does not grow.
+        """
+        self.fpath = pathlib.Path(fpath)
+        self.remember = remember
+        self.entries = {}
+        if append and self.fpath.exists():
+            with open(self.fpath, 'r') as fobj:
+                for line in fobj:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    # the last entry of a page wins: a retried page replaces its failure
+                    self.entries[(entry['source'], entry['page'])] = entry
+        self._fobj = open(self.fpath, 'a' if append else 'w')
+
+    def close(self):
+        r"""Close the journal file."""
+        self._fobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def signature(fpath: pathlib.Path) -> List[int]:
+        r"""Return the size and the modification time in nanoseconds of a file."""
+        stat = fpath.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def status(self, source: str, page: Optional[int], signature: List[int]) -> Optional[str]:
+        r"""
+        Return the status of a page of an unmodified file.
+
+        Parameters
+        ----------
+        source: str
+            Absolute path to the file.
+        page: int or None
+            Index of the page, None for the whole file.
+        signature: list of int
+            Signature of the file.
+
+        Returns
+        -------
+        status: str or None
+            done, failed, complete for a whole file, or None if not recorded.
+        """
+        entry = self.entries.get((source, page))
+        if entry is None or entry['signature'] != signature:
+            return None
+        return entry['status']
+
+    def record(self, source: str, page: Optional[int], signature: List[int], status: str, **fields):
+        r"""
+        Append an entry and flush it to the disk.
+
+        Parameters
+        ----------
+        source: str
+            Absolute path to the file.
+        page: int or None
+            Index of the page, None for the whole file.
+        signature: list of int
+            Signature of the file.
+        status: str
+            done, failed or complete.
+        fields: dict
+            JSON serializable fields: session and data files, error...
+        """
+        entry = dict(source=source, page=page, signature=signature, status=status, **fields)
+        self._fobj.write(json.dumps(entry) + '\n')
+        self._fobj.flush()
+        os.fsync(self._fobj.fileno())
+        if self.remember:
+            self.entries[(source, page)] = entry
+
+    def failed(self) -> List[Dict]:
+        r"""Return the entries of the failed pages and files."""
+        return [entry for entry in self.entries.values() if entry['status'] == 'failed']
+
+
+def _write_page(folder: pathlib.Path, stem: str, session: Dict, data: Optional[np.ndarray], fmt: str,
+                grid: Optional[np.ndarray] = None) -> pathlib.Path:
+    r"""Write the data and the session files of a page atomically."""
+    if data is not None:
+        tmp = folder / f'.{stem}.txt.tmp'
+        scales = session['calibration'] or {'xlog': False, 'ylog': False}
+        save_data(tmp, data, session['series_names'], *session['units'], fmt=fmt, grid=grid,
+                  xlog=scales['xlog'], ylog=scales['ylog'])
+        os.replace(tmp, folder / session['data'])
+    spath = folder / f'{stem}.json'
+    tmp = folder / f'.{stem}.json.tmp'
+    with open(tmp, 'w') as fobj:
+        json.dump(session, fobj, indent=2)
+    os.replace(tmp, spath)
+    return spath
+
+
+def run(inputs: Sequence[Union[str, pathlib.Path]], folder: Union[str, pathlib.Path],
+        method: str = 'auto', calibration: Optional[Calibration] = None, fmt: str = 'long',
+        scale: float = 2.0, template: Optional[Template] = None,
+        cache: Optional[ResultCache] = None, resume: bool = False,
+        retry_failed: bool = False, workers: int = 1, decimation: str = 'none',
+        decimation_value: Optional[float] = None, grid: Optional[np.ndarray] = None,
+        journal: Optional[Journal] = None) -> Iterator[pathlib.Path]:
+    r"""
+    Digitize all the pages of documents.
+
+    For each page, <stem>-p0001.txt holds the data and <stem>-p0001.json the session:
+    source, page, image shape, method, units, series names, calibration and data file,
+    or the error when the page could not be digitized. The failing pages do not stop the
+    batch. The files of a page are written atomically and then recorded in the journal
+    of the output folder so that an interrupted batch can be resumed.
+
+    Parameters
+    ----------
+    inputs: sequence of str or Path
+        Paths to the images, TIFF, PDF or SVG files.
+    folder: str or Path
+        Output folder, created if needed.
+    method: str, optional
+        One of BATCH_METHODS, see digitize_page.
+    calibration: Calibration, optional
+        Calibration applied to all the pages.
+    fmt: str, optional
+        Format of the data files, see :func:`datadigitizer.export.save_data`.
+    scale: float, optional
+        Pixels per point of the rendered vector pages.
+    template: Template, optional
+        Calibration template aligned onto each page. It replaces the calibration and
+        its limit points are saved with the data. The height of the correlation peak
+        is recorded in the session.
+    cache: ResultCache, optional
+        Cache of the results. The pages of unchanged files digitized with the same
+        parameters are not decoded again and their sessions are marked as cached.
+    resume: bool, optional
+        Skip the pages of the unchanged files recorded as done or failed in the journal.
+    retry_failed: bool, optional
+        Process only the pages and the files recorded as failed in the journal.
+    workers: int, optional
+        Number of worker processes sharing each page, see digitize_page.
+    decimation: str, optional
+        Decimation of the saved points, see :func:`datadigitizer.export.decimate`.
+        The pages without calibration are decimated in pixels.
+    decimation_value: float, optional
+        Width of the intervals, tolerance or number of points of the decimation.
+    grid: array-like, optional
+        x values onto which the series are resampled by the grid format, see
+        :func:`datadigitizer.export.resample`. The pages without calibration fail.
+    journal: Journal, optional
+        Open journal of the output folder, kept open after the run. By default, the
+        journal is opened, started again unless resuming, and closed.
+
+    Yields
+    ------
+    session: Path
+        Path to the session file of each processed page once written.
+    """
+    if decimation not in DECIMATION_METHODS:
+        raise ValueError(f'{decimation} is not a valid decimation method: {DECIMATION_METHODS}.')
+    if decimation != 'none' and (decimation_value is None or decimation_value <= 0):
+        raise ValueError(f'the {decimation} decimation requires a positive value.')
+    if fmt == 'grid' and grid is None:
+        raise ValueError('the grid format requires a grid.')
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    params = {'method': method, 'scale': scale,
+              'calibration': None if calibration is None else calibration.to_dict(),
+              'template': None if template is None else [template.limits, template.calibration.to_dict(),
+                                                         template.xunit, template.yunit]}
+    if journal is None:
+        context = Journal(folder / JOURNAL_NAME, append=resume or retry_failed)
+    else:
+        context = contextlib.nullcontext(journal)
+    with context as journal:
+        failed = {(entry['source'], entry['page']) for entry in journal.failed()}
+        for fpath in inputs:
+            fpath = pathlib.Path(fpath)
+            source = str(fpath.absolute())
+            # a file which could not be opened has all its pages retried, even if modified since
+            retry_all = (source, None) in failed
+            if retry_failed and not retry_all and not any(entry[0] == source for entry in failed):
+                continue
+            signature = None
+            try:
+                # the file may have been removed or be unreadable
+                signature = journal.signature(fpath)
+                if resume and not retry_failed and journal.status(source, None, signature) is not None:
+                    continue
+                document = Document(fpath, scale)
+                digest = None if cache is None else file_digest(fpath)
+            except Exception as error:
+                journal.record(source, None, signature, 'failed', error=f'{type(error).__name__}: {error}')
+                continue
+            with document:
+                for index in range(len(document)):
+                    if retry_failed and not retry_all and (source, index) not in failed:
+                        continue
+                    if resume and not retry_failed and journal.status(source, index, signature):
+                        continue
+                    stem = f'{fpath.stem}-p{index + 1:04d}'
+                    session, data = {'source': source, 'page': index}, None
+                    try:
+                        key, result = None, None
+                        if cache is not None:
+                            key = make_key(digest, index, params, b'' if template is None else template.thumbnail)
+                            result = cache.get(key)
+                        if result is None:
+                            result = _digitize(document, index, method, calibration, scale, template, workers)
+                            if cache is not None:
+                                cache.put(key, *result)
+                        else:
+                            session['cached'] = True
+                        data, meta = result
+                        session.update(meta)
+                        if decimation != 'none':
+                            # the pixel positions of the uncalibrated pages
+                            scales = meta['calibration'] or {'xlog': False, 'ylog': False}
+                            data = decimate(data, decimation, decimation_value, scales['xlog'], scales['ylog'],
+                                            ('x', 'y') if meta['calibration'] else ('Xpix', 'Ypix'))
+                            session['decimation'] = [decimation, decimation_value]
+                        if fmt == 'grid' and not meta['calibration']:
+                            raise ValueError('the resampling requires a calibration.')
+                        session['data'] = f'{stem}.txt'
+                    except Exception as error:
+                        data = None
+                        session['error'] = f'{type(error).__name__}: {error}'
+                    try:
+                        spath = _write_page(folder, stem, session, data, fmt, grid)
+                    except Exception as error:
+                        # e.g. disk full: the page is failed without session
+                        journal.record(source, index, signature, 'failed', error=f'{type(error).__name__}: {error}')
+                        continue
+                    if 'error' in session:
+                        journal.record(source, index, signature, 'failed', session=spath.name,
+                                       error=session['error'])
+                    else:
+                        journal.record(source, index, signature, 'done', session=spath.name,
+                                       data=session['data'], rows=int(data.size))
+                    yield spath
+            journal.record(source, None, signature, 'complete', pages=len(document))
+
+
+def load(session: Union[str, pathlib.Path]) -> Dict:
+    r"""
+    Load a session file written by run.
+
+    Parameters
+    ----------
+    session: str or Path
+        Path to the session file.
+
+    Returns
+    -------
+    session: dict
+        Session with the calibration as a Calibration object.
+    """
+    with open(session, 'r') as fobj:
+        session = json.load(fobj)
+    if session.get('calibration') is not None:
+        session['calibration'] = Calibration.from_dict(session['calibration'])
+    return session
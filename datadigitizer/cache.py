@@ -0,0 +1,220 @@
+r"""
+Cache module.
+
+Persistent cache of the digitization results keyed by a hash of the image bytes and
+of the parameters, so that the unchanged inputs of a rerun are not processed again.
+Each result is a compressed numpy file of the cache folder. The least recently used
+results are evicted when the size of the folder exceeds its limit.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+import json
+import hashlib
+import pathlib
+import tempfile
+from typing import Dict, Optional, Tuple, Union
+import numpy as np
+
+from . import version
+from .settings import get_store
+
+CACHE_SUFFIX = '.npz'
+
+
+def file_digest(fpath: Union[str, pathlib.Path], chunk_size: int = 1 << 20) -> str:
+    r"""
+    Hash the bytes of a file by chunks so that large documents are not loaded in memory.
+
+    Parameters
+    ----------
+    fpath: str or Path
+        Path to the file.
+    chunk_size: int, optional
+        Number of bytes read at once.
+
+    Returns
+    -------
+    digest: str
+        Hexadecimal SHA-256 digest.
+    """
+    sha = hashlib.sha256()
+    with open(fpath, 'rb') as fobj:
+        for chunk in iter(lambda: fobj.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def make_key(*parts) -> str:
+    r"""
+    Hash the parts of a cache key.
+
+    The version of the package is part of the key so that the results of a previous
+    version are not returned.
+
+    Parameters
+    ----------
+    parts: bytes, str, array-like or JSON serializable
+        Parts of the key: digests, parameters or arrays.
+
+    Returns
+    -------
+    key: str
+        Hexadecimal SHA-256 digest.
+    """
+    sha = hashlib.sha256(version.__version__.encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            sha.update(str((part.dtype, part.shape)).encode())
+            sha.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, bytes):
+            sha.update(part)
+        else:
+            sha.update(json.dumps(part, sort_keys=True).encode())
+        # separator so that the parts cannot be shifted from one to another
+        sha.update(b'\x00')
+    return sha.hexdigest()
+
+
+class ResultCache(object):
+    r"""Class for the persistent cache of the digitization results. See __init__.__doc__."""
+
+    def __init__(self, folder: Optional[Union[str, pathlib.Path]] = None, max_bytes: int = 512 * 2**20):
+        r"""
+        Directory of compressed numpy files named by their keys.
+
+        The files are written atomically so that an interrupted run or several
+        processes sharing the folder never read a partial result. The access time of a
+        result is its modification time, updated at each hit.
+
+        Parameters
+        ----------
+        folder: str or Path, optional
+            Cache folder, created at the first insertion. The one of the batch settings by default.
+        max_bytes: int, optional
+            Maximal size of the folder. The least recently used results are evicted
+            beyond it.
+        """
+        if folder is None:
+            folder = get_store().get('batch', 'USER', 'cache folder')
+        self.folder = pathlib.Path(folder)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.folder / f'{key}{CACHE_SUFFIX}'
+
+    def _entries(self):
+        r"""Return the path, size and access time of the stored results."""
+        entries = []
+        for fpath in self.folder.glob(f'*{CACHE_SUFFIX}'):
+            try:
+                stat = fpath.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((fpath, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self) -> int:
+        r"""Return the number of bytes used by the stored results."""
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, Dict]]:
+        r"""
+        Return a stored result.
+
+        Parameters
+        ----------
+        key: str
+            Key as returned by make_key.
+
+        Returns
+        -------
+        result: tuple or None
+            Point array and metadata dictionary, None if the key is not stored.
+        """
+        fpath = self._path(key)
+        try:
+            with np.load(fpath) as archive:
+                data = archive['data']
+                meta = json.loads(str(archive['meta']))
+            os.utime(fpath)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data, meta
+
+    def put(self, key: str, data: np.ndarray, meta: Dict):
+        r"""
+        Store a result and evict the least recently used ones if needed.
+
+        Parameters
+        ----------
+        key: str
+            Key as returned by make_key.
+        data: structured array, shape (n,)
+            Numpy structured array used for registering the extracted data.
+        meta: dict
+            JSON serializable metadata: series names, calibration...
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        size = self.size()
+        fpath = self._path(key)
+        if fpath.exists():
+            size -= fpath.stat().st_size
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+        try:
+            with os.fdopen(fd, 'wb') as fobj:
+                np.savez_compressed(fobj, data=data, meta=np.array(json.dumps(meta)))
+            os.replace(tmp, fpath)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._size = size + fpath.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes: int = 0):
+        r"""
+        Delete the least recently used results until the folder is not larger than max_bytes.
+
+        Parameters
+        ----------
+        max_bytes: int, optional
+            Size to reach. Everything is deleted by default.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        for fpath, fsize, _ in entries:
+            if size <= max_bytes:
+                break
+            try:
+                fpath.unlink()
+            except FileNotFoundError:
+                pass
+            size -= fsize
+        self._size = size
+
+    def clear(self):
+        r"""Delete all the stored results."""
+        self.evict(0)
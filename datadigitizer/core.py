@@ -0,0 +1,530 @@
+r"""
+Core module.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+from typing import Dict, List, Tuple, Union
+import numpy as np
+
+from . import kernels
+
+DTYPES = [('type', 'U32'),
+          ('i', 'f8'),
+          ('j', 'f8'),
+          ('Xpix', 'f8'),
+          ('Ypix', 'f8'),
+          ('x', 'f8'),
+          ('y', 'f8'),
+          ('selected', 'i2'),
+          ('series', 'i4')]
+
+LIMITS = ('xmin', 'xmax', 'ymin', 'ymax')
+
+SERIES_COLORS = [(1.0, 0.0, 0.0),
+                 (1.0, 0.5, 0.0),
+                 (0.8, 0.0, 0.8),
+                 (0.0, 0.75, 0.75),
+                 (0.55, 0.27, 0.07),
+                 (0.5, 0.0, 1.0),
+                 (0.5, 0.5, 0.0)]
+
+LIMITS_COLORS = {'xmin': (0.0, 0.0, 1.0),
+                 'xmax': (0.0, 0.0, 1.0),
+                 'ymin': (0.0, 1.0, 0.0),
+                 'ymax': (0.0, 1.0, 0.0)}
+
+
+class Transform(object):
+    r"""Class for coordinate transformation. See __init__.__doc__."""
+
+    def __init__(self, values_min: float, values_max: float,
+                 pix_min: Union[int, float], pix_max: Union[int, float],
+                 which: str = 'linear'):
+        r"""
+        Transform class converting values coordinates into pixel coordinates.
+
+        Parameters
+        ----------
+        values_min: int, float
+            Minimum value.
+        values_max: int, float
+            Maximum value.
+        pix_min: int, float
+            Minimum pixel.
+        pix_max: int, float
+            Maximum pixel.
+        which: str, optional
+            Which kind of transform i.e. linear or log.
+        """
+
+        if which not in ['linear', 'log']:
+            raise ValueError('which must be either linear or log.')
+
+        self._which = which
+
+        self.x1_min = values_min
+        self.x1_max = values_max
+        self.x2_min = pix_min
+        self.x2_max = pix_max
+
+        self._x1_min = self.x1_min
+        self._x1_max = self.x1_max
+        self._x2_min = self.x2_min
+        self._x2_max = self.x2_max
+
+        if self._which == 'log':
+            self._x1_min = np.log10(values_min)
+            self._x1_max = np.log10(values_max)
+
+        self._dx2 = self._x2_max - self._x2_min
+        self._dx1 = self._x1_max - self._x1_min
+
+    def _prepare_x(self, x: Union[float, int, np.ndarray]):
+        if self._which == 'log':
+            return np.log10(x)
+        else:
+            return x
+
+    def forward(self, x: Union[int, float, np.ndarray]):
+        r"""
+        Transform values to pixels.
+
+        Parameters
+        -----------
+        x: int or floats or array-like, shape(n,)
+            Values to be transformed.
+
+        Returns
+        --------
+        pixels: int or floats or array-like, shape(n,)
+            Values corresponding to the pixels.
+
+        Notes
+        ----------
+        .. math::
+
+            x_{pix} = (x-x_{min})\frac{x_{pix, max} - x_{pix, min}}{x_{max}-x_{min}} + x_{pix,min}
+            
+        """
+        _x = self._prepare_x(x)
+        x_forward = (_x - self._x1_min) * self._dx2 / self._dx1 + self._x2_min
+        return x_forward
+
+    def backward(self, x: Union[int, float, np.ndarray]):
+        r"""
+        Transform pixels to values.
+
+        Parameters
+        -----------
+        x: int or floats or array-like, shape(n,)
+            Pixels to be transformed.
+
+        Returns
+        --------
+        values: int or floats or array-like, shape(n,)
+            Values corresponding to the pixels.
+        
+        Notes
+        ----------
+        .. math::
+
+            x = (x_{pix}-x_{pix, min})\frac{x_{max} - x_{min}}{x_{pix,max}-x_{pix, min}} + x_{min}
+        """
+        x_backward = (x - self._x2_min) * self._dx1 / self._dx2 + self._x1_min
+        if self._which == 'log':
+            return 10 ** x_backward
+        else:
+            return x_backward
+
+    @property
+    def forward_scale(self):
+        r"""Return the scale for transforming values into pixels.
+        
+        .. math::
+
+            \frac{x_{pix, max} - x_{pix, min}}{x_{max}-x_{min}}
+
+        """
+        return self._dx2 / self._dx1
+
+    @property
+    def backward_scale(self):
+        r"""Return the scale for transforming pixels into values.
+        
+        .. math::
+
+            \frac{x_{max} - x_{min}}{x_{pix,max}-x_{pix, min}}
+        
+        """
+        return self._dx1 / self._dx2
+
+
+def new_data(n: int = 0) -> np.ndarray:
+    r"""
+    Create an empty structured array for registering the extracted data.
+
+    Parameters
+    ----------
+    n: int, optional
+        Number of points.
+
+    Returns
+    -------
+    data: structured array, shape (n,)
+    """
+    return np.zeros(shape=(n,), dtype=DTYPES)
+
+
+def ij_to_xypix(i: Union[float, np.ndarray], j: Union[float, np.ndarray], row: int):
+    r"""Convert matrix indexes i,j into graph pixels for an image with row rows."""
+    xpix = j
+    ypix = row - i
+
+    return xpix, ypix
+
+
+def xypix_to_ij(xpix: Union[float, np.ndarray], ypix: Union[float, np.ndarray], row: int):
+    r"""Convert graph pixels into matrix indexes for an image with row rows."""
+    i = row - ypix
+    j = xpix
+
+    return i, j
+
+
+def add_points(data: np.ndarray,
+               i: Union[float, np.ndarray],
+               j: Union[float, np.ndarray],
+               row: int, series: int = 0, which: str = 'data') -> np.ndarray:
+    r"""
+    Append points to the data in one bulk insertion.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    i: float or array-like, shape (k,)
+        Row indexes of the new points.
+    j: float or array-like, shape (k,)
+        Column indexes of the new points.
+    row: int
+        Number of rows in the image.
+    series: int, optional
+        Series of the new points.
+    which: str, optional
+        Type of the new points.
+
+    Returns
+    -------
+    data: structured array, shape (n+k,)
+        New array with the appended points.
+    """
+    i = np.atleast_1d(np.asarray(i, dtype=np.float64))
+    j = np.atleast_1d(np.asarray(j, dtype=np.float64))
+    lines = new_data(i.size)
+    lines['type'] = which
+    lines['i'] = i
+    lines['j'] = j
+    lines['Xpix'], lines['Ypix'] = ij_to_xypix(i, j, row)
+    lines['series'] = series
+    return np.concatenate((data, lines))
+
+
+def nearest_point(data: np.ndarray, i: float, j: float) -> Tuple[int, float]:
+    r"""
+    Find the nearest point.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data. Must not be empty.
+    i: float
+        Row index.
+    j: float
+        Column index.
+
+    Returns
+    -------
+    ix: int
+        Index of the nearest point.
+    distance: float
+        Distance in pixels to the nearest point.
+    """
+    dxy = np.hypot(i - data['i'], j - data['j'])
+    ix = int(np.argmin(dxy))
+    return ix, float(dxy[ix])
+
+
+def paint_overlay(overlay: np.ndarray, data: np.ndarray, dx: int, dy: int,
+                  series_colors: List[Tuple[float, float, float]] = SERIES_COLORS) -> np.ndarray:
+    r"""
+    Paint the points as crosses in a RGBA overlay.
+
+    Selected points are painted with crosses twice larger.
+
+    Parameters
+    ----------
+    overlay: array-like, shape (n, m, 4)
+        RGBA overlay which is cleared and painted in place.
+    data: structured array, shape (k,)
+        Numpy structured array used for registering the extracted data.
+    dx: int
+        Half height of the crosses in pixels.
+    dy: int
+        Half width of the crosses in pixels.
+    series_colors: list of tuples
+        RGB colors of the series.
+
+    Returns
+    -------
+    overlay: array-like, shape (n, m, 4)
+        Painted overlay.
+    """
+    overlay[:, :, :] = 0
+    if data.size == 0:
+        return overlay
+
+    palette = np.array(list(series_colors) + [LIMITS_COLORS[name] for name in LIMITS], dtype=np.float64)
+    index = data['series'] % len(series_colors)
+    for k, name in enumerate(LIMITS):
+        index = np.where(data['type'] == name, len(series_colors) + k, index)
+    i = np.rint(data['i']).astype(np.int64)
+    j = np.rint(data['j']).astype(np.int64)
+    scale = np.where(data['selected'] != 0, 2, 1)
+    di, dj = (dx * scale).astype(np.int64), (dy * scale).astype(np.int64)
+    kernel = kernels.get('paint_crosses')
+    if kernel is not None:
+        kernel(overlay, i, j, di, dj, palette[index])
+        return overlay
+
+    # the vertical then the horizontal segment of each point: the last painted pixel wins
+    counts = np.concatenate((2 * di + 1, 2 * dj + 1))
+    point = np.repeat(np.concatenate((np.arange(i.size), np.arange(i.size))), counts)
+    along = np.arange(point.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    vertical = int(np.sum(2 * di + 1))
+    rows = np.concatenate((i[point[:vertical]] - di[point[:vertical]] + along[:vertical], i[point[vertical:]]))
+    cols = np.concatenate((j[point[:vertical]], j[point[vertical:]] - dj[point[vertical:]] + along[vertical:]))
+    order = np.argsort(2 * point + (np.arange(point.size) >= vertical), kind='stable')
+    rows, cols, point = rows[order], cols[order], point[order]
+    inside = (rows >= 0) & (rows < overlay.shape[0]) & (cols >= 0) & (cols < overlay.shape[1])
+    rows, cols, point = rows[inside], cols[inside], point[inside]
+    _, last = np.unique((rows * overlay.shape[1] + cols)[::-1], return_index=True)
+    last = rows.size - 1 - last
+    overlay[rows[last], cols[last], 0:3] = palette[index[point[last]]]
+    overlay[rows[last], cols[last], 3] = 1
+    return overlay
+
+
+def xy_pix_limits(data: np.ndarray) -> Tuple[float, float, float, float]:
+    r"""
+    Get the pixel positions of the limits.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+
+    Returns
+    -------
+    xpix_min, xpix_max, ypix_min, ypix_max: float
+        Pixel positions of the limits.
+
+    Raises
+    ------
+    ValueError
+        If the limits are not set exactly once.
+    """
+    mask_xmin = data['type'] == 'xmin'
+    mask_xmax = data['type'] == 'xmax'
+    mask_ymin = data['type'] == 'ymin'
+    mask_ymax = data['type'] == 'ymax'
+
+    if (mask_xmin.sum() == 1.0) and (mask_xmax.sum() == 1.0) and (mask_ymin.sum() == 1.0) and (
+            mask_ymax.sum() == 1.0):
+        xpix_min = data['Xpix'][mask_xmin][0]
+        xpix_max = data['Xpix'][mask_xmax][0]
+
+        ypix_min = data['Ypix'][mask_ymin][0]
+        ypix_max = data['Ypix'][mask_ymax][0]
+
+    else:
+        raise ValueError('X limits and Y limits must be set.')
+
+    return xpix_min, xpix_max, ypix_min, ypix_max
+
+
+class Calibration(object):
+    r"""Class for the calibration of the axes. See __init__.__doc__."""
+
+    def __init__(self, xpix: Tuple[float, float], ypix: Tuple[float, float],
+                 xvalues: Tuple[float, float], yvalues: Tuple[float, float],
+                 xlog: bool = False, ylog: bool = False):
+        r"""
+        Calibration of the axes: pixel positions of the limits and their values.
+
+        Parameters
+        ----------
+        xpix: tuple of floats
+            Xpix of Xmin and Xmax.
+        ypix: tuple of floats
+            Ypix of Ymin and Ymax.
+        xvalues: tuple of floats
+            Xmin and Xmax values.
+        yvalues: tuple of floats
+            Ymin and Ymax values.
+        xlog: bool, optional
+            Flag for log scale on the x axis.
+        ylog: bool, optional
+            Flag for log scale on the y axis.
+        """
+        self.xpix = tuple(float(v) for v in xpix)
+        self.ypix = tuple(float(v) for v in ypix)
+        self.xvalues = tuple(float(v) for v in xvalues)
+        self.yvalues = tuple(float(v) for v in yvalues)
+        self.xlog = bool(xlog)
+        self.ylog = bool(ylog)
+
+    @classmethod
+    def from_data(cls, data: np.ndarray,
+                  xvalues: Tuple[float, float], yvalues: Tuple[float, float],
+                  xlog: bool = False, ylog: bool = False):
+        r"""
+        Create the calibration from the limits registered in the data.
+
+        Parameters
+        ----------
+        data: structured array, shape (n,)
+            Numpy structured array used for registering the extracted data.
+        xvalues: tuple of floats
+            Xmin and Xmax values.
+        yvalues: tuple of floats
+            Ymin and Ymax values.
+        xlog: bool, optional
+            Flag for log scale on the x axis.
+        ylog: bool, optional
+            Flag for log scale on the y axis.
+        """
+        xpix_min, xpix_max, ypix_min, ypix_max = xy_pix_limits(data)
+        return cls((xpix_min, xpix_max), (ypix_min, ypix_max), xvalues, yvalues, xlog, ylog)
+
+    @classmethod
+    def from_dict(cls, d: Dict):
+        r"""Create the calibration from a dictionary as returned by to_dict."""
+        return cls(d['xpix'], d['ypix'], d['xvalues'], d['yvalues'],
+                   d.get('xlog', False), d.get('ylog', False))
+
+    def to_dict(self) -> Dict:
+        r"""Convert the calibration into a JSON serializable dictionary."""
+        return {'xpix': list(self.xpix), 'ypix': list(self.ypix),
+                'xvalues': list(self.xvalues), 'yvalues': list(self.yvalues),
+                'xlog': self.xlog, 'ylog': self.ylog}
+
+    def transforms(self) -> Tuple[Transform, Transform]:
+        r"""
+        Create the x and y transforms.
+
+        Returns
+        -------
+        xtrans, ytrans: Transform
+            Transforms for the x and y axes.
+        """
+        xtrans = Transform(values_min=self.xvalues[0],
+                           values_max=self.xvalues[1],
+                           pix_min=self.xpix[0],
+                           pix_max=self.xpix[1],
+                           which='log' if self.xlog else 'linear')
+        ytrans = Transform(values_min=self.yvalues[0],
+                           values_max=self.yvalues[1],
+                           pix_min=self.ypix[0],
+                           pix_max=self.ypix[1],
+                           which='log' if self.ylog else 'linear')
+        return xtrans, ytrans
+
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        r"""
+        Compute the x and y values of all the points in place.
+
+        Parameters
+        ----------
+        data: structured array, shape (n,)
+            Numpy structured array used for registering the extracted data.
+
+        Returns
+        -------
+        data: structured array, shape (n,)
+        """
+        xtrans, ytrans = self.transforms()
+        data['x'] = xtrans.backward(data['Xpix'])
+        data['y'] = ytrans.backward(data['Ypix'])
+        return data
+
+
+def transforms(data: np.ndarray,
+               xvalues: Tuple[float, float], yvalues: Tuple[float, float],
+               xlog: bool = False, ylog: bool = False) -> Tuple[Transform, Transform]:
+    r"""
+    Create the x and y transforms from the limits registered in the data.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    xvalues: tuple of floats
+        Xmin and Xmax values.
+    yvalues: tuple of floats
+        Ymin and Ymax values.
+    xlog: bool, optional
+        Flag for log scale on the x axis.
+    ylog: bool, optional
+        Flag for log scale on the y axis.
+
+    Returns
+    -------
+    xtrans, ytrans: Transform
+        Transforms for the x and y axes.
+    """
+    return Calibration.from_data(data, xvalues, yvalues, xlog, ylog).transforms()
+
+
+def measure(data: np.ndarray,
+            xvalues: Tuple[float, float], yvalues: Tuple[float, float],
+            xlog: bool = False, ylog: bool = False) -> Tuple[Transform, Transform]:
+    r"""
+    Compute the x and y values of all the points in place.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    xvalues: tuple of floats
+        Xmin and Xmax values.
+    yvalues: tuple of floats
+        Ymin and Ymax values.
+    xlog: bool, optional
+        Flag for log scale on the x axis.
+    ylog: bool, optional
+        Flag for log scale on the y axis.
+
+    Returns
+    -------
+    xtrans, ytrans: Transform
+        Transforms used for the x and y axes.
+    """
+    xtrans, ytrans = transforms(data, xvalues, yvalues, xlog, ylog)
+    data['x'] = xtrans.backward(data['Xpix'])
+    data['y'] = ytrans.backward(data['Ypix'])
+    return xtrans, ytrans
@@ -0,0 +1,266 @@
+r"""
+Corpus module.
+
+Generation of synthetic plots with their ground truth for benchmarking and
+regression testing the extraction of data. Each plot is rendered with the Agg
+backend into a PNG image with a JSON sidecar holding the exact data, the pixel
+positions of the data, the values of the limits and the calibration of the axes. The
+calibrations cannot represent a rotation: the rotated plots have no calibration and
+their ground truth is in pixels only.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import json
+import pathlib
+import tempfile
+import concurrent.futures
+from typing import Dict, List, Optional, Union
+import numpy as np
+
+from .core import Calibration, LIMITS
+
+COLORS = ['k', 'tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple', 'tab:brown']
+MARKERS = ['', '+', 'o', 's', '^', 'x', '.']
+LINESTYLES = ['-', '--', ':', '-.', '']
+
+
+def random_spec(rng: np.random.Generator, index: int = 0) -> Dict:
+    r"""
+    Draw the random specifications of a plot.
+
+    Parameters
+    ----------
+    rng: numpy.random.Generator
+        Random generator.
+    index: int, optional
+        Index of the plot used for naming the files.
+
+    Returns
+    -------
+    spec: dict
+        JSON serializable specifications used by render.
+    """
+    nseries = int(rng.integers(1, 4))
+    series = []
+    colors = rng.permutation(len(COLORS))
+    for k in range(nseries):
+        marker = MARKERS[rng.integers(len(MARKERS))]
+        linestyle = LINESTYLES[rng.integers(len(LINESTYLES))]
+        if marker == '' and linestyle == '':
+            marker = '+'
+        series.append({'npoints': int(rng.integers(5, 60)),
+                       'color': COLORS[colors[k % len(COLORS)]],
+                       'marker': marker,
+                       'linestyle': linestyle,
+                       'function': str(rng.choice(['poly', 'sine', 'exp'])),
+                       'coefs': rng.uniform(-1, 1, 3).tolist()})
+
+    return {'name': f'plot_{index:06d}',
+            'seed': int(rng.integers(2**31)),
+            'xlog': bool(rng.random() < 0.25),
+            'ylog': bool(rng.random() < 0.25),
+            'figsize': [float(rng.uniform(4, 8)), float(rng.uniform(3, 6))],
+            'dpi': int(rng.integers(50, 150)),
+            'grid': bool(rng.random() < 0.3),
+            'noise': float(rng.choice([0.0, rng.uniform(0, 0.05)])),
+            'rotation': float(rng.choice([0.0, rng.uniform(-3, 3)])),
+            'series': series}
+
+
+def _series_values(spec: Dict, series: Dict, rng: np.random.Generator):
+    n = series['npoints']
+    t = np.sort(rng.uniform(0, 1, n))
+    a, b, c = series['coefs']
+    if series['function'] == 'poly':
+        u = a + b * t + c * t**2
+    elif series['function'] == 'sine':
+        u = a + 0.5 * np.sin(2 * np.pi * (t + b)) * (1 + c) / 2
+    else:
+        u = a + np.exp(2 * b * t) / np.e
+    x = 10 ** (3 * t) if spec['xlog'] else 10 * t
+    y = 10 ** (2 * u) if spec['ylog'] else u
+    return x, y
+
+
+def _rotate_points(i: np.ndarray, j: np.ndarray, shape, angle: float):
+    r"""Rotate matrix indexes like PIL rotates the image counter clockwise around its center."""
+    theta = np.deg2rad(angle)
+    cy, cx = shape[0] / 2, shape[1] / 2
+    # continuous coordinates where the pixel k spans [k, k+1)
+    x, y = j + 0.5 - cx, i + 0.5 - cy
+    xr = cx + x * np.cos(theta) + y * np.sin(theta)
+    yr = cy - x * np.sin(theta) + y * np.cos(theta)
+    return yr - 0.5, xr - 0.5
+
+
+def render(spec: Dict, folder: Union[str, pathlib.Path]) -> pathlib.Path:
+    r"""
+    Render a plot and write its image and its sidecar.
+
+    Parameters
+    ----------
+    spec: dict
+        Specifications as returned by random_spec.
+    folder: str or Path
+        Output folder.
+
+    Returns
+    -------
+    fpath: Path
+        Path to the JSON sidecar.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from PIL import Image
+
+    folder = pathlib.Path(folder)
+    rng = np.random.default_rng(spec['seed'])
+
+    fig = Figure(figsize=spec['figsize'], dpi=spec['dpi'])
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    values = []
+    for series in spec['series']:
+        x, y = _series_values(spec, series, rng)
+        values.append((x, y))
+        ax.plot(x, y, color=series['color'], marker=series['marker'],
+                linestyle=series['linestyle'] if series['linestyle'] else 'none')
+    if spec['xlog']:
+        ax.set_xscale('log')
+    if spec['ylog']:
+        ax.set_yscale('log')
+    ax.grid(spec['grid'])
+    canvas.draw()
+
+    image_array = np.asarray(canvas.buffer_rgba())[:, :, :3].astype(np.float64) / 255
+    row = image_array.shape[0]
+
+    def ij(xv, yv):
+        xd, yd = ax.transData.transform(np.column_stack((xv, yv))).T
+        return row - yd - 0.5, xd - 0.5
+
+    # limit points as the user would position them: at the corners of the axes
+    (x0, x1), (y0, y1) = ax.get_xlim(), ax.get_ylim()
+    limits_i, limits_j = ij([x0, x1, x0, x0], [y0, y0, y0, y1])
+
+    if spec['noise'] > 0:
+        image_array = image_array + rng.normal(0, spec['noise'], image_array.shape)
+    image = Image.fromarray((np.clip(image_array, 0, 1) * 255).astype(np.uint8))
+    if spec['rotation'] != 0:
+        image = image.rotate(spec['rotation'], resample=Image.BICUBIC, fillcolor=(255, 255, 255))
+        limits_i, limits_j = _rotate_points(limits_i, limits_j, image_array.shape, spec['rotation'])
+
+    axes = {'xvalues': [x0, x1], 'yvalues': [y0, y1], 'xlog': spec['xlog'], 'ylog': spec['ylog']}
+    calibration = None
+    if spec['rotation'] == 0:
+        calibration = Calibration(xpix=(limits_j[0], limits_j[1]),
+                                  ypix=(row - limits_i[2], row - limits_i[3]),
+                                  xvalues=(x0, x1), yvalues=(y0, y1),
+                                  xlog=spec['xlog'], ylog=spec['ylog']).to_dict()
+
+    truth = []
+    for series, (x, y) in zip(spec['series'], values):
+        i, j = ij(x, y)
+        if spec['rotation'] != 0:
+            i, j = _rotate_points(i, j, image_array.shape, spec['rotation'])
+        truth.append({'color': series['color'], 'marker': series['marker'],
+                      'linestyle': series['linestyle'],
+                      'x': x.tolist(), 'y': y.tolist(), 'i': i.tolist(), 'j': j.tolist()})
+
+    image_path = folder / (spec['name'] + '.png')
+    image.save(image_path)
+    sidecar = {'image': image_path.name,
+               'shape': list(image_array.shape[:2]),
+               'spec': spec,
+               'axes': axes,
+               'calibration': calibration,
+               'limits': {which: [float(limits_i[k]), float(limits_j[k])]
+                          for k, which in enumerate(LIMITS)},
+               'series': truth}
+    fpath = folder / (spec['name'] + '.json')
+    with open(fpath, 'w') as fobj:
+        json.dump(sidecar, fobj)
+    return fpath
+
+
+def _render(args):
+    return render(*args)
+
+
+def generate(count: int, folder: Optional[Union[str, pathlib.Path]] = None,
+             seed: int = 0, workers: Optional[int] = None) -> List[pathlib.Path]:
+    r"""
+    Generate a corpus of random plots in parallel.
+
+    Parameters
+    ----------
+    count: int
+        Number of plots.
+    folder: str or Path, optional
+        Output folder. A new temporary folder is created by default.
+    seed: int, optional
+        Seed of the random generator: the same seed gives the same corpus.
+    workers: int, optional
+        Number of worker processes. By default, the number of processors.
+        The plots are rendered in the current process if workers is 1.
+
+    Returns
+    -------
+    sidecars: list of Path
+        Paths to the JSON sidecars.
+    """
+    if folder is None:
+        folder = tempfile.mkdtemp(prefix='datadigitizer-corpus-')
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    tasks = [(random_spec(rng, index), folder) for index in range(count)]
+    if workers == 1:
+        return [_render(task) for task in tasks]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, count // (4 * (workers or executor._max_workers)))
+        return list(executor.map(_render, tasks, chunksize=chunksize))
+
+
+def load(sidecar: Union[str, pathlib.Path]) -> Dict:
+    r"""
+    Load the sidecar of a plot.
+
+    Parameters
+    ----------
+    sidecar: str or Path
+        Path to the JSON sidecar.
+
+    Returns
+    -------
+    truth: dict
+        Sidecar content where the calibration is a Calibration instance, None for
+        the rotated plots, the image an absolute path and the series values arrays.
+    """
+    sidecar = pathlib.Path(sidecar)
+    with open(sidecar, 'r') as fobj:
+        truth = json.load(fobj)
+    truth['image'] = sidecar.parent / truth['image']
+    if truth['calibration'] is not None:
+        truth['calibration'] = Calibration.from_dict(truth['calibration'])
+    for series in truth['series']:
+        for key in ('x', 'y', 'i', 'j'):
+            series[key] = np.asarray(series[key])
+    return truth
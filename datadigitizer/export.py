@@ -0,0 +1,416 @@
+r"""
+Export module.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import pathlib
+from typing import List, Optional, Tuple, Union
+import numpy as np
+
+from . import version
+
+EXPORT_FORMATS = ('long', 'blocks', 'grid')
+GRID_SPACINGS = ('linear', 'log')
+DECIMATION_METHODS = ('none', 'uniform', 'rdp', 'max')
+
+
+def _info():
+    return version.__package_name__ + "-" + version.__version__
+
+
+def sort_data(data: np.ndarray) -> np.ndarray:
+    r"""
+    Sort the data points by series and by x values.
+
+    The limits are kept first in their original order.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+
+    Returns
+    -------
+    sorted_data: structured array, shape (n,)
+        Sorted copy of the data.
+    """
+    mask = data['type'] == 'data'
+    points = data[mask]
+    order = np.lexsort((points['x'], points['series']))
+    return np.concatenate((data[~mask], points[order]))
+
+
+def long_format(data: np.ndarray, series_names: List[str]) -> np.ndarray:
+    r"""
+    Convert the data into the long format where the series column holds the series names.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    series_names: list of str
+        Names of the series indexed by the series column.
+
+    Returns
+    -------
+    long_data: structured array, shape (n,)
+        Sorted data with the series names.
+    """
+    data = sort_data(data)
+    names = np.asarray(series_names, dtype=np.str_)
+    dtypes = [(name, data.dtype[name]) for name in data.dtype.names if name != 'series']
+    dtypes.append(('series', names.dtype if names.size else 'U1'))
+    long_data = np.zeros(shape=data.shape, dtype=dtypes)
+    for name in data.dtype.names:
+        if name != 'series':
+            long_data[name] = data[name]
+    if names.size:
+        long_data['series'] = names[data['series']]
+    return long_data
+
+
+def column_blocks(data: np.ndarray, series_names: List[str]) -> Tuple[List[str], np.ndarray]:
+    r"""
+    Convert the data points into blocks of x and y columns, one block per series.
+
+    Shorter series are padded with NaN.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    series_names: list of str
+        Names of the series indexed by the series column.
+
+    Returns
+    -------
+    names: list of str
+        Column names.
+    blocks: array-like, shape (m, 2*len(series_names))
+        x and y columns of each series sorted by x.
+    """
+    points = sort_data(data)
+    points = points[points['type'] == 'data']
+    nseries = len(series_names)
+    counts = np.bincount(points['series'], minlength=nseries)
+    blocks = np.full(shape=(counts.max(initial=0), 2 * nseries), fill_value=np.nan)
+    # points are sorted by series: rank of each point inside its series
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rows = np.arange(points.size) - starts[points['series']]
+    blocks[rows, 2 * points['series']] = points['x']
+    blocks[rows, 2 * points['series'] + 1] = points['y']
+
+    names = []
+    for name in series_names:
+        names.extend((f'x {name}', f'y {name}'))
+    return names, blocks
+
+
+def _rdp(x: np.ndarray, y: np.ndarray, first: np.ndarray, last: np.ndarray, tolerance: float) -> np.ndarray:
+    r"""Mark the points kept by the Ramer-Douglas-Peucker algorithm, all the segments of a level at once."""
+    keep = np.zeros(x.size, dtype=bool)
+    keep[first] = keep[last] = True
+    a, b = first[last - first > 1], last[last - first > 1]
+    while a.size:
+        # interior points of all the segments
+        counts = b - a - 1
+        owner = np.repeat(np.arange(a.size), counts)
+        starts = np.cumsum(counts) - counts
+        index = np.repeat(a + 1, counts) + np.arange(owner.size) - np.repeat(starts, counts)
+        ax, ay, bx, by = x[a][owner], y[a][owner], x[b][owner], y[b][owner]
+        dx, dy = bx - ax, by - ay
+        norm = np.hypot(dx, dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distance = np.where(norm > 0, np.abs(dx * (ay - y[index]) - dy * (ax - x[index])) / norm,
+                                np.hypot(x[index] - ax, y[index] - ay))
+        largest = np.maximum.reduceat(distance, starts)
+        # first interior point at the largest distance of each segment
+        candidates = np.flatnonzero(distance == largest[owner])
+        _, first_candidate = np.unique(owner[candidates], return_index=True)
+        split = index[candidates[first_candidate]]
+        far = largest > tolerance
+        keep[split[far]] = True
+        a, b = np.concatenate((a[far], split[far])), np.concatenate((split[far], b[far]))
+        a, b = a[b - a > 1], b[b - a > 1]
+    return keep
+
+
+def decimate(data: np.ndarray, method: str = 'none', value: Optional[float] = None,
+             xlog: bool = False, ylog: bool = False, columns: Tuple[str, str] = ('x', 'y')) -> np.ndarray:
+    r"""
+    Reduce the number of data points of each series.
+
+    The points are sorted by x in each series and the first and the last points of
+    each series are kept. The limits are kept. The rdp method keeps the points without
+    finite position, e.g. the non-positive values on a log axis.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data, measured.
+    method: str, optional
+        none: all the points.
+        uniform: the first point in each interval of width value along x.
+        rdp: Ramer-Douglas-Peucker simplification, the removed points are closer than
+        value to the kept polyline.
+        max: at most value points evenly spaced along each series.
+    value: float, optional
+        Width of the intervals or tolerance in data units, or number of points.
+    xlog: bool, optional
+        Flag for log scale on the x axis: the distances along x are in decades.
+    ylog: bool, optional
+        Flag for log scale on the y axis: the distances along y are in decades.
+    columns: tuple of str, optional
+        Fields of the x and y values, e.g. Xpix and Ypix for uncalibrated data.
+
+    Returns
+    -------
+    decimated: structured array, shape (k,)
+        Sorted data with the kept points.
+    """
+    if method not in DECIMATION_METHODS:
+        raise ValueError(f'{method} is not a valid decimation method: {DECIMATION_METHODS}.')
+    data = sort_data(data)
+    if method == 'none':
+        return data
+    if value is None or value <= 0:
+        raise ValueError(f'the {method} decimation requires a positive value.')
+    mask = data['type'] == 'data'
+    points = data[mask]
+    if points.size == 0:
+        return data
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.log10(points[columns[0]]) if xlog else points[columns[0]].astype(np.float64)
+        y = np.log10(points[columns[1]]) if ylog else points[columns[1]].astype(np.float64)
+    series = points['series']
+    # points are sorted by series: bounds of each series
+    boundaries = np.flatnonzero(np.diff(series)) + 1
+    first = np.concatenate(([0], boundaries))
+    last = np.concatenate((boundaries, [points.size])) - 1
+    if method == 'uniform':
+        bins = np.floor((x - np.repeat(x[first], last - first + 1)) / value)
+        keep = np.ones(points.size, dtype=bool)
+        keep[1:] = (bins[1:] != bins[:-1]) | (series[1:] != series[:-1])
+        keep[last] = True
+    elif method == 'rdp':
+        # the points without finite position, e.g. non-positive values on a log axis, are kept apart
+        finite = np.isfinite(x) & np.isfinite(y)
+        keep = ~finite
+        index = np.flatnonzero(finite)
+        if index.size:
+            boundaries = np.flatnonzero(np.diff(series[index])) + 1
+            keep[index[_rdp(x[index], y[index], np.concatenate(([0], boundaries)),
+                            np.concatenate((boundaries, [index.size])) - 1, value)]] = True
+    else:
+        n = max(int(value), 2)
+        counts = np.repeat(last - first + 1, last - first + 1)
+        rank = np.arange(points.size) - np.repeat(first, last - first + 1)
+        # evenly spaced ranks round(k (count - 1) / (n - 1)), k = 0 .. n-1
+        spacing = np.maximum(counts - 1, 1) / (n - 1)
+        keep = (counts <= n) | (np.rint(np.rint(rank / spacing) * spacing) == rank)
+    return np.concatenate((data[~mask], points[keep]))
+
+
+def make_grid(start: float, stop: float, num: int, spacing: str = 'linear') -> np.ndarray:
+    r"""
+    Compute evenly spaced x values.
+
+    Parameters
+    ----------
+    start: float
+        First value.
+    stop: float
+        Last value.
+    num: int
+        Number of values, at least 2.
+    spacing: str, optional
+        linear: constant step.
+        log: constant ratio as on a log axis, start and stop must be positive.
+
+    Returns
+    -------
+    grid: array-like, shape (num,)
+        x values.
+    """
+    if spacing not in GRID_SPACINGS:
+        raise ValueError(f'{spacing} is not a valid grid spacing: {GRID_SPACINGS}.')
+    if int(num) < 2:
+        raise ValueError('the grid requires at least 2 points.')
+    if spacing == 'log':
+        if start <= 0 or stop <= 0:
+            raise ValueError('the log grid requires positive bounds.')
+        return np.logspace(np.log10(start), np.log10(stop), int(num))
+    return np.linspace(start, stop, int(num))
+
+
+def parse_grid(text: str, spacing: str = 'linear') -> np.ndarray:
+    r"""
+    Read a grid of x values.
+
+    Parameters
+    ----------
+    text: str
+        start:stop:num for evenly spaced values or the list of values separated by
+        commas or spaces.
+    spacing: str, optional
+        Spacing of the evenly spaced values, see make_grid.
+
+    Returns
+    -------
+    grid: array-like
+        Sorted x values.
+    """
+    try:
+        if ':' in text:
+            start, stop, num = text.split(':')
+            return make_grid(float(start), float(stop), int(num), spacing)
+        grid = np.sort(np.array(text.replace(',', ' ').split(), dtype=np.float64))
+    except ValueError as error:
+        raise ValueError(f'invalid grid {text!r}: {error}') from None
+    if grid.size == 0:
+        raise ValueError('the grid is empty.')
+    return grid
+
+
+def resample(data: np.ndarray, series_names: List[str], grid: np.ndarray,
+             xlog: bool = False, ylog: bool = False) -> Tuple[List[str], np.ndarray]:
+    r"""
+    Interpolate the y values of each series onto common x values.
+
+    The interpolation is linear in the scales of the axes: in decades on the log axes.
+    The grid values outside the x range of a series give NaN.
+
+    Parameters
+    ----------
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data, measured.
+    series_names: list of str
+        Names of the series indexed by the series column.
+    grid: array-like, shape (m,)
+        x values.
+    xlog: bool, optional
+        Flag for log scale on the x axis.
+    ylog: bool, optional
+        Flag for log scale on the y axis.
+
+    Returns
+    -------
+    names: list of str
+        Column names.
+    columns: array-like, shape (m, 1+len(series_names))
+        Grid and y column of each series.
+    """
+    grid = np.asarray(grid, dtype=np.float64).ravel()
+    nseries = len(series_names)
+    points = sort_data(data)
+    points = points[points['type'] == 'data']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.log10(points['x']) if xlog else points['x'].astype(np.float64)
+        y = np.log10(points['y']) if ylog else points['y'].astype(np.float64)
+        g = np.log10(grid) if xlog else grid
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y, series = x[valid], y[valid], points['series'][valid]
+    columns = np.full(shape=(grid.size, nseries), fill_value=np.nan)
+    if x.size:
+        # points are sorted by series then x: shifting each series beyond the previous one
+        # makes x increasing so that all the series are searched at once
+        counts = np.bincount(series, minlength=nseries)
+        first = np.cumsum(counts) - counts
+        last = first + counts - 1
+        span = x.max() - x.min() + 1
+        key = x - x.min() + series * span
+        s = np.repeat(np.arange(nseries), grid.size)
+        q = np.tile(g, nseries)
+        inside = (counts[s] > 0) & np.isfinite(q)
+        lo = np.zeros(q.size, dtype=np.int64)
+        lo[inside] = np.searchsorted(key, q[inside] - x.min() + s[inside] * span, side='right') - 1
+        inside &= (lo >= first[s]) & (lo <= last[s])
+        lo[~inside] = 0
+        hi = np.minimum(lo + 1, last[s])
+        inside &= q <= x[hi]
+        dx = x[hi] - x[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(dx > 0, (q - x[lo]) / dx, 0)
+        values = y[lo] + weight * (y[hi] - y[lo])
+        values = np.where(inside, 10 ** values if ylog else values, np.nan)
+        columns = values.reshape(nseries, grid.size).T
+    return ['x'] + [f'y {name}' for name in series_names], np.column_stack((grid, columns))
+
+
+def save_data(fpath: Union[str, pathlib.Path], data: np.ndarray, series_names: List[str],
+              xunit: str = 'a.u.', yunit: str = 'a.u.', fmt: str = 'long', grid: Optional[np.ndarray] = None,
+              xlog: bool = False, ylog: bool = False):
+    r"""
+    Save the data in a tab separated text file.
+
+    Parameters
+    ----------
+    fpath: str or Path
+        Path to the data file.
+    data: structured array, shape (n,)
+        Numpy structured array used for registering the extracted data.
+    series_names: list of str
+        Names of the series indexed by the series column.
+    xunit: str, optional
+        Unit of the x values.
+    yunit: str, optional
+        Unit of the y values.
+    fmt: str, optional
+        long: all the points with their type and series name.
+        blocks: x and y columns for each series.
+        grid: x column of the grid and y column of each series resampled onto it.
+    grid: array-like, optional
+        x values of the grid format, see make_grid and parse_grid.
+    xlog: bool, optional
+        Flag for log scale on the x axis, used by the grid format.
+    ylog: bool, optional
+        Flag for log scale on the y axis, used by the grid format.
+    """
+    if fmt == 'long':
+        long_data = long_format(data, series_names)
+        names = list(long_data.dtype.names)
+        names[names.index('x')] += f' /{xunit}'
+        names[names.index('y')] += f' /{yunit}'
+        header = '\n'.join((_info(), '\t'.join(names)))
+        np.savetxt(fpath, X=long_data,
+                   header=header,
+                   fmt=('%s', '%.3f', '%.3f', '%.3f', '%.3f', '%.6e', '%.6e', '%d', '%s'),
+                   delimiter='\t',
+                   comments='#')
+    elif fmt == 'blocks':
+        names, blocks = column_blocks(data, series_names)
+        names = [name + f' /{xunit if k % 2 == 0 else yunit}' for k, name in enumerate(names)]
+        header = '\n'.join((_info(), '\t'.join(names)))
+        np.savetxt(fpath, X=blocks,
+                   header=header,
+                   fmt='%.6e',
+                   delimiter='\t',
+                   comments='#')
+    elif fmt == 'grid':
+        if grid is None:
+            raise ValueError('the grid format requires a grid.')
+        names, columns = resample(data, series_names, grid, xlog, ylog)
+        names = [name + f' /{xunit if k == 0 else yunit}' for k, name in enumerate(names)]
+        header = '\n'.join((_info(), '\t'.join(names)))
+        np.savetxt(fpath, X=columns,
+                   header=header,
+                   fmt='%.6e',
+                   delimiter='\t',
+                   comments='#')
+    else:
+        raise ValueError(f'fmt must be one of {", ".join(EXPORT_FORMATS)}.')
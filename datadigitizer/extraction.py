@@ -0,0 +1,428 @@
+r"""
+Extraction module.
+
+Automatic extraction of the data points from the image array. The extractors
+return matrix indexes i, j that are inserted in the point store with
+:func:`datadigitizer.core.add_points`.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+from typing import Optional, Sequence, Tuple
+import numpy as np
+
+from . import kernels
+from .imaging import grayscale, normalize
+from .tiling import row_bands, map_bands, tiled
+
+Bounds = Tuple[int, int, int, int]
+
+
+def crop_bounds(i: Sequence[float], j: Sequence[float], shape, margin: int = 3) -> Bounds:
+    r"""
+    Compute the bounds of the rectangle enclosing points, shrunk by a margin.
+
+    Used for restricting the extraction inside the axes given by the limit points
+    so that the frame of the axes is excluded.
+
+    Parameters
+    ----------
+    i: array-like
+        Row indexes.
+    j: array-like
+        Column indexes.
+    shape: tuple
+        Shape of the image.
+    margin: int, optional
+        Number of pixels removed on each side.
+
+    Returns
+    -------
+    bounds: tuple of int
+        imin, imax, jmin, jmax where the max are excluded.
+    """
+    imin = max(int(np.ceil(np.min(i))) + margin, 0)
+    imax = min(int(np.floor(np.max(i))) - margin + 1, shape[0])
+    jmin = max(int(np.ceil(np.min(j))) + margin, 0)
+    jmax = min(int(np.floor(np.max(j))) - margin + 1, shape[1])
+    return imin, imax, jmin, jmax
+
+
+def _near_color(image_array: np.ndarray, color: np.ndarray, tolerance: float) -> np.ndarray:
+    r"""Compute the mask of the pixels close to a color, see color_mask."""
+    rgb = normalize(image_array)
+    if rgb.ndim == 2:
+        rgb = rgb[:, :, np.newaxis]
+    channels = [rgb[:, :, k] for k in range(min(rgb.shape[2], 3))]
+    color = color[:len(channels)]
+    # channel by channel: reductions over the short color axis are slow
+    distance2 = (channels[0] - color[0]) ** 2
+    for channel, value in zip(channels[1:], color[1:]):
+        distance2 += (channel - value) ** 2
+    inside = distance2 <= tolerance ** 2
+    chroma = np.ptp(color)
+    if chroma > 0.1:
+        i, j = np.nonzero(inside)
+        pixels = rgb[i, j, :len(channels)]
+        keep = pixels.max(axis=1) - pixels.min(axis=1) >= chroma / 2
+        inside[i[~keep], j[~keep]] = False
+    return inside
+
+
+def color_mask(image_array: np.ndarray, color: Sequence[float], tolerance: float = 0.25,
+               bounds: Optional[Bounds] = None, workers: Optional[int] = None) -> np.ndarray:
+    r"""
+    Compute the mask of the pixels close to a color.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m, c)
+        Image as returned by imread.
+    color: sequence of float
+        RGB color between 0 and 1.
+    tolerance: float, optional
+        Maximal euclidean distance in the RGB space.
+        For a saturated color, the pixels must also keep at least half of its
+        chroma so that the anti-aliased gray edges of the axes are excluded.
+    bounds: tuple of int, optional
+        imin, imax, jmin, jmax. The pixels outside are excluded from the mask.
+    workers: int, optional
+        Number of threads processing the bands of a large image, see
+        :func:`datadigitizer.tiling.tiled`. By default, the number of processors.
+
+    Returns
+    -------
+    mask: array-like, shape (n, m)
+        True for the pixels close to the color.
+    """
+    image_array = np.asarray(image_array)
+    mask = np.zeros(image_array.shape[:2], dtype=bool)
+    imin, imax, jmin, jmax = (0, mask.shape[0], 0, mask.shape[1]) if bounds is None else bounds
+    color = np.asarray(color, dtype=np.float64)
+    mask[imin:imax, jmin:jmax] = tiled(lambda band: _near_color(band, color, tolerance),
+                                       image_array[imin:imax, jmin:jmax], workers)
+    return mask
+
+
+def _column_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    r"""Compute the centers of the vertical runs of a mask, see column_runs."""
+    # pad with False rows so that every run has a start and an end in each column
+    padded = np.zeros((mask.shape[1], mask.shape[0] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.T
+    jumps = np.diff(padded, axis=1)
+    jstart, istart = np.nonzero(jumps == 1)
+    _, iend = np.nonzero(jumps == -1)
+    i = (istart + iend - 1) / 2
+    return i, jstart.astype(np.float64)
+
+
+def column_runs(mask: np.ndarray, workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Compute the centers of the vertical runs of a mask.
+
+    Each continuous run of True pixels in a column gives one point which is
+    suitable for curves that are functions of x.
+
+    Parameters
+    ----------
+    mask: array-like, shape (n, m)
+        Binary image.
+    workers: int, optional
+        Number of threads processing the bands of columns of a large mask. The runs
+        do not cross the bands. By default, the number of processors.
+
+    Returns
+    -------
+    i: array-like
+        Row indexes of the centers of the runs.
+    j: array-like
+        Column indexes of the runs.
+    """
+    bands = row_bands(mask.shape[1], mask.shape[0], workers)
+
+    def runs(start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        i, j = _column_runs(mask[:, start:stop])
+        return i, j + start
+
+    results = map_bands(runs, bands, workers)
+    if len(results) == 1:
+        return results[0]
+    return np.concatenate([i for i, _ in results]), np.concatenate([j for _, j in results])
+
+
+def extract_color(image_array: np.ndarray, color: Sequence[float], tolerance: float = 0.25,
+                  bounds: Optional[Bounds] = None, workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Extract the points of a series by masking its color.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m, c)
+        Image as returned by imread.
+    color: sequence of float
+        RGB color of the series between 0 and 1.
+    tolerance: float, optional
+        Maximal euclidean distance in the RGB space.
+    bounds: tuple of int, optional
+        imin, imax, jmin, jmax of the axes.
+    workers: int, optional
+        Number of threads, see color_mask and column_runs.
+
+    Returns
+    -------
+    i: array-like
+        Row indexes of the points.
+    j: array-like
+        Column indexes of the points.
+    """
+    return column_runs(color_mask(image_array, color, tolerance, bounds, workers), workers)
+
+
+def dark_mask(image_array: np.ndarray, threshold: float = 0.5,
+              bounds: Optional[Bounds] = None, workers: Optional[int] = None) -> np.ndarray:
+    r"""
+    Binarize an image by thresholding its grayscale version.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread.
+    threshold: float, optional
+        Pixels darker than the threshold are True.
+    bounds: tuple of int, optional
+        imin, imax, jmin, jmax. The pixels outside are excluded from the mask.
+    workers: int, optional
+        Number of threads, see color_mask.
+
+    Returns
+    -------
+    mask: array-like, shape (n, m)
+        True for the dark pixels.
+    """
+    image_array = np.asarray(image_array)
+    mask = np.zeros(image_array.shape[:2], dtype=bool)
+    imin, imax, jmin, jmax = (0, mask.shape[0], 0, mask.shape[1]) if bounds is None else bounds
+    mask[imin:imax, jmin:jmax] = tiled(lambda band: grayscale(band) < threshold,
+                                       image_array[imin:imax, jmin:jmax], workers)
+    return mask
+
+
+def row_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    r"""
+    Run-length encode the rows of a mask.
+
+    Parameters
+    ----------
+    mask: array-like, shape (n, m)
+        Binary image.
+
+    Returns
+    -------
+    rows: array-like
+        Row index of each run.
+    starts: array-like
+        First column of each run.
+    ends: array-like
+        Column after the last one of each run.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    width = mask.shape[1] + 2
+    padded = np.zeros((mask.shape[0], width), dtype=bool)
+    padded[:, 1:-1] = mask
+    flat = padded.ravel()
+    # the padding makes the transitions alternate between starts and ends
+    transitions = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    starts, ends = transitions[0::2], transitions[1::2]
+    rows = starts // width
+    return rows, starts - rows * width - 1, ends - rows * width - 1
+
+
+def _run_edges(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+               width: int, connectivity: int) -> Tuple[np.ndarray, np.ndarray]:
+    r"""Find the pairs of touching runs in consecutive rows."""
+    stride = width + 2
+    c = 1 if connectivity == 8 else 0
+    # runs are sorted in row-major order: their keys are sorted and disjoint
+    start_keys = rows * stride + starts + 1
+    end_keys = rows * stride + ends + 1
+    previous = (rows - 1) * stride + 1
+    lo = np.searchsorted(end_keys, previous + starts - c, side='right')
+    hi = np.searchsorted(start_keys, previous + ends + c, side='left')
+    counts = np.maximum(hi - lo, 0)
+    b = np.repeat(np.arange(rows.size), counts)
+    offsets = np.arange(b.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    a = np.repeat(lo, counts) + offsets
+    return a, b
+
+
+def _union_find(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    r"""Compute the root of each node of a graph by hooking and pointer jumping."""
+    kernel = kernels.get('union_find')
+    if kernel is not None:
+        return kernel(n, a, b)
+    parent = np.arange(n)
+    while a.size:
+        pa, pb = parent[a], parent[b]
+        changed = pa != pb
+        if not changed.any():
+            break
+        a, b, pa, pb = a[changed], b[changed], pa[changed], pb[changed]
+        low = np.minimum(pa, pb)
+        np.minimum.at(parent, pa, low)
+        np.minimum.at(parent, pb, low)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+
+def _label_band(mask: np.ndarray, connectivity: int):
+    r"""Label the connected components of a mask, see label_runs."""
+    rows, starts, ends = row_runs(mask)
+    a, b = _run_edges(rows, starts, ends, mask.shape[1], connectivity)
+    roots = _union_find(rows.size, a, b)
+    uniques, labels = np.unique(roots, return_inverse=True)
+    return rows, starts, ends, labels, uniques.size
+
+
+def label_runs(mask: np.ndarray, connectivity: int = 8, workers: Optional[int] = None):
+    r"""
+    Label the connected components of a mask.
+
+    The rows are run-length encoded, the touching runs of consecutive rows are
+    found by binary search and merged by a vectorized union-find so that the cost
+    depends on the number of runs instead of the number of pixels.
+
+    Parameters
+    ----------
+    mask: array-like, shape (n, m)
+        Binary image.
+    connectivity: int, optional
+        4 or 8.
+    workers: int, optional
+        Number of threads labeling the bands of a large mask. The components cut by
+        the seams between the bands are merged through the runs of the rows around
+        the seams. The labels are those of the whole mask. By default, the number of
+        processors.
+
+    Returns
+    -------
+    rows, starts, ends: array-like
+        Runs as returned by row_runs.
+    labels: array-like
+        Component label of each run between 0 and ncomponents-1.
+    ncomponents: int
+        Number of components.
+    """
+    if connectivity not in (4, 8):
+        raise ValueError(f'connectivity must be 4 or 8 (got {connectivity}).')
+    mask = np.asarray(mask, dtype=bool)
+    bands = row_bands(mask.shape[0], mask.shape[1], workers)
+    results = map_bands(lambda start, stop: _label_band(mask[start:stop], connectivity), bands, workers)
+    if len(results) == 1:
+        return results[0]
+    rows = np.concatenate([result[0] + start for result, (start, _) in zip(results, bands)])
+    starts = np.concatenate([result[1] for result in results])
+    ends = np.concatenate([result[2] for result in results])
+    offsets = np.cumsum([0] + [result[4] for result in results])
+    labels = np.concatenate([result[3] + offset for result, offset in zip(results, offsets)])
+    # the labels are merged by hooking on the smallest one: the numbering is the one of the whole mask
+    seams = [start for start, _ in bands[1:]]
+    around = np.flatnonzero(np.isin(rows, seams) | np.isin(rows + 1, seams))
+    a, b = _run_edges(rows[around], starts[around], ends[around], mask.shape[1], connectivity)
+    roots = _union_find(int(offsets[-1]), labels[around[a]], labels[around[b]])
+    uniques, merged = np.unique(roots, return_inverse=True)
+    return rows, starts, ends, merged[labels], uniques.size
+
+
+def component_properties(mask: np.ndarray, connectivity: int = 8, workers: Optional[int] = None) -> np.ndarray:
+    r"""
+    Compute the area, the centroid and the bounding box of the connected components.
+
+    Parameters
+    ----------
+    mask: array-like, shape (n, m)
+        Binary image.
+    connectivity: int, optional
+        4 or 8.
+    workers: int, optional
+        Number of threads, see label_runs.
+
+    Returns
+    -------
+    properties: structured array
+        Fields area, i, j (centroid), height and width.
+    """
+    rows, starts, ends, labels, n = label_runs(mask, connectivity, workers)
+    properties = np.zeros(n, dtype=[('area', 'i8'), ('i', 'f8'), ('j', 'f8'),
+                                    ('height', 'i8'), ('width', 'i8')])
+    if n == 0:
+        return properties
+    lengths = ends - starts
+    area = np.bincount(labels, weights=lengths, minlength=n)
+    properties['area'] = area
+    properties['i'] = np.bincount(labels, weights=rows * lengths, minlength=n) / area
+    properties['j'] = np.bincount(labels, weights=(starts + ends - 1) * lengths / 2, minlength=n) / area
+
+    order = np.argsort(labels, kind='stable')
+    first = np.searchsorted(labels[order], np.arange(n))
+    properties['height'] = (np.maximum.reduceat(rows[order], first)
+                            - np.minimum.reduceat(rows[order], first) + 1)
+    properties['width'] = (np.maximum.reduceat(ends[order], first)
+                           - np.minimum.reduceat(starts[order], first))
+    return properties
+
+
+def detect_markers(mask: np.ndarray, min_area: int = 3, max_area: Optional[int] = 400,
+                   max_aspect: float = 3.0, connectivity: int = 8,
+                   workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Detect the scatter markers of a binary image.
+
+    The connected components are filtered by their area and by the aspect ratio
+    of their bounding box so that the lines and the text are discarded.
+
+    Parameters
+    ----------
+    mask: array-like, shape (n, m)
+        Binary image where the markers are True.
+    min_area: int, optional
+        Minimal number of pixels of a marker.
+    max_area: int, optional
+        Maximal number of pixels of a marker. No maximum if None.
+    max_aspect: float, optional
+        Maximal ratio between the longest and the shortest sides of the bounding box.
+    connectivity: int, optional
+        4 or 8.
+    workers: int, optional
+        Number of threads, see label_runs.
+
+    Returns
+    -------
+    i: array-like
+        Row indexes of the centroids.
+    j: array-like
+        Column indexes of the centroids.
+    """
+    properties = component_properties(mask, connectivity, workers)
+    sides = np.sort(np.column_stack((properties['height'], properties['width'])), axis=1)
+    keep = (properties['area'] >= min_area) & (sides[:, 1] <= max_aspect * sides[:, 0])
+    if max_area is not None:
+        keep &= properties['area'] <= max_area
+    return properties['i'][keep], properties['j'][keep]
@@ -19,146 +19,20 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 Author: Milan Skocic <milan.skocic@gmail.com>
 """
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 
 import sys
 import webbrowser
 import pathlib
-from typing import Union
 import numpy as np
-from matplotlib import image
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.figure import Figure
 
 from . import version
-from .settings import read_cfg, read_profiles, save_cfg
-from .settings import CFG_FOLDER, DEFAULT_PROFILE_VALUES
-from .tests import test_linear, test_ylog, test_loglog, test_xlog
-
-
-class Transform(object):
-    r"""Class for coordinate transformation. See __init__.__doc__."""
-
-    def __init__(self, values_min: float, values_max: float,
-                 pix_min: Union[int, float], pix_max: Union[int, float],
-                 which: str = 'linear'):
-        r"""
-        Transform class converting values coordinates into pixel coordinates.
-
-        Parameters
-        ----------
-        values_min: int, float
-            Minimum value.
-        values_max: int, float
-            Maximum value.
-        pix_min: int, float
-            Minimum pixel.
-        pix_max: int, float
-            Maximum pixel.
-        which: str, optional
-            Which kind of transform i.e. linear or log.
-        """
-
-        if which not in ['linear', 'log']:
-            raise ValueError('which must be either linear or log.')
-
-        self._which = which
-
-        self.x1_min = values_min
-        self.x1_max = values_max
-        self.x2_min = pix_min
-        self.x2_max = pix_max
-
-        self._x1_min = self.x1_min
-        self._x1_max = self.x1_max
-        self._x2_min = self.x2_min
-        self._x2_max = self.x2_max
-
-        if self._which == 'log':
-            self._x1_min = np.log10(values_min)
-            self._x1_max = np.log10(values_max)
-
-        self._dx2 = self._x2_max - self._x2_min
-        self._dx1 = self._x1_max - self._x1_min
-
-    def _prepare_x(self, x: Union[float, int, np.ndarray]):
-        if self._which == 'log':
-            return np.log10(x)
-        else:
-            return x
-
-    def forward(self, x: Union[int, float, np.ndarray]):
-        r"""
-        Transform values to pixels.
-
-        Parameters
-        -----------
-        x: int or floats or array-like, shape(n,)
-            Values to be transformed.
-
-        Returns
-        --------
-        pixels: int or floats or array-like, shape(n,)
-            Values corresponding to the pixels.
-
-        Notes
-        ----------
-        .. math::
-
-            x_{pix} = (x-x_{min})\frac{x_{pix, max} - x_{pix, min}}{x_{max}-x_{min}} + x_{pix,min}
-            
-        """
-        _x = self._prepare_x(x)
-        x_forward = (_x - self._x1_min) * self._dx2 / self._dx1 + self._x2_min
-        return x_forward
-
-    def backward(self, x: Union[int, float, np.ndarray]):
-        r"""
-        Transform pixels to values.
-
-        Parameters
-        -----------
-        x: int or floats or array-like, shape(n,)
-            Pixels to be transformed.
-
-        Returns
-        --------
-        values: int or floats or array-like, shape(n,)
-            Values corresponding to the pixels.
-        
-        Notes
-        ----------
-        .. math::
-
-            x = (x_{pix}-x_{pix, min})\frac{x_{max} - x_{min}}{x_{pix,max}-x_{pix, min}} + x_{min}
-        """
-        x_backward = (x - self._x2_min) * self._dx1 / self._dx2 + self._x1_min
-        if self._which == 'log':
-            return 10 ** x_backward
-        else:
-            return x_backward
-
-    @property
-    def forward_scale(self):
-        r"""Return the scale for transforming values into pixels.
-        
-        .. math::
-
-            \frac{x_{pix, max} - x_{pix, min}}{x_{max}-x_{min}}
-
-        """
-        return self._dx2 / self._dx1
-
-    @property
-    def backward_scale(self):
-        r"""Return the scale for transforming pixels into values.
-        
-        .. math::
-
-            \frac{x_{max} - x_{min}}{x_{pix,max}-x_{pix, min}}
-        
-        """
-        return self._dx1 / self._dx2
+from .core import DTYPES, SERIES_COLORS, LIMITS
+from .core import new_data, add_points, nearest_point, paint_overlay
+from .core import ij_to_xypix, xypix_to_ij, xy_pix_limits, transforms, measure
+from .preprocessing import Pipeline, THRESHOLD_METHODS
+from .profiling import Profiler, PHASES
+from .settings import get_store, DEFAULT_PROFILE_VALUES
 
 
 class FigureFrame(ttk.Frame):
@@ -173,6 +47,9 @@ class FigureFrame(ttk.Frame):
         kwargs: dict, optional
             Keyword arguments for the tk frame.
         """
+        # matplotlib is imported once the window is shown
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
         super().__init__(master, **kwargs)
         self.master = master
 
@@ -200,7 +77,14 @@ class FigureFrame(ttk.Frame):
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(side=tk.TOP, expand=tk.TRUE, fill=tk.BOTH)
 
-        self.toolbar = NavigationToolbar2Tk(self.canvas, container)
+        # the toolbar loads its icons: it is created once the window is shown
+        self.toolbar = None
+        self.after_idle(self._create_toolbar)
+
+    def _create_toolbar(self):
+        r"""Create the toolbar below the figure."""
+        from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self)
         self.toolbar.update()
         self.canvas.get_tk_widget().pack(side=tk.TOP, expand=tk.TRUE, fill=tk.BOTH)
 
@@ -423,7 +307,7 @@ class DataTable(ScrolledFrame):
         ScrolledFrame.__init__(self, master, **kwargs)
         self.pack(expand=tk.TRUE, fill=tk.BOTH)
 
-        self._ncols = 8
+        self._ncols = 9
         self._nrows = 0
         self._headers = None
         self._has_header = False
@@ -555,23 +439,130 @@ class DataWindow(tk.Toplevel):
         self.master.focus_set()
         self.destroy()
 
+
+class ProfilerWindow(tk.Toplevel):
+    r"""Class for the latency debug window. See __init__.__doc__."""
+    def __init__(self, master, profiler: Profiler, interval: int = 1000):
+        r"""
+        Latency debug window showing the rolling histogram of the callback wall times
+        and the median time of each phase per callback.
+
+        Parameters
+        ----------
+        master: tkinter widget
+            Container.
+        profiler: Profiler
+            Profiler recording the callbacks.
+        interval: int, optional
+            Refresh interval in milliseconds.
+        """
+        super().__init__(master)
+
+        self.master = master
+        self.title('Latency')
+        self.protocol("WM_DELETE_WINDOW", self._quit)
+        self._profiler = profiler
+        self._interval = interval
+
+        ws = self.master.winfo_screenwidth()
+        hs = self.master.winfo_screenheight()
+        width = int(0.4*ws)
+        height = int(0.6*hs)
+        self.geometry(f'{width}x{height}')
+
+        self._figframe = FigureFrame(self)
+        self._figframe.pack(fill=tk.BOTH, expand=tk.TRUE)
+        self._tkvar_summary = tk.StringVar()
+        label = ttk.Label(self, textvariable=self._tkvar_summary, font='TkFixedFont')
+        label.configure(anchor='w', justify='left')
+        label.pack(fill=tk.X)
+
+        self._after_id = None
+        self._update()
+
+    def _update(self):
+        counts, edges = self._profiler.histogram()
+        ax = self._figframe.subplot
+        ax.clear()
+        ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge')
+        ax.set_xscale('log')
+        ax.set_xlabel('Callback wall time /ms')
+        ax.set_ylabel('Count')
+        self._figframe.canvas.draw()
+
+        lines = [f'{"callback":<24s}{"n":>6s}' + ''.join(f'{phase:>10s}' for phase in ('total',) + PHASES)]
+        for name, stats in sorted(self._profiler.summary().items()):
+            line = f'{name:<24s}{stats["total"]["count"]:>6d}'
+            line += ''.join(f'{stats[phase]["median"]:>10.2f}' for phase in ('total',) + PHASES)
+            lines.append(line)
+        lines.append('Median wall times in ms.')
+        self._tkvar_summary.set('\n'.join(lines))
+
+        self._after_id = self.after(self._interval, self._update)
+
+    def _quit(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self.master.focus_set()
+        self.destroy()
+
+
+class PaletteWindow(tk.Toplevel):
+    r"""Class for the series colors window. See __init__.__doc__."""
+    def __init__(self, master, colors: np.ndarray, counts: np.ndarray, command):
+        r"""
+        Window listing the proposed colors of the series.
+
+        Parameters
+        ----------
+        master: tkinter widget
+            Container.
+        colors: array-like, shape (k, 3)
+            RGB colors between 0 and 1.
+        counts: array-like, shape (k,)
+            Estimated number of pixels of each color.
+        command: callable
+            Called with the selected color.
+        """
+        super().__init__(master)
+        self.transient(master)
+
+        self.master = master
+        self.title('Series colors')
+        self.protocol("WM_DELETE_WINDOW", self._quit)
+
+        for k, (color, count) in enumerate(zip(colors, counts)):
+            hexcolor = '#' + ''.join(f'{int(round(255 * c)):02x}' for c in color)
+            swatch = tk.Label(self, width=4, background=hexcolor)
+            swatch.grid(row=k, column=0, padx=5, pady=2, sticky='nsew')
+            label = ttk.Label(self, text=f'{hexcolor}  {count:>8d} px', font='TkFixedFont')
+            label.grid(row=k, column=1, padx=5, pady=2, sticky='w')
+            button = ttk.Button(self, text='Extract', command=lambda c=color: command(c))
+            button.grid(row=k, column=2, padx=5, pady=2)
+
+    def _quit(self):
+        self.master.focus_set()
+        self.destroy()
+
+
 class App(ttk.Frame):
     r"""Class for main graphical interface. See __init__.__doc__."""
 
-    def __init__(self, master=None):
+    def __init__(self, master=None, profiler: Profiler = None):
         r"""
         The cursor is used to point a specific position in the graph
         whereas all operations are done through keyboard combinations or through the main menu.
 
         Legend:
 
-        - Red crosses are data points
+        - Red crosses are data points of the first series, other series have their own color
         - Blue crosses are Xmin and Xmax
         - Green crosses are Ymin and Ymax
 
         Commands:
 
         * <Ctrl-o> for loading image.
+        * <Ctrl-PageUp> and <Ctrl-PageDown> for loading the previous and the next pages.
         * <Ctrl-a> add data point.
         * <Hold a+Left Click> add data point.
         * <Left Click> select a data point.
@@ -586,6 +577,11 @@ class App(ttk.Frame):
         * <Ctrl-l> set all limits from last 4 data points or from last 4 selected data points.
         * <Ctrl-n> remove all limits.
 
+        * <Ctrl-e> select all data points of the active series.
+        * <Ctrl-r> refine selected data points or all data points to sub-pixel positions.
+        * <Ctrl-f> detect the scatter markers inside the limits and add them to the active series.
+        * <Ctrl-p> trace the curve passing by the last one or two selected points.
+
         * <Ctrl-z> remove last data point.
         * <Ctrl-d> remove selected data point.
         * <Ctrl-D> remove all data points.
@@ -599,6 +595,9 @@ class App(ttk.Frame):
         ------------
         master: tkinter.Tk instance
             Root instanciation of tkinter.
+        profiler: Profiler, optional
+            Latency recorder of the callbacks. By default, it is enabled by the environment
+            variable DATADIGITIZER_PROFILE.
         """
         # main frame
         ttk.Frame.__init__(self, master)
@@ -610,16 +609,19 @@ class App(ttk.Frame):
         self.url_download = 'http://www.github.com/MilanSkocic/PyDatadigitizer'
         self.url = 'https://milanskocic.github.io/PyDatadigitizer/index.html'
         self._filepath = None
+        self._document = None
+        self._page = 0
 
-        # profiles
-        self._profiles_ini = read_profiles()
+        # instrumentation of the callbacks before binding them
+        self._profiler = Profiler.from_environ() if profiler is None else profiler
+        if self._profiler.enabled:
+            for name in dir(self):
+                if name.startswith('_cb_'):
+                    setattr(self, name, self._profiler.wrap(getattr(self, name), name))
 
-        # folders configuration
-        profile_name = 'folders'
-        self._folders_profile = read_cfg(cfg_folder=CFG_FOLDER,
-                                         cfg_name=profile_name,
-                                         cfg_default=DEFAULT_PROFILE_VALUES[profile_name],
-                                         update=True)
+        # profiles and folders configuration are read once the window is shown
+        self._settings = get_store()
+        self._folders_profile_name = None
 
         # bindings
         self.master.bind('<Control-o>', self._cb_open)
@@ -637,6 +639,12 @@ class App(ttk.Frame):
         self.master.bind('<Control-n>', self._cb_delete_limits)
         self.master.bind('<Control-z>', self._cb_undo)
         self.master.bind('<Control-t>', self._cb_datatable)
+        self.master.bind('<Control-r>', self._cb_refine)
+        self.master.bind('<Control-e>', self._cb_select_series)
+        self.master.bind('<Control-f>', self._cb_detect_markers)
+        self.master.bind('<Control-p>', self._cb_trace)
+        self.master.bind('<Control-Prior>', self._cb_previous_page)
+        self.master.bind('<Control-Next>', self._cb_next_page)
 
         # get screen width and height
         ws = self.master.winfo_screenwidth()
@@ -655,32 +663,31 @@ class App(ttk.Frame):
         tk.Grid.rowconfigure(self, 1, weight=0)
 
         # flags and variables
-        profile_type = 'folders'
-        folders_profile_name = self._profiles_ini.defaults()[profile_type].upper()
-        self._image_folder = self._folders_profile.get_typed_option(section=folders_profile_name,
-                                                                    option='image folder')
-        self._image_name = self._folders_profile.get_typed_option(section=folders_profile_name,
-                                                                  option = 'image name')
-        self._data_folder = self._folders_profile.get_typed_option(section=folders_profile_name,
-                                                                  option = 'data folder')
-        self._data_name = self._folders_profile.get_typed_option(section=folders_profile_name,
-                                                                  option = 'data name')
+        default_folders = DEFAULT_PROFILE_VALUES['folders']['DEFAULT']
+        self._image_folder = default_folders['image folder']
+        self._image_name = default_folders['image name']
+        self._data_folder = default_folders['data folder']
+        self._data_name = default_folders['data name']
         self._axes_image = None
         self._axes_image_threshold = None
+        self._image_array = None
+        self._pipeline = Pipeline()
+        self._refine_half_width = 5
+        self._marker_min_area = 3
+        self._marker_max_area = 400
+        self._marker_max_aspect = 3.0
+        self._trace_step = 3.0
+        self._color_tolerance = 0.25
+        self._vector_scale = 2.0
         # self._data_indexes = []
         self._percentage = 0.01
         self._percentage_shift = 0.05
         self.R, self.G, self.B, self.alpha = 0, 1, 2, 3
-        self.dtypes = [('type', 'U32'),
-                       ('i', 'i4'),
-                       ('j', 'i4'),
-                       ('Xpix', 'i4'),
-                       ('Ypix', 'i4'),
-                       ('x', 'f8'),
-                       ('y', 'f8'),
-                       ('selected', 'i2')]
-        self._line = np.zeros(shape=(1,), dtype=self.dtypes)
-        self._data_array = np.zeros(shape=(0,), dtype=self.dtypes)
+        self.dtypes = DTYPES
+        self._data_array = new_data()
+        self._series_names = ['Series 1']
+        self._active_series = 0
+        self._series_colors = SERIES_COLORS
         self._triggered_event = None
         self.row = None
         self.col = None
@@ -696,6 +703,26 @@ class App(ttk.Frame):
         self.menubar.add_cascade(menu=self.file_menu, label='File')
         self.file_menu.add_command(label='Load Image <Ctrl-o>', command=self._trigger_load_event)
         self.file_menu.add_command(label='Save Data <Ctrl-s>', command=self._trigger_save_event)
+        self._tkvar_export_format = tk.StringVar()
+        self._tkvar_export_format.set('long')
+        self.export_menu = tk.Menu(self.file_menu)
+        self.file_menu.add_cascade(menu=self.export_menu, label='Export Format')
+        self.export_menu.add_radiobutton(label='Long format', value='long',
+                                         variable=self._tkvar_export_format)
+        self.export_menu.add_radiobutton(label='Column blocks per series', value='blocks',
+                                         variable=self._tkvar_export_format)
+        self._grid = None
+        self.export_menu.add_radiobutton(label='Series resampled onto a grid...', value='grid',
+                                         variable=self._tkvar_export_format, command=self._set_grid)
+        self._tkvar_decimation = tk.StringVar()
+        self._tkvar_decimation.set('none')
+        self._decimation_value = None
+        self.decimation_menu = tk.Menu(self.file_menu)
+        self.file_menu.add_cascade(menu=self.decimation_menu, label='Decimation')
+        for label, value in (('None', 'none'), ('Uniform in x...', 'uniform'),
+                             ('Ramer-Douglas-Peucker...', 'rdp'), ('Maximum number of points...', 'max')):
+            self.decimation_menu.add_radiobutton(label=label, value=value, variable=self._tkvar_decimation,
+                                                 command=self._set_decimation)
         self.file_menu.add_command(label='Clear All <Ctrl-w>', command=self._trigger_clearall_event)
         self.file_menu.add_command(label='Quit <Ctrl-q>', command=self.stop)
 
@@ -711,6 +738,18 @@ class App(ttk.Frame):
         self.data_menu.add_command(label='Remove selected <Ctrl-d>',
                                    command=self._trigger_delete_selected_event)
         self.data_menu.add_separator()
+        self.data_menu.add_command(label='New series', command=self._new_series)
+        self.data_menu.add_command(label='Select series <Ctrl-e>',
+                                   command=self._trigger_select_series_event)
+        self.data_menu.add_separator()
+        self.data_menu.add_command(label='Refine points <Ctrl-r>',
+                                   command=self._trigger_refine_event)
+        self.data_menu.add_command(label='Detect markers <Ctrl-f>',
+                                   command=self._trigger_detect_markers_event)
+        self.data_menu.add_command(label='Trace curve <Ctrl-p>',
+                                   command=self._trigger_trace_event)
+        self.data_menu.add_command(label='Series colors', command=self._discover_colors)
+        self.data_menu.add_separator()
         self.data_menu.add_command(label='Set Xmin <Ctrl-g>', 
                                    command=self._trigger_xmin_event)
         self.data_menu.add_command(label='Set Xmax <Ctrl-h>', 
@@ -723,12 +762,47 @@ class App(ttk.Frame):
                                    command=self._trigger_all_limits_event)
         self.data_menu.add_command(label='Remove all limits <Ctrl-n>',
                                    command=self._trigger_delete_all_limits_event)
+        self.data_menu.add_command(label='Save calibration template', command=self._save_template)
+        self.data_menu.add_command(label='Apply calibration template', command=self._apply_template)
         self.data_menu.add_separator()
         self.data_menu.add_command(label='Compute <Ctrl-m>', 
                                    command=self._trigger_measure_event)
         self.data_menu.add_command(label='View Data <Ctrl-t>', 
                                    command=self._trigger_datatable_event)
 
+        # Image Menu
+        self.image_menu = tk.Menu(self.menubar)
+        self.menubar.add_cascade(menu=self.image_menu, label='Image')
+        self._tkvar_display_stage = tk.StringVar()
+        self._tkvar_display_stage.set('image')
+        self.display_menu = tk.Menu(self.image_menu)
+        self.image_menu.add_cascade(menu=self.display_menu, label='Display')
+        for stage, label in Pipeline.LABELS.items():
+            self.display_menu.add_radiobutton(label=label, value=stage,
+                                              variable=self._tkvar_display_stage,
+                                              command=self._display_stage)
+        self._tkvar_threshold = tk.StringVar()
+        self._tkvar_threshold.set(Pipeline.DEFAULTS['threshold'])
+        self.threshold_menu = tk.Menu(self.image_menu)
+        self.image_menu.add_cascade(menu=self.threshold_menu, label='Threshold')
+        for method in THRESHOLD_METHODS:
+            self.threshold_menu.add_radiobutton(label=method.capitalize(), value=method,
+                                                variable=self._tkvar_threshold,
+                                                command=self._update_pipeline)
+        self._tkvar_background = tk.BooleanVar()
+        self._tkvar_background.set(False)
+        self.image_menu.add_checkbutton(label='Subtract background', variable=self._tkvar_background,
+                                        command=self._update_pipeline)
+        self._tkvar_remove_grid = tk.BooleanVar()
+        self._tkvar_remove_grid.set(False)
+        self.image_menu.add_checkbutton(label='Remove grid lines', variable=self._tkvar_remove_grid,
+                                        command=self._update_pipeline)
+        self.image_menu.add_separator()
+        self.image_menu.add_command(label='Previous page <Ctrl-PageUp>',
+                                    command=self._trigger_previous_page_event)
+        self.image_menu.add_command(label='Next page <Ctrl-PageDown>',
+                                    command=self._trigger_next_page_event)
+
         # Test Menu
         self.test_menu = tk.Menu(self.menubar)
         self.menubar.add_cascade(menu=self.test_menu, label='Tests')
@@ -737,6 +811,14 @@ class App(ttk.Frame):
         self.test_menu.add_command(label="Test XLog", command=self._test_xlog)
         self.test_menu.add_command(label="Test LogLog", command=self._test_loglog)
 
+        # Debug Menu
+        if self._profiler.enabled:
+            self.debug_menu = tk.Menu(self.menubar)
+            self.menubar.add_cascade(menu=self.debug_menu, label='Debug')
+            self.debug_menu.add_command(label='Latency', command=self._latency)
+            self.debug_menu.add_command(label='Dump timings', command=self._dump_timings)
+            self.debug_menu.add_command(label='Start cProfile capture', command=self._toggle_cprofile)
+
         # Help Menu
         self.help_menu = tk.Menu(self.menubar)
         self.menubar.add_cascade(menu=self.help_menu, label='Help')
@@ -889,6 +971,29 @@ class App(ttk.Frame):
         label = ttk.Label(container, textvariable=self._tkvar_npoints)
         label.grid(row=row, column=1, sticky='nswe')
 
+        row += 1
+        ttk.Label(container, text='Page=').grid(row=row, column=0, sticky='nswe')
+        self._tkvar_page = tk.StringVar()
+        self._tkvar_page.set('')
+        label = ttk.Label(container, textvariable=self._tkvar_page)
+        label.grid(row=row, column=1, sticky='nswe')
+
+        row += 1
+        ttk.Label(container, text='Series').grid(row=row, column=0, sticky='nswe')
+        self._tkvar_series = tk.StringVar()
+        self._series_combobox = ttk.Combobox(container, textvariable=self._tkvar_series)
+        self._series_combobox.grid(row=row, column=1, sticky='nswe')
+        self._series_combobox.bind('<<ComboboxSelected>>', self._cb_series_selected)
+        self._series_combobox.bind('<Return>', self._cb_series_renamed)
+
+        row += 1
+        self._tkvar_subpixel = tk.BooleanVar()
+        self._tkvar_subpixel.set(False)
+        self._subpixel_cb = ttk.Checkbutton(container,
+                                            variable=self._tkvar_subpixel,
+                                            text='Sub-pixel refinement?')
+        self._subpixel_cb.grid(row=row, column=0, columnspan=2, sticky='nswe')
+
         row += 1
         sep = ttk.Separator(container, orient="horizontal")
         sep.grid(row=row, column=0, columnspan=2, sticky='nswe', pady=30)
@@ -920,18 +1025,42 @@ class App(ttk.Frame):
 
         self._reset_ui()
 
+        self.after_idle(self._load_folders)
+
+    def _load_folders(self):
+        r"""Read the profiles and the folders configuration if not yet done."""
+        if self._folders_profile_name is not None:
+            return
+
+        profile_type = 'folders'
+        name = str(self._settings.get('profiles', 'DEFAULT', profile_type)).upper()
+        self._image_folder = self._settings.get(profile_type, name, 'image folder')
+        self._image_name = self._settings.get(profile_type, name, 'image name')
+        self._data_folder = self._settings.get(profile_type, name, 'data folder')
+        self._data_name = self._settings.get(profile_type, name, 'data name')
+        self._folders_profile_name = name
+
     def _reset_ui(self):
 
         self._tkvar_log_xscale.set(False)
         self._tkvar_log_yscale.set(False)
 
         self._tkvar_npoints.set(0)
+        self._tkvar_page.set('')
 
         self._tkvar_xmin.set(0.0)
         self._tkvar_xmax.set(1.0)
         self._tkvar_ymin.set(0.0)
         self._tkvar_ymax.set(1.0)
 
+        self._series_names = ['Series 1']
+        self._active_series = 0
+        self._update_series_combobox()
+
+    def _update_series_combobox(self):
+        self._series_combobox.configure(values=self._series_names)
+        self._tkvar_series.set(self._series_names[self._active_series])
+
     def _about(self):
         AboutWindow(self)
 
@@ -1008,20 +1137,18 @@ class App(ttk.Frame):
             if event.button == 1:
                 if (event.xdata is not None) and (event.ydata is not None):
                     if self._data_array.size:
-                        y = int(round(event.xdata, 0))
-                        x = int(round(event.ydata, 0))
                         dx_lim = int(self.row * self._percentage)
                         dy_lim = int(self.col * self._percentage)
                         dxy_lim = np.sqrt(dx_lim**2 + dy_lim**2)
-                        dx = x - self._data_array['i']
-                        dy = y - self._data_array['j']
-                        dxy = np.sqrt(dx**2 + dy**2)
-                        ix = np.argmin(dxy)
-                        if dxy[ix] <= dxy_lim:
+                        ix, dxy = nearest_point(self._data_array, event.ydata, event.xdata)
+                        if dxy <= dxy_lim:
                             if not self._ctrl_key_pressed:
                                 self._data_array['selected'] = 0
                             arr = self._data_array['selected'][ix]
                             self._data_array['selected'][ix] = np.logical_not(arr)
+                            if self._data_array['type'][ix] == 'data':
+                                self._active_series = int(self._data_array['series'][ix])
+                                self._update_series_combobox()
                         else:
                             self._data_array['selected'] = 0
 
@@ -1078,6 +1205,39 @@ class App(ttk.Frame):
             datawindow = DataWindow(self)
             datawindow.datatable.set_new_data(self._data_array)
 
+    def _cb_select_series(self, event):
+        self._triggered_event = event
+        self._select_series()
+
+    def _cb_series_selected(self, event):
+        self._triggered_event = event
+        self._active_series = self._series_combobox.current()
+        self._canvas_widget.focus_set()
+
+    def _cb_series_renamed(self, event):
+        self._triggered_event = event
+        self._rename_series(self._tkvar_series.get())
+
+    def _cb_refine(self, event):
+        self._triggered_event = event
+        self._refine()
+
+    def _cb_detect_markers(self, event):
+        self._triggered_event = event
+        self._detect_markers()
+
+    def _cb_previous_page(self, event):
+        self._triggered_event = event
+        self._change_page(-1)
+
+    def _cb_next_page(self, event):
+        self._triggered_event = event
+        self._change_page(1)
+
+    def _cb_trace(self, event):
+        self._triggered_event = event
+        self._trace()
+
     def _cb_quit(self, event):
         self._triggered_event = event
         self.stop()
@@ -1127,12 +1287,33 @@ class App(ttk.Frame):
     def _trigger_datatable_event(self):
         self.master.event_generate('<Control-t>')
 
+    def _trigger_select_series_event(self):
+        self.master.event_generate('<Control-e>')
+
+    def _trigger_refine_event(self):
+        self.master.event_generate('<Control-r>')
+
+    def _trigger_detect_markers_event(self):
+        self.master.event_generate('<Control-f>')
+
+    def _trigger_trace_event(self):
+        self.master.event_generate('<Control-p>')
+
+    def _trigger_previous_page_event(self):
+        self.master.event_generate('<Control-Prior>')
+
+    def _trigger_next_page_event(self):
+        self.master.event_generate('<Control-Next>')
+
     def _open_image(self):
+        self._load_folders()
         _filepath = filedialog.askopenfilename(title='Open Plot',
                                                defaultextension='.png',
                                                filetypes=[('png', '.png'),
                                                           ('jpeg', '.jpeg'),
                                                           ('tif', '.tif'),
+                                                          ('svg', '.svg'),
+                                                          ('pdf', '.pdf'),
                                                           ('all files', '.*')],
                                                initialdir=self._image_folder,
                                                parent=self)
@@ -1140,12 +1321,25 @@ class App(ttk.Frame):
             self._filepath = pathlib.Path(_filepath).absolute()
         else:
             self._filepath = None
+        # a reopened document starts again from its first page
+        if self._document is not None:
+            self._document.close()
+            self._document = None
 
     def _load_image(self):
         r"""load image"""
+        from .pages import Document
         self._clear_all()
         if self._filepath is not None:
-            image_array = image.imread(str(self._filepath))
+            if self._document is None or self._document.fpath != self._filepath:
+                # only the displayed page of the document is decoded
+                if self._document is not None:
+                    self._document.close()
+                self._document = Document(self._filepath, self._vector_scale)
+                self._page = 0
+            # the vector figures are rasterized only for the display
+            image_array, figure = self._document.page(self._page)
+            self._tkvar_page.set(f'{self._page + 1}/{len(self._document)}')
             shape = image_array.shape
             dim = len(shape)
             if dim > 1:
@@ -1155,32 +1349,208 @@ class App(ttk.Frame):
                 image_threshold = np.zeros(shape=(self.row, self.col, 4))
                 self._axes_image = self._ax.imshow(image_array, cmap='Greys_r')
                 self._axes_image_threshold = self._ax.imshow(image_threshold)
+                self._image_array = image_array
+                self._pipeline.set_image(image_array)
+                self._update_pipeline()
                 self._ax.relim()
-                self._canvas.draw()
+                with self._profiler.phase('draw'):
+                    self._canvas.draw()
+                if figure is not None:
+                    self._load_vector_data(figure)
             else:
                 messagebox.showinfo("Infos", f"{self._filepath} is not a valid image (ndim={dim}).")
             self._image_folder = self._filepath.parent
             self._image_name = self._filepath.name
 
-    def _ij_to_xypix(self, i: int, j: int):
-        """Convert matrix indexes i,j into graph pixels."""
-        xpix = j
-        ypix = self.row - i
+    def _change_page(self, step: int):
+        r"""Load another page of the document, the data of the current page are cleared."""
+        if self._document is not None and 0 <= self._page + step < len(self._document):
+            self._page += step
+            self._load_image()
+
+    def _load_vector_data(self, figure):
+        r"""Fill the data with the exact paths and the limits given by the ticks of a vector figure."""
+        data, calibration = figure.to_data(self._vector_scale, self.row)
+        self._data_array = data
+        nseries = int(data['series'][data['type'] == 'data'].max()) + 1 if np.any(data['type'] == 'data') else 1
+        self._series_names = [f'Series {k + 1}' for k in range(nseries)]
+        self._active_series = 0
+        self._update_series_combobox()
+        if calibration is not None:
+            self._tkvar_xmin.set(calibration.xvalues[0])
+            self._tkvar_xmax.set(calibration.xvalues[1])
+            self._tkvar_ymin.set(calibration.yvalues[0])
+            self._tkvar_ymax.set(calibration.yvalues[1])
+            self._tkvar_log_xscale.set(calibration.xlog)
+            self._tkvar_log_yscale.set(calibration.ylog)
+        self._display_data()
 
-        return xpix, ypix
+    def _ij_to_xypix(self, i: float, j: float):
+        """Convert matrix indexes i,j into graph pixels."""
+        return ij_to_xypix(i, j, self.row)
 
     def _xypix_to_ij(self, xpix, ypix):
         """Convert graph pixels into matrix indexes."""
-        i = self.row - ypix
-        j = xpix
-
-        return i, j
+        return xypix_to_ij(xpix, ypix, self.row)
+
+    def _gray(self):
+        r"""Return the grayscale version of the loaded image."""
+        return self._pipeline.get('gray')
+
+    def _update_pipeline(self):
+        r"""Set the preprocessing parameters from the Image menu and refresh the displayed stage."""
+        size = max(self.row or 0, self.col or 0)
+        self._pipeline.set_params(threshold=self._tkvar_threshold.get(),
+                                  background_size=(size // 50) | 1 if self._tkvar_background.get() else 0,
+                                  grid_length=size // 4 if self._tkvar_remove_grid.get() else 0)
+        self._display_stage()
+
+    def _display_stage(self):
+        r"""Display the selected preprocessing stage in place of the raw image."""
+        if self._axes_image is not None:
+            stage = self._tkvar_display_stage.get()
+            output = self._pipeline.get(stage)
+            if output.dtype == np.bool_:
+                # ink in black as in the raw image
+                output = np.where(output, 0.0, 1.0)
+            self._axes_image.set_data(output)
+            if stage != 'image':
+                self._axes_image.set_cmap('gray')
+                self._axes_image.set_clim(0.0, 1.0)
+            else:
+                self._axes_image.set_cmap('Greys_r')
+                self._axes_image.autoscale()
+            if self._profiler.enabled:
+                # draw_idle only schedules the draw: it is timed synchronously when profiling
+                with self._profiler.phase('draw'):
+                    self._canvas.draw()
+            else:
+                self._canvas.draw_idle()
 
-    def _add_data(self, i: int, j: int):
+    def _add_data(self, i: float, j: float):
         r"""Add a point."""
-        xpix, ypix = self._ij_to_xypix(i, j)
-        self._line[0] = ('data', i, j, xpix, ypix, 0, 0, 0)
-        self._data_array = np.append(self._data_array, self._line)
+        from .imaging import refine_centroid
+        if self._tkvar_subpixel.get():
+            i, j = refine_centroid(self._gray(), i, j, half_width=self._refine_half_width)
+        self._data_array = add_points(self._data_array, i, j, self.row,
+                                      series=self._active_series)
+        self._display_data()
+
+    def _refine(self):
+        r"""Refine the selected points or all the points to sub-pixel positions."""
+        from .imaging import refine_centroid
+        if self._data_array.size and (self._image_array is not None):
+            mask = self._data_array['selected'] == 1
+            if not mask.any():
+                mask = self._data_array['type'] == 'data'
+            i, j = refine_centroid(self._gray(),
+                                   self._data_array['i'][mask],
+                                   self._data_array['j'][mask],
+                                   half_width=self._refine_half_width)
+            xpix, ypix = self._ij_to_xypix(i, j)
+            self._data_array['i'][mask] = i
+            self._data_array['j'][mask] = j
+            self._data_array['Xpix'][mask] = xpix
+            self._data_array['Ypix'][mask] = ypix
+            self._display_data()
+
+    def _detect_markers(self):
+        r"""Detect the scatter markers and add them to the active series in one insertion."""
+        from .extraction import detect_markers
+        if self._image_array is not None:
+            # the binary stages are memoized: only the changed stages are recomputed
+            mask = np.zeros(self._image_array.shape[:2], dtype=bool)
+            imin, imax, jmin, jmax = self._limits_bounds() or (0, self.row, 0, self.col)
+            mask[imin:imax, jmin:jmax] = self._pipeline.get('nogrid')[imin:imax, jmin:jmax]
+            i, j = detect_markers(mask, min_area=self._marker_min_area,
+                                  max_area=self._marker_max_area,
+                                  max_aspect=self._marker_max_aspect)
+            if i.size:
+                self._data_array = add_points(self._data_array, i, j, self.row,
+                                              series=self._active_series)
+                self._display_data()
+            else:
+                messagebox.showinfo("Infos", "No marker detected.")
+
+    def _limits_bounds(self):
+        r"""Return the bounds of the rectangle inside the limits or None if they are not all set."""
+        from .extraction import crop_bounds
+        limits = self._data_array[self._data_array['type'] != 'data']
+        if limits.size == 4:
+            return crop_bounds(limits['i'], limits['j'], self._image_array.shape)
+        return None
+
+    def _trace(self):
+        r"""Replace the last one or two selected points, or the last point, by the traced curve."""
+        from .tracing import trace
+        if self._image_array is not None:
+            is_data = self._data_array['type'] == 'data'
+            seeds = np.flatnonzero(is_data & (self._data_array['selected'] == 1))[-2:]
+            if seeds.size == 0:
+                seeds = np.flatnonzero(is_data & (self._data_array['series'] == self._active_series))[-1:]
+            if seeds.size == 0:
+                messagebox.showinfo("Infos", "Add or select one or two points on the curve.")
+                return
+            i, j = trace(self._image_array,
+                         list(zip(self._data_array['i'][seeds], self._data_array['j'][seeds])),
+                         step=self._trace_step, bounds=self._limits_bounds())
+            data = np.delete(self._data_array, seeds)
+            self._data_array = add_points(data, i, j, self.row, series=self._active_series)
+            self._display_data()
+
+    def _discover_colors(self):
+        r"""Propose the colors of the series found inside the limits."""
+        from .palette import discover_colors
+        if self._image_array is not None:
+            colors, counts = discover_colors(self._image_array, bounds=self._limits_bounds())
+            if colors.shape[0]:
+                PaletteWindow(self, colors, counts, self._extract_color)
+            else:
+                messagebox.showinfo("Infos", "No series color found.")
+
+    def _extract_color(self, color: np.ndarray):
+        r"""Extract the pixels of a color into the active series, or a new one if it has points."""
+        from .extraction import extract_color
+        if self._image_array is not None:
+            i, j = extract_color(self._image_array, color, self._color_tolerance,
+                                 bounds=self._limits_bounds())
+            if i.size:
+                if np.any((self._data_array['type'] == 'data')
+                          & (self._data_array['series'] == self._active_series)):
+                    self._new_series()
+                self._data_array = add_points(self._data_array, i, j, self.row,
+                                              series=self._active_series)
+                self._display_data()
+            else:
+                messagebox.showinfo("Infos", "No pixel of this color.")
+
+    def _new_series(self):
+        r"""Add a new series and make it active."""
+        k = len(self._series_names) + 1
+        name = f'Series {k}'
+        while name in self._series_names:
+            k += 1
+            name = f'Series {k}'
+        self._series_names.append(name)
+        self._active_series = len(self._series_names) - 1
+        self._update_series_combobox()
+        self._canvas_widget.focus_set()
+
+    def _rename_series(self, name: str):
+        r"""Rename the active series."""
+        name = name.strip()
+        if (len(name) == 0) or (name in self._series_names):
+            messagebox.showinfo("Infos", "Series names must be unique and not empty.")
+        else:
+            self._series_names[self._active_series] = name
+        self._update_series_combobox()
+        self._canvas_widget.focus_set()
+
+    def _select_series(self):
+        r"""Select all the points of the active series."""
+        mask = (self._data_array['type'] == 'data') \
+               & (self._data_array['series'] == self._active_series)
+        self._data_array['selected'] = mask
         self._display_data()
 
     def _undo(self):
@@ -1236,11 +1606,12 @@ class App(ttk.Frame):
         self._ax.clear()
         self._axes_image = None
         self._axes_image_threshold = None
+        self._image_array = None
+        self._pipeline.set_image(None)
         self.row = None
         self.col = None
-        self._line = np.zeros(shape=(1,), dtype=self.dtypes)
 
-        self._data_array = np.zeros(shape=(0,), dtype=self.dtypes)
+        self._data_array = new_data()
         self._ax.set_axis_off()
 
         self._reset_ui()
@@ -1273,35 +1644,10 @@ class App(ttk.Frame):
     def _display_data(self):
 
         array = self._axes_image_threshold.get_array()
-        array[:, :, :] = 0
-        channel = self.R
         dx = int(self.row * self._percentage)
         dy = int(self.col * self._percentage)
-
-        # display not displayed
-        for ix in np.ndindex(self._data_array.shape):
-            if self._data_array['type'][ix] == 'data':
-                channel = self.R
-            elif (self._data_array['type'][ix] == 'xmin') \
-                 | (self._data_array['type'][ix] == 'xmax'):
-                channel = self.B
-            elif (self._data_array['type'][ix] == 'ymin') \
-                 | (self._data_array['type'][ix] == 'ymax'):
-                channel = self.G
-            x = self._data_array['i'][ix]
-            y = self._data_array['j'][ix]
-
-            if self._data_array['selected'][ix]:
-                xmask = slice(x - dx*2, x + dx*2 + 1)
-                ymask = slice(y - dy*2, y + dy*2 + 1)
-            else:
-                xmask = slice(x - dx, x + dx + 1)
-                ymask = slice(y - dy, y + dy + 1)
-
-            array[xmask, y, self.alpha] = 1
-            array[xmask, y, channel] = 1
-            array[x, ymask, self.alpha] = 1
-            array[x, ymask, channel] = 1
+        with self._profiler.phase('paint'):
+            paint_overlay(array, self._data_array, dx, dy, self._series_colors)
 
         mask = self._data_array['type'] == 'data'
         self._tkvar_npoints.set(mask.sum())
@@ -1332,24 +1678,7 @@ class App(ttk.Frame):
             self._measure()
 
     def _xy_pix_limits(self):
-
-        mask_xmin = self._data_array['type'] == 'xmin'
-        mask_xmax = self._data_array['type'] == 'xmax'
-        mask_ymin = self._data_array['type'] == 'ymin'
-        mask_ymax = self._data_array['type'] == 'ymax'
-
-        if (mask_xmin.sum() == 1.0) and (mask_xmax.sum() == 1.0) and (mask_ymin.sum() == 1.0) and (
-                mask_ymax.sum() == 1.0):
-            xpix_min = self._data_array['Xpix'][mask_xmin][0]
-            xpix_max = self._data_array['Xpix'][mask_xmax][0]
-
-            ypix_min = self._data_array['Ypix'][mask_ymin][0]
-            ypix_max = self._data_array['Ypix'][mask_ymax][0]
-
-        else:
-            raise ValueError('X limits and Y limits must be set.')
-
-        return xpix_min, xpix_max, ypix_min, ypix_max
+        return xy_pix_limits(self._data_array)
 
     def _xy_values_limits(self):
         r"""if an error happens a tk.TclError will be raised."""
@@ -1380,38 +1709,23 @@ class App(ttk.Frame):
         """
         flag = False
         try:
-            xpix_min, xpix_max, ypix_min, ypix_max = self._xy_pix_limits()
             xvalue_min, xvalue_max, yvalue_min, yvalue_max = self._xy_values_limits()
+            xtrans, ytrans = measure(self._data_array,
+                                     xvalues=(xvalue_min, xvalue_max),
+                                     yvalues=(yvalue_min, yvalue_max),
+                                     xlog=self._tkvar_log_xscale.get(),
+                                     ylog=self._tkvar_log_yscale.get())
 
-            xpix = self._data_array['Xpix']
-            ypix = self._data_array['Ypix']
-
-            which = 'linear'
             unit = f'{self._xunit_entry.get()}/pixel'
             if self._tkvar_log_xscale.get():
-                which = 'log'
                 unit = f'{self._xunit_entry.get():s}/pixel (log scale)'
-            trans = Transform(values_min=xvalue_min,
-                              values_max=xvalue_max,
-                              pix_min=xpix_min,
-                              pix_max=xpix_max,
-                              which=which)
-            self._data_array['x'] = trans.backward(xpix)
-            msg = f'{trans.backward_scale}' + ' ' + unit
+            msg = f'{xtrans.backward_scale}' + ' ' + unit
             self._ax.set_xlabel(msg)
 
-            which = 'linear'
             unit = f'{self._yunit_entry.get()}/pixel'
             if self._tkvar_log_yscale.get():
-                which = 'log'
                 unit = f'{self._yunit_entry.get()}/pixel (log scale)'
-            trans = Transform(values_min=yvalue_min,
-                              values_max=yvalue_max,
-                              pix_min=ypix_min,
-                              pix_max=ypix_max,
-                              which=which)
-            self._data_array['y'] = trans.backward(ypix)
-            msg = f'{trans.backward_scale}' + ' ' + unit
+            msg = f'{ytrans.backward_scale}' + ' ' + unit
             self._ax.set_ylabel(msg)
 
             flag = True
@@ -1430,29 +1744,16 @@ class App(ttk.Frame):
         flag = False
 
         try:
-            xpix_min, xpix_max, ypix_min, ypix_max = self._xy_pix_limits()
             xvalue_min, xvalue_max, yvalue_min, yvalue_max = self._xy_values_limits()
             xtest_value, ytest_value = self._xy_test_values()
 
-            which = 'linear'
-            if self._tkvar_log_xscale.get():
-                which = 'log'
-            trans = Transform(values_min=xvalue_min,
-                              values_max=xvalue_max,
-                              pix_min=xpix_min,
-                              pix_max=xpix_max,
-                              which=which)
-            xpix = trans.forward(xtest_value)
-
-            which = 'linear'
-            if self._tkvar_log_yscale.get():
-                which = 'log'
-            trans = Transform(values_min=yvalue_min,
-                              values_max=yvalue_max,
-                              pix_min=ypix_min,
-                              pix_max=ypix_max,
-                              which=which)
-            ypix = trans.forward(ytest_value)
+            xtrans, ytrans = transforms(self._data_array,
+                                        xvalues=(xvalue_min, xvalue_max),
+                                        yvalues=(yvalue_min, yvalue_max),
+                                        xlog=self._tkvar_log_xscale.get(),
+                                        ylog=self._tkvar_log_yscale.get())
+            xpix = xtrans.forward(xtest_value)
+            ypix = ytrans.forward(ytest_value)
             flag = True
             i,j = self._xypix_to_ij(xpix, ypix)
             self._add_data(i, j)
@@ -1465,6 +1766,8 @@ class App(ttk.Frame):
 
     def _save(self):
         """Save data."""
+        from .export import save_data, decimate
+        self._load_folders()
         _filepath = filedialog.asksaveasfilename(title='Open Plot',
                                                  defaultextension='.txt',
                                                  filetypes=[('txt', '.txt'),
@@ -1474,53 +1777,166 @@ class App(ttk.Frame):
 
         if len(_filepath) > 0:
             filepath = pathlib.Path(_filepath).absolute()
-            info = version.__package_name__ + "-" + version.__version__
-            
-            names = list(self._data_array.dtype.names)
-            names[5] = names[5] + f' /{self._xunit_entry.get()}'
-            names[6] = names[6] + f' /{self._yunit_entry.get()}'
-            
-            col_names = '\t'.join(names)
-            header = '\n'.join((info, col_names))
-            
-            mask = self._data_array['type'] == 'data'
-            mask_sort = np.argsort(self._data_array['x'][mask])
-            sorted_data = self._data_array[mask][mask_sort].copy()
-            self._data_array[mask][mask_sort] = sorted_data
-            
-            np.savetxt(filepath, X=self._data_array,
-                       header=header,
-                       fmt=('%s', '%d', '%d', '%d', '%d', '%.6e', '%.6e', '%d'),
-                       delimiter='\t',
-                       comments='#')
+            data = self._data_array
+            method = self._tkvar_decimation.get()
+            fmt = self._tkvar_export_format.get()
+            if method != 'none' or fmt == 'grid':
+                # the decimation and the resampling work on the values
+                if not self._measure():
+                    return
+                data = decimate(data, method, self._decimation_value,
+                                self._tkvar_log_xscale.get(), self._tkvar_log_yscale.get())
+            save_data(filepath, data, self._series_names,
+                      xunit=self._xunit_entry.get(),
+                      yunit=self._yunit_entry.get(),
+                      fmt=fmt, grid=self._grid,
+                      xlog=self._tkvar_log_xscale.get(), ylog=self._tkvar_log_yscale.get())
             self._data_folder = filepath.parent
             self._data_name = filepath.name
 
+    def _set_decimation(self):
+        r"""Ask the value of the selected decimation method applied when saving."""
+        method = self._tkvar_decimation.get()
+        if method == 'max':
+            value = simpledialog.askinteger('Decimation', 'Maximal number of points per series:',
+                                            minvalue=2, initialvalue=1000, parent=self)
+        elif method != 'none':
+            prompt = 'Width of the x intervals' if method == 'uniform' else 'Tolerance'
+            value = simpledialog.askfloat('Decimation', f'{prompt} in data units (decades on log axes):',
+                                          minvalue=0.0, parent=self)
+        else:
+            value = None
+        if method != 'none' and not value:
+            self._tkvar_decimation.set('none')
+            value = None
+        self._decimation_value = value
+
+    def _set_grid(self):
+        r"""Ask the x values onto which the series are resampled when saving."""
+        from .export import parse_grid
+        spacing = 'log' if self._tkvar_log_xscale.get() else 'linear'
+        text = simpledialog.askstring('Grid', f'start:stop:number of points ({spacing} spacing) '
+                                              'or list of x values:', parent=self)
+        try:
+            self._grid = None if not text else parse_grid(text, spacing)
+        except ValueError as e:
+            messagebox.showwarning('Warning', e)
+            self._grid = None
+        if self._grid is None:
+            self._tkvar_export_format.set('long')
+
+    def _save_template(self):
+        r"""Save the limits, their values, the units and the log flags as a calibration template."""
+        from .templates import Template, template_folder, TEMPLATE_SUFFIX
+        if self._image_array is not None:
+            try:
+                xvalue_min, xvalue_max, yvalue_min, yvalue_max = self._xy_values_limits()
+                template = Template.from_data(self._data_array, self._image_array,
+                                              (xvalue_min, xvalue_max), (yvalue_min, yvalue_max),
+                                              self._tkvar_log_xscale.get(), self._tkvar_log_yscale.get(),
+                                              self._xunit_entry.get(), self._yunit_entry.get())
+            except ValueError as e:
+                messagebox.showwarning('Warning', e)
+                return
+            folder = template_folder()
+            folder.mkdir(parents=True, exist_ok=True)
+            _filepath = filedialog.asksaveasfilename(title='Save calibration template',
+                                                     defaultextension=TEMPLATE_SUFFIX,
+                                                     filetypes=[('template', TEMPLATE_SUFFIX),
+                                                                ('all files', '.*')],
+                                                     initialdir=folder,
+                                                     parent=self)
+            if len(_filepath) > 0:
+                template.save(_filepath)
+
+    def _apply_template(self):
+        r"""Replace the limits by the ones of a calibration template aligned onto the image."""
+        from .templates import Template, template_folder, TEMPLATE_SUFFIX
+        if self._image_array is not None:
+            _filepath = filedialog.askopenfilename(title='Apply calibration template',
+                                                   filetypes=[('template', TEMPLATE_SUFFIX),
+                                                              ('all files', '.*')],
+                                                   initialdir=template_folder(),
+                                                   parent=self)
+            if len(_filepath) > 0:
+                template = Template.load(_filepath)
+                try:
+                    limits, calibration, _ = template.apply(self._image_array)
+                except ValueError as e:
+                    messagebox.showwarning('Warning', e)
+                    return
+                is_limit = np.isin(self._data_array['type'], LIMITS)
+                self._data_array = np.concatenate((self._data_array[~is_limit], limits))
+                self._tkvar_xmin.set(calibration.xvalues[0])
+                self._tkvar_xmax.set(calibration.xvalues[1])
+                self._tkvar_ymin.set(calibration.yvalues[0])
+                self._tkvar_ymax.set(calibration.yvalues[1])
+                self._tkvar_log_xscale.set(calibration.xlog)
+                self._tkvar_log_yscale.set(calibration.ylog)
+                self._tkvar_xunit.set(template.xunit)
+                self._tkvar_yunit.set(template.yunit)
+                self._display_data()
+
     def _refresh(self):
         """Refresh plot."""
-        self._canvas.draw()
+        with self._profiler.phase('draw'):
+            self._canvas.draw()
         self._canvas_widget.focus_set()
 
     def _test_linear(self):
         """Test linear scale."""
+        from .tests import test_linear
         self._filepath = test_linear()
         self._load_image()
 
     def _test_ylog(self):
         """Test semi-log scale."""
+        from .tests import test_ylog
         self._filepath = test_ylog()
         self._load_image()
 
     def _test_xlog(self):
         """Test semi-log scale."""
+        from .tests import test_xlog
         self._filepath = test_xlog()
         self._load_image()
 
     def _test_loglog(self):
         """Test semi-log scale."""
+        from .tests import test_loglog
         self._filepath = test_loglog()
         self._load_image()
 
+    def _latency(self):
+        ProfilerWindow(self, self._profiler)
+
+    def _dump_timings(self):
+        """Dump the recorded timings."""
+        _filepath = filedialog.asksaveasfilename(title='Dump timings',
+                                                 defaultextension='.json',
+                                                 filetypes=[('json', '.json'),
+                                                            ('all files', '.*')],
+                                                 initialdir=self._data_folder,
+                                                 parent=self)
+        if len(_filepath) > 0:
+            self._profiler.dump(_filepath)
+
+    def _toggle_cprofile(self):
+        """Start or stop the cProfile capture."""
+        _filepath = None
+        if self._profiler.cprofile_running:
+            _filepath = filedialog.asksaveasfilename(title='Save cProfile statistics',
+                                                     defaultextension='.prof',
+                                                     filetypes=[('prof', '.prof'),
+                                                                ('all files', '.*')],
+                                                     initialdir=self._data_folder,
+                                                     parent=self)
+        if self._profiler.toggle_cprofile(_filepath):
+            label = 'Stop cProfile capture'
+        else:
+            label = 'Start cProfile capture'
+        self.debug_menu.entryconfigure('last', label=label)
+
     def _online_documentation(self):
         """Display online documentation."""
         b = webbrowser.get()
@@ -1536,21 +1952,17 @@ class App(ttk.Frame):
         Stop the main tk loop.
         """
         if messagebox.askyesno("Exit", "Do you want to quit the application?"):
+            self._load_folders()
             profile_type = 'folders'
-            folders_profile_name = self._profiles_ini.defaults()[profile_type].upper()
-            self._folders_profile.set(section=folders_profile_name,
-                                      option='image folder',
-                                      value=str(self._image_folder))
-            self._folders_profile.set(section=folders_profile_name,
-                                      option='image name',
-                                      value=self._image_name)
-            self._folders_profile.set(section=folders_profile_name,
-                                      option='data folder',
-                                      value=str(self._data_folder))
-            self._folders_profile.set(section=folders_profile_name,
-                                      option='data name',
-                                      value=self._data_name)
-            save_cfg(CFG_FOLDER, 'folders', self._folders_profile)
+            name = self._folders_profile_name
+            self._settings.set(profile_type, name, 'image folder', self._image_folder)
+            self._settings.set(profile_type, name, 'image name', self._image_name)
+            self._settings.set(profile_type, name, 'data folder', self._data_folder)
+            self._settings.set(profile_type, name, 'data name', self._data_name)
+            self._settings.flush()
+            self._profiler.close()
+            if self._document is not None:
+                self._document.close()
             self.master.quit()
             self.master.destroy()
 
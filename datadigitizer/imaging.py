@@ -0,0 +1,163 @@
+r"""
+Imaging module.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+from typing import Tuple, Union
+import numpy as np
+
+
+def normalize(image_array: np.ndarray) -> np.ndarray:
+    r"""
+    Convert an image array into floats between 0 and 1.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread. Integer images are scaled by their maximal value.
+
+    Returns
+    -------
+    normalized: array-like, shape (n, m) or (n, m, c)
+        Image as floats.
+    """
+    image_array = np.asarray(image_array)
+    if np.issubdtype(image_array.dtype, np.integer):
+        return image_array / np.iinfo(image_array.dtype).max
+    elif image_array.dtype == np.bool_:
+        return image_array.astype(np.float64)
+    else:
+        return image_array.astype(np.float64, copy=False)
+
+
+def grayscale(image_array: np.ndarray) -> np.ndarray:
+    r"""
+    Convert an image array into a grayscale image.
+
+    Transparent pixels are composited on a white background.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread.
+
+    Returns
+    -------
+    gray: array-like, shape (n, m)
+        Luminance between 0 (black) and 1 (white).
+    """
+    image_array = normalize(image_array)
+    if image_array.ndim == 2:
+        return image_array
+
+    if image_array.shape[2] == 1:
+        return image_array[:, :, 0]
+
+    rgb = image_array[:, :, :3]
+    gray = rgb @ np.array([0.299, 0.587, 0.114])
+    if image_array.shape[2] == 4:
+        alpha = image_array[:, :, 3]
+        gray = gray * alpha + (1 - alpha)
+
+    return gray
+
+
+def refine_centroid(gray: np.ndarray,
+                    i: Union[float, np.ndarray],
+                    j: Union[float, np.ndarray],
+                    half_width: int = 5):
+    r"""
+    Refine point positions to the intensity-weighted centroid of the neighbouring dark pixels.
+
+    All points are refined at once: the windows are gathered in a single array of
+    shape (n, 2*half_width+1, 2*half_width+1).
+
+    Parameters
+    ----------
+    gray: array-like, shape (n, m)
+        Grayscale image where the markers are darker than the background.
+    i: float or array-like, shape (k,)
+        Row indexes of the points.
+    j: float or array-like, shape (k,)
+        Column indexes of the points.
+    half_width: int, optional
+        Half width of the search window in pixels.
+
+    Returns
+    -------
+    i_refined, j_refined: float or array-like, shape (k,)
+        Refined row and column indexes as floats. Points whose window does not
+        contain any marker pixel are left unchanged.
+
+    Notes
+    -----
+    The weights are the darkness of the pixels (1 - gray) from which the minimal
+    darkness of the window is subtracted in order to remove the background.
+
+    .. math::
+
+        i_c = \frac{\sum w_{kl} i_{k}}{\sum w_{kl}} \quad j_c = \frac{\sum w_{kl} j_{l}}{\sum w_{kl}}
+    """
+    scalar = np.ndim(i) == 0
+    i = np.atleast_1d(np.asarray(i, dtype=np.float64))
+    j = np.atleast_1d(np.asarray(j, dtype=np.float64))
+    nrows, ncols = gray.shape
+
+    offsets = np.arange(-half_width, half_width + 1)
+    ii = np.rint(i).astype(np.intp)[:, None, None] + offsets[None, :, None]
+    jj = np.rint(j).astype(np.intp)[:, None, None] + offsets[None, None, :]
+    ii, jj = np.broadcast_arrays(ii, jj)
+    inside = (ii >= 0) & (ii < nrows) & (jj >= 0) & (jj < ncols)
+
+    darkness = 1.0 - gray[np.clip(ii, 0, nrows - 1), np.clip(jj, 0, ncols - 1)]
+    background = np.where(inside, darkness, np.inf).min(axis=(1, 2), keepdims=True)
+    weights = np.where(inside, darkness - background, 0.0)
+
+    total = weights.sum(axis=(1, 2))
+    found = total > 0
+    safe_total = np.where(found, total, 1.0)
+    i_refined = np.where(found, (weights * ii).sum(axis=(1, 2)) / safe_total, i)
+    j_refined = np.where(found, (weights * jj).sum(axis=(1, 2)) / safe_total, j)
+
+    if scalar:
+        return float(i_refined[0]), float(j_refined[0])
+    return i_refined, j_refined
+
+
+def downsample(gray: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    r"""
+    Shrink a grayscale image by averaging the pixels falling in each output pixel.
+
+    Parameters
+    ----------
+    gray: array-like, shape (n, m)
+        Grayscale image.
+    shape: tuple of int
+        Shape of the output, at most (n, m).
+
+    Returns
+    -------
+    small: array-like, shape
+        Averaged image.
+    """
+    gray = np.asarray(gray, dtype=np.float64)
+    rows = np.linspace(0, gray.shape[0], shape[0] + 1).astype(np.intp)[:-1]
+    cols = np.linspace(0, gray.shape[1], shape[1] + 1).astype(np.intp)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, gray.shape[0])), np.diff(np.append(cols, gray.shape[1])))
+    return sums / counts
@@ -0,0 +1,306 @@
+r"""
+Kernels module.
+
+Sequential loops compiled by Numba when it is installed: painting the crosses of the
+points, labeling the connected components by union-find and following a curve. The
+modules using them keep their NumPy implementations which are used when Numba is
+not installed and which give the same results.
+
+The backend is numba when Numba can be imported and numpy otherwise. It can be
+forced with the environment variable ``DATADIGITIZER_BACKEND`` or with set_backend.
+The kernels are compiled at their first use, not at the import.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+import types
+import importlib.util
+from typing import Callable, Optional
+import numpy as np
+
+ENV_VAR = 'DATADIGITIZER_BACKEND'
+BACKENDS = ('numpy', 'numba')
+KERNELS = ('paint_crosses', 'union_find', 'follow')
+# helpers called by the kernels, compiled with them
+_HELPERS = ('_match', '_best_run', '_interp', '_look_ahead', '_recenter')
+
+_backend = None
+_compiled = {}
+
+
+def available() -> bool:
+    r"""Return True if Numba is installed."""
+    return importlib.util.find_spec('numba') is not None
+
+
+def get_backend() -> str:
+    r"""Return the backend: numba if installed, unless the environment variable DATADIGITIZER_BACKEND is numpy."""
+    global _backend
+    if _backend is None:
+        _backend = os.environ.get(ENV_VAR, 'numba' if available() else 'numpy').lower()
+        if _backend not in BACKENDS or (_backend == 'numba' and not available()):
+            _backend = 'numpy'
+    return _backend
+
+
+def set_backend(name: str):
+    r"""
+    Select the backend of the kernels.
+
+    Parameters
+    ----------
+    name: str
+        One of BACKENDS. numba requires Numba to be installed.
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f'{name} is not a valid backend: {BACKENDS}.')
+    if name == 'numba' and not available():
+        raise ValueError('the numba backend requires Numba: pip install datadigitizer[jit].')
+    _backend = name
+
+
+def get(name: str) -> Optional[Callable]:
+    r"""
+    Return a compiled kernel or None for the numpy backend.
+
+    Parameters
+    ----------
+    name: str
+        One of KERNELS.
+    """
+    if get_backend() != 'numba':
+        return None
+    if not _compiled:
+        import numba
+        # the compiled functions call each other: they share a namespace where the
+        # helpers are replaced by their compiled versions
+        namespace = dict(globals())
+        for key in _HELPERS + KERNELS:
+            function = globals()[key]
+            copy = types.FunctionType(function.__code__, namespace, key, function.__defaults__)
+            namespace[key] = _compiled[key] = numba.njit(nogil=True, cache=True)(copy)
+    return _compiled[name]
+
+
+def paint_crosses(overlay: np.ndarray, i: np.ndarray, j: np.ndarray, di: np.ndarray, dj: np.ndarray,
+                  colors: np.ndarray):
+    r"""
+    Paint crosses in a RGBA overlay in the order of the points.
+
+    Parameters
+    ----------
+    overlay: array-like, shape (n, m, 4)
+        RGBA overlay painted in place.
+    i, j: array-like of int, shape (k,)
+        Centers of the crosses.
+    di, dj: array-like of int, shape (k,)
+        Half height and half width of the crosses.
+    colors: array-like, shape (k, 3)
+        RGB colors of the crosses.
+    """
+    n, m = overlay.shape[0], overlay.shape[1]
+    for k in range(i.size):
+        if 0 <= j[k] < m:
+            for row in range(max(i[k] - di[k], 0), min(i[k] + di[k] + 1, n)):
+                overlay[row, j[k], 0:3] = colors[k]
+                overlay[row, j[k], 3] = 1
+        if 0 <= i[k] < n:
+            for col in range(max(j[k] - dj[k], 0), min(j[k] + dj[k] + 1, m)):
+                overlay[i[k], col, 0:3] = colors[k]
+                overlay[i[k], col, 3] = 1
+
+
+def union_find(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    r"""
+    Compute the root of each node of a graph: the smallest node of its component.
+
+    Parameters
+    ----------
+    n: int
+        Number of nodes.
+    a, b: array-like of int
+        Edges.
+
+    Returns
+    -------
+    roots: array-like, shape (n,)
+        Root of each node.
+    """
+    parent = np.arange(n)
+    for k in range(a.size):
+        x, y = a[k], b[k]
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        while parent[y] != y:
+            parent[y] = parent[parent[y]]
+            y = parent[y]
+        if x < y:
+            parent[y] = x
+        elif y < x:
+            parent[x] = y
+    # the parents are smaller than the nodes: one pass in increasing order flattens the trees
+    for x in range(n):
+        parent[x] = parent[parent[x]]
+    return parent
+
+
+def _match(image: np.ndarray, maxval: float, color: np.ndarray, tolerance: float, chroma: float,
+           i: int, j: int) -> bool:
+    r"""Test whether a pixel is close to a color, see :func:`datadigitizer.tracing.color_matcher`."""
+    if image.shape[2] >= 3:
+        r, g, b = image[i, j, 0] / maxval, image[i, j, 1] / maxval, image[i, j, 2] / maxval
+    else:
+        r = g = b = image[i, j, 0] / maxval
+    if (r - color[0]) ** 2 + (g - color[1]) ** 2 + (b - color[2]) ** 2 > tolerance ** 2:
+        return False
+    return chroma <= 0.1 or max(r, g, b) - min(r, g, b) >= chroma / 2
+
+
+def _best_run(hits: np.ndarray):
+    r"""Return the center and the length of the run of hits closest to the middle, nan and 0 if none."""
+    middle = (hits.size - 1) / 2
+    best, length, distance = np.nan, 0, np.inf
+    k = 0
+    while k < hits.size:
+        if hits[k]:
+            start = k
+            while k < hits.size and hits[k]:
+                k += 1
+            center = (start + k - 1) / 2
+            if abs(center - middle) < distance:
+                best, length, distance = center, k - start, abs(center - middle)
+        else:
+            k += 1
+    return best, length
+
+
+def _interp(x: float, fp: np.ndarray) -> float:
+    r"""Interpolate values given at the indexes 0, 1... as numpy.interp."""
+    k = int(np.floor(x))
+    if k >= fp.size - 1:
+        return fp[fp.size - 1]
+    if x == k:
+        return fp[k]
+    return (fp[k + 1] - fp[k]) * (x - k) + fp[k]
+
+
+def _look_ahead(image, maxval, color, tolerance, chroma, i, j, theta, offsets, radii, step,
+                imin, imax, jmin, jmax):
+    r"""Find the ink closest to the predicted direction, see :func:`datadigitizer.tracing._look_ahead`."""
+    hits = np.zeros(offsets.size, dtype=np.bool_)
+    cone = np.empty(offsets.size)
+    for radius in radii:
+        factor = np.sqrt(step / radius)
+        found = False
+        for k in range(offsets.size):
+            cone[k] = offsets[k] * factor
+            ai = int(np.rint(i + radius * np.sin(theta + cone[k])))
+            aj = int(np.rint(j + radius * np.cos(theta + cone[k])))
+            hits[k] = False
+            if imin <= ai < imax and jmin <= aj < jmax:
+                found = True
+                hits[k] = _match(image, maxval, color, tolerance, chroma, ai, aj)
+        if not found:
+            return False, 0.0, 0.0, 0.0
+        center, length = _best_run(hits)
+        if length > 0:
+            return True, theta + _interp(center, cone), radius, length / offsets.size
+    return False, 0.0, 0.0, 0.0
+
+
+def _recenter(image, maxval, color, tolerance, chroma, i, j, angle, shifts, imin, imax, jmin, jmax):
+    r"""Move a point onto the middle of the ink, see :func:`datadigitizer.tracing._recenter`."""
+    hits = np.zeros(shifts.size, dtype=np.bool_)
+    cos, sin = np.cos(angle), np.sin(angle)
+    for k in range(shifts.size):
+        ai = int(np.rint(i + shifts[k] * cos))
+        aj = int(np.rint(j - shifts[k] * sin))
+        if imin <= ai < imax and jmin <= aj < jmax:
+            hits[k] = _match(image, maxval, color, tolerance, chroma, ai, aj)
+    center, length = _best_run(hits)
+    if length == 0:
+        return i, j
+    shift = _interp(center, shifts)
+    return i + shift * cos, j - shift * sin
+
+
+def follow(image: np.ndarray, maxval: float, color: np.ndarray, tolerance: float,
+           i: float, j: float, theta: float, step: float, offsets: np.ndarray, radii: np.ndarray,
+           shifts: np.ndarray, max_points: int, imin: int, imax: int, jmin: int, jmax: int) -> np.ndarray:
+    r"""
+    Follow a curve from a point in a direction, see :func:`datadigitizer.tracing._follow`.
+
+    Parameters
+    ----------
+    image: array-like, shape (n, m, c)
+        Image as returned by imread with a channel axis.
+    maxval: float
+        Value of white: maximum of the integer type or 1.
+    color: array-like, shape (3,)
+        RGB color of the curve between 0 and 1.
+    tolerance: float
+        Maximal euclidean distance in the RGB space.
+    i, j: float
+        Matrix indexes of the start.
+    theta: float
+        Starting direction.
+    step: float
+        Distance in pixels between consecutive points.
+    offsets: array-like
+        Angles of the look-ahead cone at one step.
+    radii: array-like
+        Radii of the look-ahead arcs.
+    shifts: array-like
+        Shifts across the curve of the recentering.
+    max_points: int
+        Maximal number of points.
+    imin, imax, jmin, jmax: int
+        Bounds of the tracing.
+
+    Returns
+    -------
+    points: array-like, shape (k, 2)
+        Visited points without the start.
+    """
+    chroma = color.max() - color.min()
+    points = np.empty((max_points + 1, 2))
+    points[0, 0], points[0, 1] = i, j
+    count = 1
+    visited = {(0, 0): 0}
+    visited.clear()
+    while count <= max_points:
+        found, angle, radius, coverage = _look_ahead(image, maxval, color, tolerance, chroma, i, j, theta,
+                                                     offsets, radii, step, imin, imax, jmin, jmax)
+        if not found:
+            break
+        if coverage > 0.5:
+            angle = theta
+        i, j = _recenter(image, maxval, color, tolerance, chroma, i + radius * np.sin(angle),
+                         j + radius * np.cos(angle), angle, shifts, imin, imax, jmin, jmax)
+        cell = (int(i // step), int(j // step))
+        if visited.get(cell, count) < count - 2:
+            break
+        if cell not in visited:
+            visited[cell] = count
+        points[count, 0], points[count, 1] = i, j
+        count += 1
+        back = max(count - 4, 0)
+        theta = np.arctan2(i - points[back, 0], j - points[back, 1])
+    return points[1:count]
@@ -0,0 +1,263 @@
+r"""
+Pages module.
+
+Page by page access to the documents: multi-page TIFF files, PDF files and single
+images. Only the requested page is decoded so that the memory used does not depend
+on the number of pages. The PDF pages holding an image, e.g. scanned reports, give
+the decoded image and the other pages are read as vector figures.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import io
+import re
+import struct
+import zlib
+import pathlib
+from typing import Iterator, Optional, Tuple, Union
+import numpy as np
+
+from .vector import PDF_TOKENS, pdf_string, VectorFigure, PDFFile, read_pdf, read_svg
+
+# modes converted before being returned as arrays
+_CONVERTED_MODES = {'1': 'L', 'P': 'RGBA', 'PA': 'RGBA', 'LA': 'RGBA', 'CMYK': 'RGB',
+                    'YCbCr': 'RGB', 'LAB': 'RGB', 'HSV': 'RGB'}
+_PDF_COLOR_SPACES = {b'DeviceGray': 'L', b'CalGray': 'L', b'DeviceRGB': 'RGB', b'CalRGB': 'RGB',
+                     b'DeviceCMYK': 'CMYK'}
+
+
+def _png(data: bytes, width: int, height: int, bits: int, channels: int) -> bytes:
+    r"""Wrap a Flate stream encoded with PNG predictors into a PNG file decoded by Pillow."""
+    def chunk(name: bytes, content: bytes) -> bytes:
+        return struct.pack('>I', len(content)) + name + content + struct.pack('>I', zlib.crc32(name + content))
+
+    # the Flate streams with PNG predictors are the IDAT data of a PNG file
+    header = struct.pack('>IIBBBBB', width, height, bits, 0 if channels == 1 else 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', data) + chunk(b'IEND', b'')
+
+
+def _ccitt_to_tiff(data: bytes, width: int, height: int, k: int, black_is_1: bool) -> bytes:
+    r"""Wrap a CCITT fax stream into a single strip TIFF file decoded by Pillow."""
+    # the codes give white and black runs: BlackIs1 only swaps the gray levels
+    # tag, type (3 short, 4 long), value
+    tags = [(256, 4, width), (257, 4, height), (258, 3, 1), (259, 3, 4 if k < 0 else 3),
+            (262, 3, 1 if black_is_1 else 0), (273, 4, 0), (278, 4, height), (279, 4, len(data))]
+    if k > 0:
+        tags.append((292, 4, 1))
+    offset = 8 + 2 + 12 * len(tags) + 4
+    entries = b''.join(struct.pack('<HHI', tag, kind, 1)
+                       + struct.pack('<I' if kind == 4 else '<HH', offset if tag == 273 else value,
+                                     *(() if kind == 4 else (0,)))
+                       for tag, kind, value in tags)
+    return b'II*\x00' + struct.pack('<IH', 8, len(tags)) + entries + b'\x00' * 4 + data
+
+
+def decode_pdf_image(pdf: PDFFile, number: int) -> np.ndarray:
+    r"""
+    Decode an image XObject of a PDF file.
+
+    The JPEG, JPEG 2000 and CCITT fax images are decoded by Pillow. The images
+    without filter or with the Flate filter are decoded for the gray and RGB color
+    spaces, the indexed colors and the CMYK color space without predictor, with 8 bits
+    per component and for the 1 bit images. The other filters and color spaces raise a ValueError.
+
+    Parameters
+    ----------
+    pdf: PDFFile
+        Opened PDF file.
+    number: int
+        Object number of the image.
+
+    Returns
+    -------
+    image_array: array-like, shape (n, m) or (n, m, 3)
+        Decoded image as unsigned bytes.
+    """
+    from PIL import Image
+
+    body = pdf.object(number)
+    if re.search(rb'/(DCTDecode|JPXDecode)', body):
+        with Image.open(io.BytesIO(pdf.raw_stream(number))) as image:
+            return np.asarray(image.convert('RGB' if image.mode not in ('L', 'RGB') else image.mode))
+
+    def number_of(name: bytes, default: int) -> int:
+        match = re.search(rb'/' + name + rb'\s+(-?\d+)', body)
+        return int(match.group(1)) if match else default
+
+    width, height, bits = number_of(b'Width', 0), number_of(b'Height', 0), number_of(b'BitsPerComponent', 8)
+    inverted = (re.search(rb'/Decode\s*\[\s*1(\.0*)?\s+0(\.0*)?\s*\]', body) is not None
+                or re.search(rb'/ImageMask\s+true', body) is not None)
+    if b'/CCITTFaxDecode' in body:
+        tiff = _ccitt_to_tiff(pdf.raw_stream(number), width, height, number_of(b'K', 0),
+                              re.search(rb'/BlackIs1\s+true', body) is not None)
+        with Image.open(io.BytesIO(tiff)) as image:
+            image_array = np.asarray(image.convert('L'))
+        return 255 - image_array if inverted else image_array
+
+    palette = None
+    space = re.search(rb'/ColorSpace\s*(/\w+|\[\s*/ICCBased\s+(\d+)\s+\d+\s+R\s*\]|\[\s*/Indexed\s*/(\w+)\s+\d+\s*)',
+                      body)
+    if space is None or bits == 1:
+        mode = 'L' if space is None or b'/Indexed' not in space.group(0) else None
+    elif space.group(2):
+        # the ICC profiles are ignored: their number of components gives the device space
+        n = re.search(rb'/N\s+(\d+)', pdf.object(int(space.group(2))))
+        mode = {1: 'L', 3: 'RGB', 4: 'CMYK'}.get(int(n.group(1)) if n else 0)
+    elif space.group(3):
+        # the indexes are read as a gray image and looked up in the palette
+        mode, base = 'L', _PDF_COLOR_SPACES.get(space.group(3))
+        reference = re.match(rb'(\d+)\s+\d+\s+R', body[space.end():])
+        if reference:
+            table = pdf.stream(int(reference.group(1)))
+        else:
+            token = PDF_TOKENS.match(body, space.end())
+            table = pdf_string(token.group(0)).encode('latin-1') if token and token.group(0)[:1] in b'(<' else None
+        if base in ('L', 'RGB') and table is not None:
+            palette = np.frombuffer(table, dtype=np.uint8)[:len(table) // len(base) * len(base)].reshape(-1, len(base))
+            palette = np.concatenate((palette, np.zeros((256 - palette.shape[0], len(base)), dtype=np.uint8)))
+        else:
+            mode = None
+    else:
+        mode = _PDF_COLOR_SPACES.get(space.group(1)[1:])
+    predicted = re.search(rb'/Predictor\s+1\d', body) is not None
+    if mode is None or bits not in (1, 8) or width * height == 0 or (predicted and mode == 'CMYK'):
+        raise ValueError(f'the image {number} has an unsupported color space or depth.')
+    if predicted and re.search(rb'/Filter\s*\[?\s*/FlateDecode\s*\]?\s*/', body + b'/'):
+        with Image.open(io.BytesIO(_png(pdf.raw_stream(number), width, height, bits, len(mode)))) as image:
+            image_array = np.asarray(image.convert(mode))
+        if palette is not None:
+            return palette[image_array].squeeze()
+        return 255 - image_array if bits == 1 and inverted else image_array
+
+    data = pdf.stream(number)
+    if data is None or predicted:
+        raise ValueError(f'the image {number} has an unsupported filter.')
+    if bits == 1:
+        image_array = np.unpackbits(np.frombuffer(data, dtype=np.uint8)[:(width + 7) // 8 * height]
+                                    .reshape(height, -1), axis=1)[:, :width] * np.uint8(255)
+        return 255 - image_array if inverted else image_array
+    image = Image.frombytes(mode, (width, height), data[:width * height * len(mode)])
+    if palette is not None:
+        return palette[np.asarray(image)].squeeze()
+    return np.asarray(image.convert('RGB') if mode == 'CMYK' else image)
+
+
+class Document(object):
+    r"""Class for reading the pages of a document one by one. See __init__.__doc__."""
+
+    def __init__(self, fpath: Union[str, pathlib.Path], scale: float = 2.0):
+        r"""
+        Page by page reader of a document.
+
+        The TIFF files and the other multi-frame images have one page per frame. The
+        PDF files have their pages and the SVG files and single images have one page.
+        Only the index of the pages is kept in memory.
+
+        Parameters
+        ----------
+        fpath: str or Path
+            Path to the document.
+        scale: float, optional
+            Pixels per point of the rendered vector pages.
+        """
+        self.fpath = pathlib.Path(fpath)
+        self.scale = scale
+        self._pdf = None
+        self._image = None
+        suffix = self.fpath.suffix.lower()
+        if suffix == '.pdf':
+            self._pdf = PDFFile(self.fpath)
+            self._pages = self._pdf.pages()
+        elif suffix == '.svg':
+            self._pages = [0]
+        else:
+            from PIL import Image
+            self._image = Image.open(self.fpath)
+            self._pages = list(range(getattr(self._image, 'n_frames', 1)))
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        r"""Close the underlying file."""
+        if self._pdf is not None:
+            self._pdf.close()
+        if self._image is not None:
+            self._image.close()
+
+    def _pdf_image(self, index: int) -> Optional[int]:
+        r"""Return the object number of the largest image of a PDF page or None."""
+        page = self._pages[index]
+        resources = self._pdf.resolve(self._pdf.inherited(self._pdf.object(page), b'Resources'), b'Resources')
+        best, size = None, 0
+        for number in self._pdf.xobjects(resources).values():
+            body = self._pdf.object(number)
+            if re.search(rb'/Subtype\s*/Image', body):
+                width = re.search(rb'/Width\s+(\d+)', body)
+                height = re.search(rb'/Height\s+(\d+)', body)
+                area = int(width.group(1)) * int(height.group(1)) if width and height else 0
+                if area > size:
+                    best, size = number, area
+        return best
+
+    def page(self, index: int) -> Tuple[np.ndarray, Optional[VectorFigure]]:
+        r"""
+        Decode a page.
+
+        Parameters
+        ----------
+        index: int
+            Index of the page.
+
+        Returns
+        -------
+        image_array: array-like, shape (n, m) or (n, m, c)
+            Image of the page, rendered for the vector pages.
+        figure: VectorFigure or None
+            Shapes of the vector pages.
+        """
+        if not 0 <= index < len(self._pages):
+            raise IndexError(f'{self.fpath} has {len(self._pages)} pages.')
+        if self._pdf is not None:
+            figure = read_pdf(self._pdf, index)
+            image = self._pdf_image(index)
+            # a scanned page draws an image and nothing else
+            if image is not None and not figure.shapes:
+                return decode_pdf_image(self._pdf, image), None
+            return figure.render(self.scale), figure
+        elif self._image is None:
+            figure = read_svg(self.fpath)
+            return figure.render(self.scale), figure
+        elif len(self._pages) == 1:
+            # the single images are read as before
+            from matplotlib import image
+            return image.imread(str(self.fpath)), None
+        self._image.seek(index)
+        frame = self._image
+        if frame.mode in _CONVERTED_MODES:
+            frame = frame.convert(_CONVERTED_MODES[frame.mode])
+        return np.array(frame), None
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, Optional[VectorFigure]]]:
+        for index in range(len(self._pages)):
+            yield self.page(index)
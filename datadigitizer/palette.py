@@ -0,0 +1,182 @@
+r"""
+Palette module.
+
+Discovery of the colors of the series by clustering a random subsample of the
+pixels. The white background, the black axes and the gray grid lines are
+discarded by their low chroma, the remaining pixels are clustered by k-means and
+the anti-aliased blends are merged into the color they fade from.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+from .imaging import normalize
+from .extraction import Bounds
+
+
+def kmeans(samples: np.ndarray, k: int, iterations: int = 30,
+           rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Cluster samples by the k-means algorithm with the k-means++ initialization.
+
+    Parameters
+    ----------
+    samples: array-like, shape (n, d)
+        Samples.
+    k: int
+        Number of clusters, at most n.
+    iterations: int, optional
+        Maximal number of iterations.
+    rng: numpy.random.Generator, optional
+        Random generator of the initialization.
+
+    Returns
+    -------
+    centers: array-like, shape (k, d)
+        Centers of the clusters.
+    labels: array-like, shape (n,)
+        Index of the cluster of each sample.
+    """
+    rng = np.random.default_rng(0) if rng is None else rng
+    samples = np.asarray(samples, dtype=np.float64)
+    centers = np.empty((k, samples.shape[1]))
+    centers[0] = samples[rng.integers(samples.shape[0])]
+    distance2 = np.sum((samples - centers[0]) ** 2, axis=1)
+    for c in range(1, k):
+        total = distance2.sum()
+        index = rng.choice(samples.shape[0], p=distance2 / total) if total > 0 else rng.integers(samples.shape[0])
+        centers[c] = samples[index]
+        distance2 = np.minimum(distance2, np.sum((samples - centers[c]) ** 2, axis=1))
+
+    labels = None
+    for _ in range(iterations):
+        distances = np.sum((samples[:, np.newaxis, :] - centers[np.newaxis]) ** 2, axis=2)
+        new_labels = np.argmin(distances, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        for d in range(samples.shape[1]):
+            sums = np.bincount(labels, weights=samples[:, d], minlength=k)
+            # empty clusters keep their center
+            centers[counts > 0, d] = sums[counts > 0] / counts[counts > 0]
+    return centers, labels
+
+
+def _blend_distance(color: np.ndarray, reference: np.ndarray) -> float:
+    r"""Return the distance of a color to the segments going from white and black to a reference color."""
+    distances = []
+    for origin in (1.0, 0.0):
+        direction = reference - origin
+        t = np.clip(np.dot(color - origin, direction) / max(np.dot(direction, direction), 1e-12), 0.0, 1.0)
+        distances.append(np.linalg.norm(color - origin - t * direction))
+    return float(min(distances))
+
+
+def discover_colors(image_array: np.ndarray, count: int = 8, samples: int = 20000,
+                    min_chroma: float = 0.2, min_fraction: float = 0.02,
+                    merge_distance: float = 0.15, bounds: Optional[Bounds] = None,
+                    seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Propose the colors of the series of an image.
+
+    The pixels are drawn at random so that the cost does not depend on the size of
+    the image. The pixels whose chroma, the difference between the largest and the
+    smallest channels, is low are the background, the axes, the grid lines and the
+    black or gray series: they are discarded. The other pixels are clustered and a
+    cluster lying between white or black and a more saturated cluster is an
+    anti-aliased edge merged into the latter. Each color is the most frequent one of
+    its merged clusters.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m, c)
+        Image as returned by imread.
+    count: int, optional
+        Number of clusters before merging.
+    samples: int, optional
+        Number of sampled pixels.
+    min_chroma: float, optional
+        Minimal chroma of the kept pixels between 0 and 1.
+    min_fraction: float, optional
+        Minimal fraction of the kept pixels in a proposed color.
+    merge_distance: float, optional
+        Maximal RGB distance of a cluster to the blends of another one for being merged.
+    bounds: tuple of int, optional
+        imin, imax, jmin, jmax. Only the pixels inside are sampled.
+    seed: int, optional
+        Seed of the random generator.
+
+    Returns
+    -------
+    colors: array-like, shape (k, 3)
+        RGB colors between 0 and 1 sorted by decreasing number of pixels.
+    counts: array-like, shape (k,)
+        Estimated number of pixels of each color.
+    """
+    image_array = np.asarray(image_array)
+    colors, counts = np.empty((0, 3)), np.empty(0, dtype=np.int64)
+    if image_array.ndim != 3 or image_array.shape[2] < 3:
+        return colors, counts
+    imin, imax, jmin, jmax = (0, image_array.shape[0], 0, image_array.shape[1]) if bounds is None else bounds
+    npixels = max(imax - imin, 0) * max(jmax - jmin, 0)
+    if npixels == 0:
+        return colors, counts
+
+    rng = np.random.default_rng(seed)
+    size = min(samples, npixels)
+    i = rng.integers(imin, imax, size)
+    j = rng.integers(jmin, jmax, size)
+    rgb = normalize(image_array[i, j, :3])
+    rgb = rgb[rgb.max(axis=1) - rgb.min(axis=1) >= min_chroma]
+    if rgb.shape[0] < count:
+        return colors, counts
+
+    _, labels = kmeans(rgb, count, rng=rng)
+    clusters = [(c, np.median(rgb[labels == c], axis=0)) for c in np.unique(labels)]
+    # the most saturated clusters first: the blends are merged into them
+    clusters.sort(key=lambda item: -np.ptp(item[1]))
+    groups = []
+    for c, color in clusters:
+        for group in groups:
+            if _blend_distance(color, group[0]) <= merge_distance:
+                group[1].append(c)
+                break
+        else:
+            groups.append((color, [c]))
+
+    # the anti-aliasing spreads a group between white, black and the drawn color which
+    # is the most frequent color of its most saturated quarter, binned coarsely so that
+    # the noise is averaged out
+    chroma = rgb.max(axis=1) - rgb.min(axis=1)
+    bins = np.rint(rgb * 31).astype(np.int64) @ np.array([1024, 32, 1])
+    proposed = []
+    for _, members in groups:
+        inside = np.isin(labels, members)
+        if inside.sum() >= min_fraction * rgb.shape[0]:
+            saturated = inside & (chroma >= np.percentile(chroma[inside], 75))
+            values, frequencies = np.unique(bins[saturated], return_counts=True)
+            mode = saturated & (bins == values[np.argmax(frequencies)])
+            proposed.append((rgb[mode].mean(axis=0), inside.sum()))
+
+    proposed.sort(key=lambda item: -item[1])
+    if proposed:
+        colors = np.array([color for color, _ in proposed])
+        counts = np.rint(np.array([n for _, n in proposed]) * npixels / size).astype(np.int64)
+    return colors, counts
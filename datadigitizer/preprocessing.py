@@ -0,0 +1,343 @@
+r"""
+Preprocessing module.
+
+Stages preparing the image for the extraction: grayscale conversion, background
+subtraction, binarization by Otsu or adaptive thresholding and removal of the grid
+lines. The Pipeline class memoizes the output of each stage and recomputes only the
+stages whose parameters, or the parameters of the stages they depend on, changed.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+from typing import Callable, Dict, Optional
+import numpy as np
+
+from .imaging import grayscale
+from .tiling import row_bands, map_bands, tiled
+
+THRESHOLD_METHODS = ('otsu', 'adaptive')
+
+
+def extremum_filter(image_array: np.ndarray, size: int, axis: int, func: Callable) -> np.ndarray:
+    r"""
+    Compute the running maximum or minimum along an axis.
+
+    The van Herk/Gil-Werman algorithm is used so that the cost does not depend on
+    the size of the window. The borders are extended with the edge values.
+
+    Parameters
+    ----------
+    image_array: array-like
+        Input array.
+    size: int
+        Length of the window centered on each element.
+    axis: int
+        Axis along which the filter is applied.
+    func: numpy.ufunc
+        numpy.maximum or numpy.minimum.
+
+    Returns
+    -------
+    filtered: array-like
+        Array of the same shape.
+    """
+    if size <= 1:
+        return np.array(image_array, copy=True)
+    # the filtered axis is moved first: the accumulations then run over contiguous rows
+    a = np.moveaxis(np.asarray(image_array), axis, 0)
+    n = a.shape[0]
+    before = size // 2
+    after = size - 1 - before
+    length = -(-(n + size - 1) // size) * size
+    pad = [(before, length - n - before)] + [(0, 0)] * (a.ndim - 1)
+    blocks = np.pad(a, pad, mode='edge').reshape((length // size, size) + a.shape[1:])
+    prefix = func.accumulate(blocks, axis=1).reshape((length,) + a.shape[1:])
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape((length,) + a.shape[1:])
+    filtered = func(suffix[:n], prefix[before + after:before + after + n])
+    return np.moveaxis(filtered, 0, axis)
+
+
+def box_mean(image_array: np.ndarray, size: int) -> np.ndarray:
+    r"""
+    Compute the local mean in square windows with an integral image.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m)
+        Input image.
+    size: int
+        Odd side of the windows.
+
+    Returns
+    -------
+    mean: array-like, shape (n, m)
+        Local mean.
+    """
+    r = size // 2
+    padded = np.pad(np.asarray(image_array, dtype=np.float64), r + 1, mode='edge')
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    n, m = image_array.shape
+    total = (integral[size:size + n, size:size + m] - integral[:n, size:size + m]
+             - integral[size:size + n, :m] + integral[:n, :m])
+    return total / size ** 2
+
+
+def subtract_background(gray: np.ndarray, size: int = 0) -> np.ndarray:
+    r"""
+    Flatten an uneven background, e.g. the shading of a scan.
+
+    The background is estimated by a grayscale closing, a maximum followed by a minimum
+    filter, which removes the dark features narrower than the window.
+
+    Parameters
+    ----------
+    gray: array-like, shape (n, m)
+        Grayscale image between 0 and 1.
+    size: int, optional
+        Side of the window larger than the lines and markers. No correction if 0.
+
+    Returns
+    -------
+    corrected: array-like, shape (n, m)
+        Image with a white background.
+    """
+    if size <= 1:
+        return gray
+    # single precision is enough for the background and halves the memory traffic
+    background = gray.astype(np.float32)
+    for func in (np.maximum, np.minimum):
+        for axis in (0, 1):
+            background = extremum_filter(background, size, axis, func)
+    return np.clip(gray - background + 1.0, 0.0, 1.0)
+
+
+def otsu_threshold(gray: np.ndarray, bins: int = 256, workers: Optional[int] = None) -> float:
+    r"""
+    Compute the threshold maximizing the variance between the dark and the light pixels.
+
+    Parameters
+    ----------
+    gray: array-like
+        Grayscale image between 0 and 1.
+    bins: int, optional
+        Number of bins of the histogram.
+    workers: int, optional
+        Number of threads computing the histograms of the bands of a large image.
+        By default, the number of processors.
+
+    Returns
+    -------
+    threshold: float
+        Threshold between 0 and 1.
+    """
+    gray = np.asarray(gray)
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    counts = sum(map_bands(lambda start, stop: np.histogram(gray[start:stop], bins=bins, range=(0.0, 1.0))[0],
+                           row_bands(gray.shape[0], int(np.prod(gray.shape[1:])), workers), workers))
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight = np.cumsum(counts)
+    total = weight[-1]
+    cumulated = np.cumsum(counts * centers)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_low = cumulated / weight
+        mean_high = (cumulated[-1] - cumulated) / (total - weight)
+        variance = weight * (total - weight) * (mean_low - mean_high) ** 2
+    k = np.nanargmax(variance[:-1]) if total > 0 and np.isfinite(variance[:-1]).any() else bins // 2
+    return float(edges[k + 1])
+
+
+def binarize(gray: np.ndarray, method: str = 'otsu', block_size: int = 51,
+             offset: float = 0.05, workers: Optional[int] = None) -> np.ndarray:
+    r"""
+    Binarize a grayscale image.
+
+    Parameters
+    ----------
+    gray: array-like, shape (n, m)
+        Grayscale image between 0 and 1.
+    method: str, optional
+        otsu for a global threshold or adaptive for a threshold following the local mean.
+    block_size: int, optional
+        Side of the windows of the local mean for the adaptive method.
+    offset: float, optional
+        Darkness below the local mean required by the adaptive method.
+    workers: int, optional
+        Number of threads processing the bands of a large image, see
+        :func:`datadigitizer.tiling.tiled`. By default, the number of processors.
+
+    Returns
+    -------
+    binary: array-like, shape (n, m)
+        True for the ink.
+    """
+    if method == 'otsu':
+        threshold = otsu_threshold(gray, workers=workers)
+        return tiled(lambda band: band < threshold, gray, workers)
+    elif method == 'adaptive':
+        # the halo covers the windows of the rows at the borders of the bands
+        return tiled(lambda band: band < box_mean(band, block_size | 1) - offset, gray, workers,
+                     halo=(block_size | 1) // 2)
+    raise ValueError(f'{method} is not a valid threshold method: {THRESHOLD_METHODS}.')
+
+
+def remove_grid(binary: np.ndarray, length: int) -> np.ndarray:
+    r"""
+    Remove the horizontal and vertical lines longer than a length.
+
+    The lines are found by morphological openings with horizontal and vertical
+    segments so that the axes and the grid lines are removed while the curves
+    and the markers are kept.
+
+    Parameters
+    ----------
+    binary: array-like, shape (n, m)
+        Binary image.
+    length: int
+        Minimal length of the removed lines. No removal if 0.
+
+    Returns
+    -------
+    cleaned: array-like, shape (n, m)
+        Binary image without the lines.
+    """
+    if length <= 1:
+        return binary
+    lines = np.zeros_like(binary)
+    for axis in (0, 1):
+        opened = extremum_filter(binary, length, axis, np.minimum)
+        lines |= extremum_filter(opened, length, axis, np.maximum)
+    return binary & ~lines
+
+
+class Pipeline(object):
+    r"""Class for memoizing the preprocessing stages of an image. See __init__.__doc__."""
+
+    # stage: (input stage, parameters)
+    STAGES = {'gray': (None, ()),
+              'background': ('gray', ('background_size',)),
+              'binary': ('background', ('threshold', 'block_size', 'offset')),
+              'nogrid': ('binary', ('grid_length',))}
+    LABELS = {'image': 'Raw image',
+              'gray': 'Grayscale',
+              'background': 'Background subtracted',
+              'binary': 'Binary',
+              'nogrid': 'Binary without grid'}
+    DEFAULTS = {'background_size': 0,
+                'threshold': 'otsu',
+                'block_size': 51,
+                'offset': 0.05,
+                'grid_length': 0}
+
+    def __init__(self, image_array: Optional[np.ndarray] = None, **params):
+        r"""
+        Memoized preprocessing stages of an image.
+
+        Each stage is computed at the first request and kept until the image or one of
+        the parameters of the stage or of its inputs changes.
+
+        Parameters
+        ----------
+        image_array: array-like, optional
+            Image as returned by imread.
+        params: dict
+            Parameters overriding DEFAULTS: background_size, threshold (otsu or adaptive),
+            block_size, offset and grid_length.
+        """
+        self._image = image_array
+        self._params = dict(self.DEFAULTS)
+        self._cache = {}
+        self.computed = {stage: 0 for stage in self.STAGES}
+        self.set_params(**params)
+
+    @property
+    def image(self) -> Optional[np.ndarray]:
+        r"""Return the raw image."""
+        return self._image
+
+    @property
+    def params(self) -> Dict:
+        r"""Return a copy of the parameters."""
+        return dict(self._params)
+
+    def set_image(self, image_array: Optional[np.ndarray]):
+        r"""Set a new image and clear all the stages."""
+        self._image = image_array
+        self._cache.clear()
+
+    def set_params(self, **params):
+        r"""
+        Update parameters. The stages depending on them are recomputed at the next request.
+
+        Parameters
+        ----------
+        params: dict
+            Parameters among DEFAULTS.
+        """
+        for name, value in params.items():
+            if name not in self.DEFAULTS:
+                raise ValueError(f'{name} is not a preprocessing parameter: {tuple(self.DEFAULTS)}.')
+            if name == 'threshold' and value not in THRESHOLD_METHODS:
+                raise ValueError(f'{value} is not a valid threshold method: {THRESHOLD_METHODS}.')
+            self._params[name] = value
+
+    def _key(self, stage: str):
+        source, names = self.STAGES[stage]
+        key = tuple(self._params[name] for name in names)
+        return key if source is None else self._key(source) + key
+
+    def _compute(self, stage: str, source: np.ndarray) -> np.ndarray:
+        p = self._params
+        if stage == 'gray':
+            return grayscale(source)
+        elif stage == 'background':
+            return subtract_background(source, p['background_size'])
+        elif stage == 'binary':
+            return binarize(source, p['threshold'], p['block_size'], p['offset'])
+        else:
+            return remove_grid(source, p['grid_length'])
+
+    def get(self, stage: str) -> np.ndarray:
+        r"""
+        Return the output of a stage, computing it and its inputs only if needed.
+
+        Parameters
+        ----------
+        stage: str
+            image or one of STAGES.
+
+        Returns
+        -------
+        output: array-like
+            Output of the stage.
+        """
+        if self._image is None:
+            raise ValueError('No image loaded.')
+        if stage == 'image':
+            return self._image
+        if stage not in self.STAGES:
+            raise ValueError(f'{stage} is not a preprocessing stage: {tuple(self.STAGES)}.')
+        key = self._key(stage)
+        cached = self._cache.get(stage)
+        if cached is None or cached[0] != key:
+            source = self.STAGES[stage][0]
+            output = self._compute(stage, self._image if source is None else self.get(source))
+            # read-only view: the stages may return their input, e.g. the image of the caller
+            output = output.view()
+            output.setflags(write=False)
+            self._cache[stage] = (key, output)
+            self.computed[stage] += 1
+        return self._cache[stage][1]
@@ -0,0 +1,274 @@
+r"""
+Profiling module.
+
+Opt-in instrumentation of the interactive actions: the wall time of each callback
+is recorded and split into model update, overlay paint and canvas draw.
+It is enabled with the ``--profile`` flag or by setting the environment variable
+``DATADIGITIZER_PROFILE`` to a non-zero value.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+import time
+import functools
+import collections
+import contextlib
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+ENV_VAR = 'DATADIGITIZER_PROFILE'
+PHASES = ('model', 'paint', 'draw')
+
+
+class _NullContext(object):
+    r"""Do nothing context manager used when profiling is disabled."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class Profiler(object):
+    r"""Class for recording the latency of the callbacks. See __init__.__doc__."""
+
+    def __init__(self, enabled: bool = False, maxlen: int = 1000, output: Optional[str] = None):
+        r"""
+        Latency recorder for the interactive actions.
+
+        Parameters
+        ----------
+        enabled: bool, optional
+            Flag for enabling the recording.
+        maxlen: int, optional
+            Number of records kept in the rolling window.
+        output: str, optional
+            Path of the JSON file where the records are dumped when the profiler is closed.
+        """
+        self.enabled = enabled
+        self.output = output
+        self._records = collections.deque(maxlen=maxlen)
+        self._stack = []
+        self._cprofile = None
+
+    @classmethod
+    def from_environ(cls, **kwargs):
+        r"""Create a profiler enabled by the environment variable DATADIGITIZER_PROFILE."""
+        value = os.environ.get(ENV_VAR, '')
+        return cls(enabled=value not in ('', '0'), **kwargs)
+
+    @property
+    def records(self) -> List[Dict]:
+        r"""Return the records of the rolling window."""
+        return list(self._records)
+
+    @property
+    def cprofile_running(self) -> bool:
+        r"""Return True if a cProfile capture is running."""
+        return self._cprofile is not None
+
+    @contextlib.contextmanager
+    def _callback(self, name: str):
+        record = {'callback': name, 'start': time.time(), 'paint': 0.0, 'draw': 0.0}
+        self._stack.append(record)
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['total'] = time.perf_counter() - t0
+            record['model'] = max(record['total'] - record['paint'] - record['draw'], 0.0)
+            self._stack.pop()
+            self._records.append(record)
+
+    def callback(self, name: str):
+        r"""
+        Context manager recording the wall time of a callback.
+
+        Parameters
+        ----------
+        name: str
+            Name of the callback.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._callback(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            # nested callbacks: the time is accounted in all the running callbacks
+            for record in self._stack:
+                record[name] += elapsed
+
+    def phase(self, name: str):
+        r"""
+        Context manager recording the wall time of a phase inside the running callbacks.
+
+        Parameters
+        ----------
+        name: str
+            Name of the phase: paint or draw. The model phase is the remaining time.
+        """
+        if not (self.enabled and self._stack):
+            return _NULL_CONTEXT
+        return self._phase(name)
+
+    def wrap(self, func: Callable, name: Optional[str] = None) -> Callable:
+        r"""
+        Wrap a callback for recording its wall time.
+
+        Parameters
+        ----------
+        func: callable
+            Callback to be wrapped.
+        name: str, optional
+            Name of the callback. The name of func is used by default.
+        """
+        name = func.__name__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.callback(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        r"""
+        Compute the statistics of the records for each callback.
+
+        Returns
+        -------
+        summary: dict
+            For each callback and each phase (total, model, paint, draw):
+            count, mean, median, p95 and max in milliseconds.
+        """
+        groups = collections.defaultdict(list)
+        for record in self._records:
+            groups[record['callback']].append(record)
+
+        summary = {}
+        for name, records in groups.items():
+            summary[name] = {}
+            for phase in ('total',) + PHASES:
+                values = np.array([record[phase] for record in records]) * 1e3
+                summary[name][phase] = {'count': int(values.size),
+                                        'mean': float(values.mean()),
+                                        'median': float(np.median(values)),
+                                        'p95': float(np.percentile(values, 95)),
+                                        'max': float(values.max())}
+        return summary
+
+    def histogram(self, bins: int = 20):
+        r"""
+        Compute the histogram of the total wall times in the rolling window.
+
+        The bins are logarithmically spaced between the shortest and the longest record.
+
+        Parameters
+        ----------
+        bins: int, optional
+            Number of bins.
+
+        Returns
+        -------
+        counts: array-like, shape (bins,)
+            Number of records in each bin.
+        edges: array-like, shape (bins+1,)
+            Edges of the bins in milliseconds.
+        """
+        values = np.array([record['total'] for record in self._records]) * 1e3
+        if values.size == 0:
+            return np.zeros(bins, dtype=int), np.linspace(0.0, 1.0, bins + 1)
+        low = max(values.min(), 1e-3)
+        high = max(values.max(), low * 10)
+        edges = np.logspace(np.log10(low), np.log10(high), bins + 1)
+        counts, edges = np.histogram(np.clip(values, edges[0], edges[-1]), bins=edges)
+        return counts, edges
+
+    def dump(self, fpath: str):
+        r"""
+        Dump the records and their summary in a JSON file.
+
+        Parameters
+        ----------
+        fpath: str
+            Path of the JSON file.
+        """
+        import json
+        with open(fpath, 'w') as fobj:
+            json.dump({'summary': self.summary(), 'records': self.records}, fobj, indent=1)
+
+    def start_cprofile(self):
+        r"""Start a cProfile capture."""
+        if self._cprofile is None:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop_cprofile(self, fpath: Optional[str] = None):
+        r"""
+        Stop the cProfile capture.
+
+        Parameters
+        ----------
+        fpath: str, optional
+            Path of the file where the statistics are dumped. They can be read with pstats.
+        """
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if fpath:
+                self._cprofile.dump_stats(fpath)
+            self._cprofile = None
+
+    def toggle_cprofile(self, fpath: Optional[str] = None) -> bool:
+        r"""
+        Start or stop the cProfile capture.
+
+        Parameters
+        ----------
+        fpath: str, optional
+            Path of the file where the statistics are dumped when the capture is stopped.
+
+        Returns
+        -------
+        running: bool
+            True if the capture is running after the toggle.
+        """
+        if self._cprofile is None:
+            self.start_cprofile()
+        else:
+            self.stop_cprofile(fpath)
+        return self.cprofile_running
+
+    def close(self):
+        r"""Stop the cProfile capture and dump the records if an output was given."""
+        if self.output and self.cprofile_running:
+            self.stop_cprofile(os.path.splitext(self.output)[0] + '.prof')
+        else:
+            self.stop_cprofile()
+        if self.enabled and self.output:
+            self.dump(self.output)
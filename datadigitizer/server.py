@@ -0,0 +1,387 @@
+r"""
+Server module.
+
+Digitization jobs submitted over HTTP, e.g. to a machine holding the calibration
+templates. The images are posted as the request body and the calibration parameters
+as query parameters::
+
+    curl --data-binary @plot.png -H 'Content-Type: image/png' \
+         'http://127.0.0.1:8000/digitize?method=colors&template=journal'
+
+The points are returned as JSON, one list per field, or as a NumPy .npy file when
+the request accepts application/x-npy. The requests are handled concurrently by
+threads and the digitization runs in a bounded pool of worker processes. When the
+workers and the waiting queue are full, the requests are rejected at once with the
+status 503 and a Retry-After header instead of piling up. A slot is reserved before
+reading the image so that only the accepted images are held in memory, and the
+number of connections, one thread each, is bounded too.
+
+GET /health returns the number of running and waiting jobs.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import io
+import os
+import json
+import pathlib
+import tempfile
+import threading
+import urllib.parse
+import http.server
+import concurrent.futures
+from typing import Callable, Dict, Optional
+import numpy as np
+
+from .core import LIMITS
+
+CONTENT_TYPES = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/tiff': '.tif', 'image/bmp': '.bmp',
+                 'image/gif': '.gif', 'application/pdf': '.pdf', 'image/svg+xml': '.svg'}
+NPY_TYPE = 'application/x-npy'
+MAX_BYTES = 64 * 2**20
+# bytes of a rejected body read to let the client receive the response, discarded
+DISCARD_BYTES = 2**20
+MAX_CONNECTIONS = 64
+_BUSY_BODY = json.dumps({'error': 'too many connections, retry later.'}).encode()
+_BUSY_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n'
+                  b'Content-Length: %d\r\nRetry-After: 1\r\nConnection: close\r\n\r\n' % len(_BUSY_BODY)
+                  + _BUSY_BODY)
+
+
+def parse_params(query: str) -> Dict:
+    r"""
+    Read the parameters of a job from a query string.
+
+    Parameters
+    ----------
+    query: str
+        method, page, template, tolerance, scale, limits and values as JSON objects
+        keyed by xmin, xmax, ymin and ymax, and scales as linear,log.
+
+    Returns
+    -------
+    params: dict
+        Keyword arguments of :func:`datadigitizer.api.digitize`.
+    """
+    fields = dict(urllib.parse.parse_qsl(query))
+    params = {}
+    try:
+        for key, kind in (('method', str), ('template', str), ('page', int), ('tolerance', float),
+                          ('scale', float)):
+            if key in fields:
+                params[key] = kind(fields.pop(key))
+        for key in ('limits', 'values'):
+            if key in fields:
+                params[key] = json.loads(fields.pop(key))
+                if not isinstance(params[key], dict) or set(params[key]) != set(LIMITS):
+                    raise ValueError(f'{key} must have the keys {", ".join(LIMITS)}.')
+        if 'scales' in fields:
+            params['scales'] = tuple(fields.pop('scales').split(','))
+    except ValueError as error:
+        raise ValueError(f'invalid parameter: {error}') from None
+    if fields:
+        raise ValueError(f'unknown parameters: {", ".join(fields)}.')
+    return params
+
+
+def _digitize(body: bytes, suffix: str, params: Dict) -> np.ndarray:
+    r"""Digitize a posted image in a worker process."""
+    from .api import digitize
+    with tempfile.TemporaryDirectory(prefix='datadigitizer-') as folder:
+        fpath = pathlib.Path(folder) / f'upload{suffix}'
+        fpath.write_bytes(body)
+        return digitize(fpath, **params)
+
+
+def to_json(data: np.ndarray) -> bytes:
+    r"""Encode the points as a JSON object with one list per field, NaN as null."""
+    columns = {}
+    for name in data.dtype.names:
+        values = data[name].tolist()
+        if data.dtype[name].kind == 'f':
+            values = [None if value != value else value for value in values]
+        columns[name] = values
+    return json.dumps({'count': int(data.size), 'points': columns}).encode()
+
+
+class JobService(object):
+    r"""Class for the bounded pool of digitization jobs. See __init__.__doc__."""
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 16):
+        r"""
+        Worker processes with a bounded number of running and waiting jobs.
+
+        Parameters
+        ----------
+        workers: int, optional
+            Number of worker processes. By default, the number of processors.
+        queue_size: int, optional
+            Number of jobs waiting for a worker beyond which the jobs are rejected.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, function: Callable, *args) -> Optional[concurrent.futures.Future]:
+        r"""
+        Submit a job unless the workers and the queue are full.
+
+        Parameters
+        ----------
+        function: callable
+            Picklable function.
+        args: tuple
+            Picklable arguments.
+
+        Returns
+        -------
+        future: Future or None
+            Future of the job or None if rejected.
+        """
+        if not self.reserve():
+            return None
+        return self.submit_reserved(function, *args)
+
+    def reserve(self) -> bool:
+        r"""
+        Reserve a slot for a job unless the workers and the queue are full.
+
+        The slot is given back by :meth:`release` or when the job submitted by
+        :meth:`submit_reserved` is done.
+
+        Returns
+        -------
+        reserved: bool
+            False if rejected.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.pending += 1
+        return True
+
+    def submit_reserved(self, function: Callable, *args) -> concurrent.futures.Future:
+        r"""
+        Submit a job in a slot reserved by :meth:`reserve`.
+
+        Parameters
+        ----------
+        function: callable
+            Picklable function.
+        args: tuple
+            Picklable arguments.
+
+        Returns
+        -------
+        future: Future
+            Future of the job.
+        """
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(self.release)
+        return future
+
+    def release(self, *args):
+        r"""Give back a reserved slot."""
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def status(self) -> Dict:
+        r"""Return the number of workers, the capacity, the pending and the rejected jobs."""
+        with self._lock:
+            return {'workers': self.workers, 'capacity': self.workers + self.queue_size,
+                    'pending': self.pending, 'rejected': self.rejected}
+
+    def close(self):
+        r"""Wait for the submitted jobs and stop the workers."""
+        self._executor.shutdown(wait=True)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    r"""Handler of the digitization requests."""
+
+    protocol_version = 'HTTP/1.1'
+    # idle keep-alive connections do not hold a thread forever
+    timeout = 60
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json', **headers):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key.replace('_', '-'), value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, **headers):
+        self._send(status, json.dumps({'error': message}).encode(), **headers)
+
+    def _reject(self, length: int, status: int, message: str, **headers):
+        r"""Reject a request without keeping its body and close the connection."""
+        # a small unread body would reset the connection before the client reads the response
+        while 0 < length <= DISCARD_BYTES:
+            chunk = self.rfile.read(min(length, 2**16))
+            if not chunk:
+                break
+            length -= len(chunk)
+        self.close_connection = True
+        self._error(status, message, **headers)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != '/health':
+            self._error(404, 'unknown path, use POST /digitize or GET /health.')
+            return
+        self._send(200, json.dumps(self.server.service.status()).encode())
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/digitize':
+            self.close_connection = True
+            self._error(404, 'unknown path, use POST /digitize or GET /health.')
+            return
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.close_connection = True
+            self._error(411, 'Content-Length is required.')
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # the body cannot be delimited: the connection cannot be reused
+            self.close_connection = True
+            self._error(400, 'Content-Length must be a non-negative integer.')
+            return
+        if length > self.server.max_bytes:
+            # the body is not read: the connection cannot be reused
+            self.close_connection = True
+            self._error(413, f'the image exceeds {self.server.max_bytes} bytes.')
+            return
+        # the requests are checked before reading the body, which is then not kept
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in CONTENT_TYPES:
+            self._reject(length, 415, f'Content-Type must be one of {", ".join(CONTENT_TYPES)}.')
+            return
+        try:
+            params = parse_params(url.query)
+        except ValueError as error:
+            self._reject(length, 400, str(error))
+            return
+        # the slot is reserved before reading the body so that the waiting bodies are bounded
+        service = self.server.service
+        if not service.reserve():
+            self._reject(length, 503, 'the workers are busy, retry later.', Retry_After='1')
+            return
+        try:
+            body = self.rfile.read(length)
+            future = service.submit_reserved(_digitize, body, CONTENT_TYPES[content_type], params)
+        except BaseException:
+            service.release()
+            raise
+        try:
+            data = future.result()
+        except Exception as error:
+            self._error(422, f'{type(error).__name__}: {error}')
+            return
+        if NPY_TYPE in self.headers.get('Accept', ''):
+            buffer = io.BytesIO()
+            np.save(buffer, data, allow_pickle=False)
+            self._send(200, buffer.getvalue(), NPY_TYPE)
+        else:
+            self._send(200, to_json(data))
+
+    def log_message(self, format: str, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Server(http.server.ThreadingHTTPServer):
+    r"""Class for the HTTP job service. See __init__.__doc__."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8000, workers: Optional[int] = None,
+                 queue_size: int = 16, max_bytes: int = MAX_BYTES, max_connections: int = MAX_CONNECTIONS,
+                 verbose: bool = False):
+        r"""
+        HTTP server handling each request in a thread and digitizing in worker processes.
+
+        Parameters
+        ----------
+        host: str, optional
+            Address to listen on. Only the local machine by default.
+        port: int, optional
+            Port to listen on, 0 for any free port.
+        workers: int, optional
+            Number of worker processes. By default, the number of processors.
+        queue_size: int, optional
+            Number of jobs waiting for a worker beyond which the requests get 503.
+        max_bytes: int, optional
+            Maximal size of the posted images.
+        max_connections: int, optional
+            Number of connections handled at once, one thread each. The connections
+            beyond it get 503 at once and are closed.
+        verbose: bool, optional
+            Log each request on the standard error.
+        """
+        self.service = JobService(workers, queue_size)
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        self._connections = threading.BoundedSemaphore(max_connections)
+        super().__init__((host, port), Handler)
+
+    def process_request(self, request, client_address):
+        if not self._connections.acquire(blocking=False):
+            # answered from the accepting thread without reading the request
+            try:
+                request.sendall(_BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self._connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connections.release()
+
+    @property
+    def url(self) -> str:
+        r"""Base URL of the server."""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def server_close(self):
+        super().server_close()
+        self.service.close()
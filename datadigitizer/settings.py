@@ -19,6 +19,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 Author: Milan Skocic <milan.skocic@gmail.com>
 """
 import os
+import sys
+import atexit
+import threading
+import functools
+import contextlib
 import configparser
 import re
 from typing import Dict
@@ -27,9 +32,6 @@ from . import version
 APP_NAME = version.__package_name__.replace(' ', '').lower()
 CFG_FOLDER = os.path.abspath(os.path.expanduser('~') + '/' + '.' + APP_NAME + '/')
 
-if not os.path.exists(CFG_FOLDER):
-    os.mkdir(CFG_FOLDER)
-
 # default profiles
 DEFAULT_PROFILE_VALUES = {}
 
@@ -45,6 +47,29 @@ default_folders_profile_ini = dict(DEFAULT=default_values,
 # map default values to each profile_type
 DEFAULT_PROFILE_VALUES.update({name: default_folders_profile_ini})
 
+# batch profile - defaults of the batch, watch and serve commands
+# the DEFAULT section is reset to the default values, the USER section is edited
+name = 'batch'
+default_values = {'output folder': '.',
+                  'method': 'auto',
+                  'format': 'long',
+                  'workers': 1,
+                  'cache folder': os.path.join(CFG_FOLDER, 'cache'),
+                  'cache size': 512,
+                  'template folder': os.path.join(CFG_FOLDER, 'templates'),
+                  'interval': 2.0,
+                  'settle': 2.0,
+                  'watch queue': 64,
+                  'host': '127.0.0.1',
+                  'port': 8000,
+                  'queue': 16,
+                  'max size': 64,
+                  'max connections': 64}
+default_batch_profile_ini = dict(DEFAULT=default_values,
+                                 USER={})
+
+DEFAULT_PROFILE_VALUES.update({name: default_batch_profile_ini})
+
 # map all profile types to the desired profile (section): dict(profile_type=profile_name)
 # profiles.ini configuration file has only a DEFAULT section
 # where the profile types are mapped to the profile names
@@ -68,42 +93,119 @@ def _typed_option(s):
     """
 
     if isinstance(s, str):
-        str_elements = s.replace(' ', '')
-        str_elements = str_elements.replace('(', '').replace(')', '')
-        str_elements = str_elements.replace('\'', '').replace('"', '')
-        str_elements = str_elements.replace('[', '').replace(']', '')
-        str_elements = str_elements.replace('{', '').replace('}', '')
-        str_elements = str_elements.split(',')
+        return _typed_str(s)
+    else:
+        return s
 
-        typed_elements = []
 
-        for i in str_elements:
-            try:
-                if '.' in i:
+@functools.lru_cache(maxsize=1024)
+def _typed_str(s):
+    r"""Parse a string from config file. The results are cached since they are immutable."""
+    str_elements = s.replace(' ', '')
+    str_elements = str_elements.replace('(', '').replace(')', '')
+    str_elements = str_elements.replace('\'', '').replace('"', '')
+    str_elements = str_elements.replace('[', '').replace(']', '')
+    str_elements = str_elements.replace('{', '').replace('}', '')
+    str_elements = str_elements.split(',')
+
+    typed_elements = []
+
+    for i in str_elements:
+        try:
+            if '.' in i:
+                new_element = float(i)
+            else:
+                _s = re.findall(r"\d{0,9}e.\d{0,9}", i)
+                if len(_s) > 0:
                     new_element = float(i)
                 else:
-                    _s = re.findall(r"\d{0,9}e.\d{0,9}", i)
-                    if len(_s) > 0:
-                        new_element = float(i)
-                    else:
-                        new_element = int(i)
+                    new_element = int(i)
 
-            except ValueError:
-                if i.lower() == 'true':
-                    new_element = True
-                elif i.lower() == 'false':
-                    new_element = False
-                else:
-                    new_element = str(i)
+        except ValueError:
+            if i.lower() == 'true':
+                new_element = True
+            elif i.lower() == 'false':
+                new_element = False
+            else:
+                new_element = str(i)
 
-            typed_elements.append(new_element)
+        typed_elements.append(new_element)
 
-        if len(typed_elements) == 1:
-            return typed_elements[0]
-        else:
-            return tuple(typed_elements)
+    if len(typed_elements) == 1:
+        return typed_elements[0]
     else:
-        return s
+        return tuple(typed_elements)
+
+
+def _new_parser() -> configparser.ConfigParser:
+    return configparser.ConfigParser(converters={'_typed_option': _typed_option})
+
+
+def _cfg_path(cfg_folder: str, cfg_name: str) -> str:
+    return os.path.abspath(cfg_folder + '/' + cfg_name + '.ini')
+
+
+@contextlib.contextmanager
+def _file_lock(fpath: str):
+    r"""
+    Lock a configuration file against the other instances of the application.
+
+    The lock is an advisory lock on a side file fpath.lock. It is only taken for
+    writing: the configuration folder is created if needed.
+
+    Parameters
+    ----------
+    fpath: str
+        Path to the configuration file.
+    """
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    with open(fpath + '.lock', 'a+') as fobj:
+        if sys.platform == 'win32':
+            import msvcrt
+            fobj.seek(0)
+            msvcrt.locking(fobj.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                fobj.seek(0)
+                msvcrt.locking(fobj.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fobj.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fobj.fileno(), fcntl.LOCK_UN)
+
+
+def _atomic_write(fpath: str, cfg: configparser.ConfigParser):
+    r"""
+    Write a configuration file in a temporary file renamed over the target.
+
+    Readers never see a partially written file. The configuration folder is
+    created if needed.
+
+    Parameters
+    ----------
+    fpath: str
+        Path to the configuration file.
+    cfg: ConfigParser
+    """
+    import tempfile
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(fpath),
+                                    suffix='.tmp',
+                                    dir=os.path.dirname(fpath))
+    try:
+        with os.fdopen(fd, 'w') as fobj:
+            cfg.write(fobj)
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        os.replace(tmp_path, fpath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def read_cfg(cfg_folder: str, cfg_name: str, cfg_default: Dict, update: bool=True):
@@ -121,15 +223,12 @@ def read_cfg(cfg_folder: str, cfg_name: str, cfg_default: Dict, update: bool=Tru
     update: bool
         Flag for indicating if the default section has to be updated.
     """
-    if not os.path.exists(cfg_folder):
-        os.mkdir(cfg_folder)
-
-    _cfg = configparser.ConfigParser(converters={'_typed_option': _typed_option})
+    _cfg = _new_parser()
     _cfg.read_dict(cfg_default)
 
-    cfg = configparser.ConfigParser(converters={'_typed_option': _typed_option})
+    cfg = _new_parser()
 
-    fpath = os.path.abspath(cfg_folder + '/' + cfg_name + '.ini')
+    fpath = _cfg_path(cfg_folder, cfg_name)
 
     if not os.path.exists(fpath):
         save_cfg(cfg_folder, cfg_name, _cfg)
@@ -137,10 +236,10 @@ def read_cfg(cfg_folder: str, cfg_name: str, cfg_default: Dict, update: bool=Tru
     else:
         cfg.read(fpath)
 
-    if update:
+    # the file is rewritten only if the defaults were changed
+    if update and (dict(cfg.defaults()) != dict(_cfg.defaults())):
         cfg.defaults().update(_cfg.defaults())
-        with open(fpath, 'w') as fobj:
-            cfg.write(fobj)
+        save_cfg(cfg_folder, cfg_name, cfg)
 
     return cfg
 
@@ -161,9 +260,9 @@ def save_cfg(cfg_folder, cfg_name, cfg):
     -----------
     None
     """
-    fpath = os.path.abspath(cfg_folder + '/' + cfg_name + '.ini')
-    with open(fpath, 'w') as fobj:
-        cfg.write(fobj)
+    fpath = _cfg_path(cfg_folder, cfg_name)
+    with _file_lock(fpath):
+        _atomic_write(fpath, cfg)
 
 
 def read_profiles():
@@ -171,3 +270,179 @@ def read_profiles():
     Read all the profiles.
     """
     return read_cfg(CFG_FOLDER, 'profiles', DEFAULT_PROFILE_TYPES, update=False)
+
+
+class SettingsStore(object):
+    r"""Class for the in-memory settings. See __init__.__doc__."""
+
+    def __init__(self, cfg_folder: str = CFG_FOLDER):
+        r"""
+        In-memory settings shared by the graphical interface and the batch modes.
+
+        Each configuration file is parsed once and the typed values are cached.
+        Changes are kept in memory and only the modified sections are written back
+        by :meth:`save` or :meth:`flush`: the file is re-read under a file lock so that
+        the sections modified by other instances are preserved, and it is
+        replaced atomically.
+
+        Parameters
+        ----------
+        cfg_folder: str, optional
+            Path to the configuration folder.
+        """
+        self.cfg_folder = cfg_folder
+        self._configs = {}
+        self._typed = {}
+        self._dirty = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _defaults(cfg_name: str) -> Dict:
+        if cfg_name == 'profiles':
+            return DEFAULT_PROFILE_TYPES
+        return DEFAULT_PROFILE_VALUES.get(cfg_name, {})
+
+    def config(self, cfg_name: str) -> configparser.ConfigParser:
+        r"""
+        Return the parsed configuration, reading the file on first access.
+
+        Missing files and default sections different from the default values
+        are marked for being written at the next save.
+
+        Parameters
+        ----------
+        cfg_name: str
+            Name of the configuration file.
+        """
+        with self._lock:
+            if cfg_name not in self._configs:
+                default = _new_parser()
+                default.read_dict(self._defaults(cfg_name))
+
+                cfg = _new_parser()
+                fpath = _cfg_path(self.cfg_folder, cfg_name)
+                dirty = set()
+                if os.path.exists(fpath):
+                    cfg.read(fpath)
+                else:
+                    cfg.read_dict(default)
+                    dirty.update(cfg.sections() + [configparser.DEFAULTSECT])
+                # only the profile types update their default section (see read_profiles)
+                if (cfg_name != 'profiles') and (dict(cfg.defaults()) != dict(default.defaults())):
+                    cfg.defaults().update(default.defaults())
+                    dirty.add(configparser.DEFAULTSECT)
+
+                self._configs[cfg_name] = cfg
+                self._dirty[cfg_name] = dirty
+            return self._configs[cfg_name]
+
+    def get(self, cfg_name: str, section: str, option: str):
+        r"""
+        Get a typed option.
+
+        Parameters
+        ----------
+        cfg_name: str
+            Name of the configuration file.
+        section: str
+            Section name.
+        option: str
+            Option name.
+
+        Returns
+        -------
+        value: int/float or str or iterable
+            Typed value parsed by _typed_option.
+        """
+        key = (cfg_name, section, option)
+        try:
+            return self._typed[key]
+        except KeyError:
+            with self._lock:
+                value = self.config(cfg_name).get_typed_option(section=section, option=option)
+                self._typed[key] = value
+            return value
+
+    def set(self, cfg_name: str, section: str, option: str, value):
+        r"""
+        Set an option in memory and mark its section for being written.
+
+        Parameters
+        ----------
+        cfg_name: str
+            Name of the configuration file.
+        section: str
+            Section name.
+        option: str
+            Option name.
+        value: object
+            Value converted to str.
+        """
+        with self._lock:
+            cfg = self.config(cfg_name)
+            value = str(value)
+            if (section != configparser.DEFAULTSECT) and (not cfg.has_section(section)):
+                cfg.add_section(section)
+            if cfg.get(section, option, fallback=None) == value:
+                return
+            cfg.set(section, option, value)
+            # options inherited from the default section may change in other sections
+            self._typed = {key: v for key, v in self._typed.items() if key[0] != cfg_name}
+            self._dirty[cfg_name].add(section)
+
+    def save(self, cfg_name: str):
+        r"""
+        Write the modified sections of a configuration file.
+
+        Parameters
+        ----------
+        cfg_name: str
+            Name of the configuration file.
+        """
+        with self._lock:
+            dirty = self._dirty.get(cfg_name)
+            if not dirty:
+                return
+            cfg = self._configs[cfg_name]
+            fpath = _cfg_path(self.cfg_folder, cfg_name)
+            with _file_lock(fpath):
+                merged = _new_parser()
+                merged.read(fpath)
+                for section in dirty:
+                    if section == configparser.DEFAULTSECT:
+                        merged.defaults().update(cfg.defaults())
+                    else:
+                        if merged.has_section(section):
+                            merged.remove_section(section)
+                        merged.add_section(section)
+                        for option, value in cfg.items(section, raw=True):
+                            if cfg.defaults().get(option) != value:
+                                merged.set(section, option, value)
+                _atomic_write(fpath, merged)
+            self._configs[cfg_name] = merged
+            self._typed = {key: v for key, v in self._typed.items() if key[0] != cfg_name}
+            dirty.clear()
+
+    def flush(self):
+        r"""Write the modified sections of all the configuration files."""
+        with self._lock:
+            for cfg_name in list(self._configs):
+                self.save(cfg_name)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> SettingsStore:
+    r"""
+    Return the settings store shared by the application.
+
+    It is created on first access and flushed at exit.
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = SettingsStore(CFG_FOLDER)
+            atexit.register(_STORE.flush)
+    return _STORE
@@ -0,0 +1,197 @@
+r"""
+Shared module.
+
+Decoded images shared with the worker processes. The image is copied once into a
+shared memory block and the workers attach a read-only numpy view of the block
+instead of receiving a pickled copy: the memory used by several workers processing
+the same image stays close to one copy of the image.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+import weakref
+import concurrent.futures
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+# blocks created by this process, for handing over the arrays already shared
+_OWNED = weakref.WeakSet()
+
+
+def _attach(name: str):
+    r"""Attach an existing shared memory block without taking its ownership."""
+    from multiprocessing import shared_memory
+    try:
+        # Python >= 3.13: only the creator tracks the block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # the pool workers share the resource tracker of their parent: the block is tracked once
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedImage(object):
+    r"""Class for the images stored in shared memory. See __init__.__doc__."""
+
+    def __init__(self, shape: Sequence[int], dtype: Union[str, np.dtype], name: Optional[str] = None):
+        r"""
+        Numpy array stored in a shared memory block.
+
+        The creator of the block owns it: the block is unlinked when the owner is
+        closed, also when an exception leaves a with statement. The blocks of a
+        crashed owner are unlinked by the resource tracker of multiprocessing. The
+        attached views are read-only. Requires Python 3.8 or later.
+
+        Parameters
+        ----------
+        shape: sequence of int
+            Shape of the array.
+        dtype: str or dtype
+            Type of the array.
+        name: str, optional
+            Name of the block to attach. A new block is created by default.
+        """
+        from multiprocessing import shared_memory
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            nbytes = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            _OWNED.add(self)
+        else:
+            self._shm = _attach(name)
+        self.name = self._shm.name
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+        if not self.owner:
+            self.array.flags.writeable = False
+
+    @classmethod
+    def from_array(cls, array: np.ndarray):
+        r"""
+        Copy an array into a new block.
+
+        Parameters
+        ----------
+        array: array-like
+            Array to share, e.g. a decoded image. The copy can replace it so that only
+            one copy is kept.
+        """
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle: Tuple[str, Tuple[int, ...], str]):
+        r"""
+        Attach a block from its handle.
+
+        Parameters
+        ----------
+        handle: tuple
+            Name, shape and type as given by the handle property.
+        """
+        name, shape, dtype = handle
+        return cls(shape, dtype, name)
+
+    @classmethod
+    def of(cls, array: np.ndarray):
+        r"""Return the block owned by this process holding exactly the array or None."""
+        for shared in list(_OWNED):
+            if (shared.array is not None and array.shape == shared.shape and array.dtype == shared.dtype
+                    and array.__array_interface__['data'][0] == shared.array.__array_interface__['data'][0]
+                    and array.strides == shared.array.strides):
+                return shared
+        return None
+
+    @property
+    def handle(self) -> Tuple[str, Tuple[int, ...], str]:
+        r"""Picklable name, shape and type of the block."""
+        return self.name, self.shape, self.dtype.str
+
+    def close(self):
+        r"""Release the view and unlink the block if owned."""
+        if self._shm is None:
+            return
+        self.array = None
+        if self.owner:
+            _OWNED.discard(self)
+            self._shm.unlink()
+        try:
+            self._shm.close()
+        except BufferError:
+            # views of the array are still alive: the mapping is released with them
+            pass
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _call(handle: Tuple[str, Tuple[int, ...], str], function: Callable, args: Tuple) -> Any:
+    r"""Call a function on an attached image in a worker process."""
+    shared = SharedImage.attach(handle)
+    try:
+        return function(shared.array, *args)
+    finally:
+        shared.close()
+
+
+def map_image(function: Callable, image_array: np.ndarray, args: Iterable[Tuple],
+              workers: Optional[int] = None) -> List[Any]:
+    r"""
+    Call a function on the same image with several arguments in worker processes.
+
+    The image is shared with the workers instead of being pickled for each call. An
+    image already stored in a block owned by this process is not copied again.
+
+    Parameters
+    ----------
+    function: callable
+        Picklable function called as function(image_array, *arguments). Its result
+        must not be a view of the image.
+    image_array: array-like
+        Image shared by the calls.
+    args: iterable of tuple
+        Arguments of each call.
+    workers: int, optional
+        Number of worker processes. By default, the number of processors.
+        The calls are made in the current process if workers is 1.
+
+    Returns
+    -------
+    results: list
+        Results of the calls in the order of the arguments.
+    """
+    args = list(args)
+    if workers == 1 or len(args) < 2:
+        return [function(image_array, *arguments) for arguments in args]
+    workers = min(workers or os.cpu_count() or 1, len(args))
+    shared = SharedImage.of(image_array)
+    created = shared is None
+    if created:
+        shared = SharedImage.from_array(np.asarray(image_array))
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_call, shared.handle, function, arguments) for arguments in args]
+            return [future.result() for future in futures]
+    finally:
+        if created:
+            shared.close()
@@ -0,0 +1,315 @@
+r"""
+Templates module.
+
+Calibration templates reused on the figures sharing the same axis layout, e.g. the
+pages of a journal or the exports of an instrument. A template records the limit
+points, their values, the units and the log flags with a downsampled copy of the
+lines of its reference image. A new image is aligned onto the reference by phase
+correlation and the limit points are moved by the found translation.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import json
+import pathlib
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from .core import Calibration, LIMITS, new_data, add_points
+from .imaging import grayscale, downsample
+from .preprocessing import binarize, remove_grid
+from .settings import get_store
+
+TEMPLATE_SUFFIX = '.npz'
+
+
+def template_folder() -> pathlib.Path:
+    r"""Return the template folder of the batch settings."""
+    return pathlib.Path(get_store().get('batch', 'USER', 'template folder'))
+
+
+def _subpixel(values: np.ndarray, k: int) -> float:
+    r"""Return the offset of the vertex of the parabola passing by the neighbours of a peak."""
+    left, center, right = values[(k - 1) % values.size], values[k], values[(k + 1) % values.size]
+    denominator = left - 2 * center + right
+    return float(0.5 * (left - right) / denominator) if denominator < 0 else 0.0
+
+
+def phase_correlation(reference: np.ndarray, image: np.ndarray) -> Tuple[float, float, float]:
+    r"""
+    Find the translation aligning an image onto a reference of the same shape.
+
+    The cross-power spectrum is normalized so that only the phase is kept: its inverse
+    transform is a peak at the translation. The images are windowed to avoid the
+    artefacts of the periodic borders and the peak is refined by parabolic fits.
+
+    Parameters
+    ----------
+    reference: array-like, shape (n, m)
+        Reference image.
+    image: array-like, shape (n, m)
+        Translated image.
+
+    Returns
+    -------
+    di, dj: float
+        Translation in rows and columns such that image[i + di, j + dj] = reference[i, j].
+    peak: float
+        Height of the correlation peak between 0 and 1: close to 0 for unrelated images.
+    """
+    window = np.outer(np.hanning(reference.shape[0]), np.hanning(reference.shape[1]))
+    spectra = [np.fft.rfft2((a - a.mean()) * window) for a in (reference, image)]
+    cross = spectra[1] * np.conj(spectra[0])
+    cross /= np.maximum(np.abs(cross), 1e-12)
+    correlation = np.fft.irfft2(cross, s=reference.shape)
+    k, l = np.unravel_index(np.argmax(correlation), correlation.shape)
+    di = k + _subpixel(correlation[:, l], k)
+    dj = l + _subpixel(correlation[k, :], l)
+    # the translations are periodic
+    di = di - reference.shape[0] if di > reference.shape[0] / 2 else di
+    dj = dj - reference.shape[1] if dj > reference.shape[1] / 2 else dj
+    return float(di), float(dj), float(correlation[k, l])
+
+
+def layout(image_array: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    r"""
+    Downsample the long horizontal and vertical lines of an image.
+
+    The axes, the frame and the grid lines give the layout of a figure whereas the
+    curves and the tick labels change from a figure to another.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread.
+    shape: tuple of int
+        Shape of the output.
+
+    Returns
+    -------
+    lines: array-like, shape
+        Fraction of line pixels in each output pixel.
+    """
+    binary = binarize(grayscale(image_array))
+    lines = binary & ~remove_grid(binary, min(binary.shape) // 4)
+    return downsample(lines, shape)
+
+
+class Template(object):
+    r"""Class for the calibration templates. See __init__.__doc__."""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], calibration: Calibration,
+                 shape: Tuple[int, int], thumbnail: np.ndarray,
+                 xunit: str = 'a.u.', yunit: str = 'a.u.'):
+        r"""
+        Calibration template: limit points of a reference image with their values.
+
+        Parameters
+        ----------
+        limits: dict
+            Matrix indexes i, j of xmin, xmax, ymin and ymax in the reference image.
+        calibration: Calibration
+            Calibration of the reference image.
+        shape: tuple of int
+            Number of rows and columns of the reference image.
+        thumbnail: array-like, shape (k, l)
+            Downsampled lines of the reference image as returned by layout.
+        xunit: str, optional
+            Unit of the x values.
+        yunit: str, optional
+            Unit of the y values.
+        """
+        self.limits = {name: (float(limits[name][0]), float(limits[name][1])) for name in LIMITS}
+        self.calibration = calibration
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.thumbnail = np.asarray(thumbnail, dtype=np.float64)
+        self.xunit = xunit
+        self.yunit = yunit
+
+    @classmethod
+    def from_data(cls, data: np.ndarray, image_array: np.ndarray,
+                  xvalues: Tuple[float, float], yvalues: Tuple[float, float],
+                  xlog: bool = False, ylog: bool = False,
+                  xunit: str = 'a.u.', yunit: str = 'a.u.', size: int = 512):
+        r"""
+        Create a template from the limits registered in the data.
+
+        Parameters
+        ----------
+        data: structured array, shape (n,)
+            Numpy structured array used for registering the extracted data.
+        image_array: array-like, shape (n, m) or (n, m, c)
+            Reference image as returned by imread.
+        xvalues: tuple of floats
+            Xmin and Xmax values.
+        yvalues: tuple of floats
+            Ymin and Ymax values.
+        xlog: bool, optional
+            Flag for log scale on the x axis.
+        ylog: bool, optional
+            Flag for log scale on the y axis.
+        xunit: str, optional
+            Unit of the x values.
+        yunit: str, optional
+            Unit of the y values.
+        size: int, optional
+            Largest side of the thumbnail used for the registration.
+        """
+        limits = {}
+        for name in LIMITS:
+            rows = data[data['type'] == name]
+            if rows.size != 1:
+                raise ValueError(f'{name} must be set once (found {rows.size}).')
+            limits[name] = (rows['i'][0], rows['j'][0])
+        shape = image_array.shape[:2]
+        scale = min(size / max(shape), 1.0)
+        thumbnail = layout(image_array, (max(int(shape[0] * scale), 1), max(int(shape[1] * scale), 1)))
+        calibration = Calibration.from_data(data, xvalues, yvalues, xlog, ylog)
+        return cls(limits, calibration, shape, thumbnail, xunit, yunit)
+
+    def locate(self, image_array: np.ndarray) -> Tuple[Dict[str, Tuple[float, float]], float]:
+        r"""
+        Find the limit points in an image with the same layout as the reference.
+
+        An image with the aspect ratio of the reference is a figure exported at another
+        resolution: its lines are shrunk to the thumbnail shape. Otherwise, the canvas
+        differs and the pixels are assumed to have the size of the reference ones. Only
+        the translations are found.
+
+        Parameters
+        ----------
+        image_array: array-like, shape (n, m) or (n, m, c)
+            Image as returned by imread.
+
+        Returns
+        -------
+        limits: dict
+            Matrix indexes i, j of xmin, xmax, ymin and ymax in the image.
+        peak: float
+            Height of the correlation peak, see phase_correlation.
+        """
+        shape = image_array.shape[:2]
+        rows, cols = self.thumbnail.shape
+        if shape[0] < rows or shape[1] < cols:
+            raise ValueError(f'the image {shape} is smaller than the template thumbnail.')
+        # image pixels per thumbnail pixel of the reference (f) and of the image (g)
+        fi, fj = self.shape[0] / rows, self.shape[1] / cols
+        if abs(shape[0] * self.shape[1] / (shape[1] * self.shape[0]) - 1) <= 0.02:
+            gi, gj = shape[0] / rows, shape[1] / cols
+            lines = layout(image_array, self.thumbnail.shape)
+        else:
+            gi, gj = fi, fj
+            small = layout(image_array, (max(int(round(shape[0] / fi)), 1), max(int(round(shape[1] / fj)), 1)))
+            lines = np.zeros(self.thumbnail.shape)
+            lines[:min(rows, small.shape[0]), :min(cols, small.shape[1])] = small[:rows, :cols]
+        di, dj, peak = phase_correlation(self.thumbnail, lines)
+        limits = {name: ((i + 0.5 + di * fi) * gi / fi - 0.5, (j + 0.5 + dj * fj) * gj / fj - 0.5)
+                  for name, (i, j) in self.limits.items()}
+        return limits, peak
+
+    def apply(self, image_array: np.ndarray, min_peak: float = 0.05) -> Tuple[np.ndarray, Calibration, float]:
+        r"""
+        Calibrate an image with the same layout as the reference.
+
+        Parameters
+        ----------
+        image_array: array-like, shape (n, m) or (n, m, c)
+            Image as returned by imread.
+        min_peak: float, optional
+            Minimal height of the correlation peak. A lower peak means that the image
+            does not share the layout of the reference and raises a ValueError.
+
+        Returns
+        -------
+        data: structured array, shape (4,)
+            Limit points.
+        calibration: Calibration
+            Calibration of the image.
+        peak: float
+            Height of the correlation peak.
+        """
+        limits, peak = self.locate(image_array)
+        if peak < min_peak:
+            raise ValueError(f'the image does not match the template (peak {peak:.3f} < {min_peak}).')
+        data = new_data()
+        for name in LIMITS:
+            data = add_points(data, *limits[name], row=image_array.shape[0], which=name)
+        calibration = Calibration.from_data(data, self.calibration.xvalues, self.calibration.yvalues,
+                                            self.calibration.xlog, self.calibration.ylog)
+        return data, calibration, peak
+
+    def save(self, fpath: Union[str, pathlib.Path]):
+        r"""
+        Save the template in a compressed numpy file.
+
+        Parameters
+        ----------
+        fpath: str or Path
+            Path to the template file.
+        """
+        meta = {'limits': self.limits, 'calibration': self.calibration.to_dict(),
+                'shape': list(self.shape), 'xunit': self.xunit, 'yunit': self.yunit}
+        pathlib.Path(fpath).parent.mkdir(parents=True, exist_ok=True)
+        with open(fpath, 'wb') as fobj:
+            np.savez_compressed(fobj, thumbnail=self.thumbnail.astype(np.float32), meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, fpath: Union[str, pathlib.Path]):
+        r"""
+        Load a template file or a named template of the template folder.
+
+        Parameters
+        ----------
+        fpath: str or Path
+            Path to the template file or name of the template.
+        """
+        fpath = template_path(fpath)
+        with np.load(fpath) as archive:
+            meta = json.loads(str(archive['meta']))
+            thumbnail = archive['thumbnail']
+        return cls(meta['limits'], Calibration.from_dict(meta['calibration']), meta['shape'], thumbnail,
+                   meta['xunit'], meta['yunit'])
+
+
+def template_path(name: Union[str, pathlib.Path], folder: Optional[Union[str, pathlib.Path]] = None) -> pathlib.Path:
+    r"""
+    Return the path of a template given by its path or by its name in the template folder.
+
+    Parameters
+    ----------
+    name: str or Path
+        Path to the template file or name of the template.
+    folder: str or Path, optional
+        Template folder. The one of the batch settings by default.
+    """
+    fpath = pathlib.Path(name)
+    if fpath.suffix == TEMPLATE_SUFFIX or fpath.exists():
+        return fpath
+    return (template_folder() if folder is None else pathlib.Path(folder)) / f'{name}{TEMPLATE_SUFFIX}'
+
+
+def list_templates(folder: Optional[Union[str, pathlib.Path]] = None) -> List[str]:
+    r"""
+    Return the names of the templates of the template folder.
+
+    Parameters
+    ----------
+    folder: str or Path, optional
+        Template folder. The one of the batch settings by default.
+    """
+    folder = template_folder() if folder is None else pathlib.Path(folder)
+    return sorted(fpath.stem for fpath in folder.glob(f'*{TEMPLATE_SUFFIX}'))
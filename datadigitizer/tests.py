@@ -18,50 +18,117 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 Author: Milan Skocic <milan.skocic@gmail.com>
 """
+import io
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
 import pathlib
+import tempfile
 import unittest
+import unittest.mock
+import subprocess
+from typing import Optional
 import numpy as np
-import matplotlib.pyplot as plt
-from .settings import CFG_FOLDER
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from .settings import CFG_FOLDER, SettingsStore
+from .imaging import grayscale, refine_centroid
+from .export import column_blocks, long_format, decimate, make_grid, parse_grid, resample
+from .profiling import Profiler
+from .core import new_data, add_points, nearest_point, measure, paint_overlay, LIMITS
+from .extraction import color_mask, extract_color, component_properties, detect_markers, label_runs
+from .tracing import trace
+from .preprocessing import Pipeline, binarize, otsu_threshold
+from .palette import discover_colors
+from . import vector
+from . import pages
+from . import batch
+from .templates import Template, phase_correlation
+from .cache import ResultCache, make_key
+from . import corpus
+from . import shared
+from . import extraction, tiling
+from . import kernels
+from .server import Server
+from . import api
+from .watch import Watcher
 
 
-def test_linear() -> pathlib.Path:
+# modules which must not be imported before the window is shown
+STARTUP_BANNED_MODULES = ('matplotlib', 'PIL', 'concurrent.futures', 'cProfile', 'json', 'tempfile', 'mmap',
+                          'xml.etree', 'datadigitizer.extraction', 'datadigitizer.export',
+                          'datadigitizer.pages', 'datadigitizer.palette', 'datadigitizer.templates',
+                          'datadigitizer.tests', 'datadigitizer.tracing', 'datadigitizer.vector')
+
+
+def _figure() -> Figure:
+    r"""Create a figure rendered by Agg without going through pyplot."""
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _folder(folder: Optional[pathlib.Path] = None) -> pathlib.Path:
+    r"""Return the folder of the test plots, the configuration folder by default."""
+    folder = pathlib.Path(CFG_FOLDER if folder is None else folder)
+    folder.mkdir(exist_ok=True)
+    return folder
+
+
+def test_linear(folder: Optional[pathlib.Path] = None) -> pathlib.Path:
     r"""
     Generate the linear plot and data.
 
+    Parameters
+    ----------
+    folder: Path, optional
+        Folder of the plot and data, the configuration folder by default.
+
     Returns
     -------
     fpath: Path object
         Path to the linear plot.
     """
     x = np.arange(0, 10, 1)
-    fig = plt.figure()
+    fig = _figure()
     ax = fig.add_subplot(111)
     y = 1*x+1
     ax.plot(x, y, 'k+')
     m = np.vstack((x, y)).transpose()
     name = 'linear'
     ext = '.txt'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     np.savetxt(fpath, X=m, header='x\ty', delimiter='\t')
     ext = '.png'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     fig.savefig(fpath, dpi=100, format='png')
 
     return fpath
 
 
-def test_ylog() -> pathlib.Path:
+def test_ylog(folder: Optional[pathlib.Path] = None) -> pathlib.Path:
     r"""
     Generate the semi-log plot and data.
 
+    Parameters
+    ----------
+    folder: Path, optional
+        Folder of the plot and data, the configuration folder by default.
+
     Returns
     -------
     fpath: Path object
         Path to the semi-log plot.
     """
     x = np.arange(0, 10, 1)
-    fig = plt.figure()
+    fig = _figure()
     ax = fig.add_subplot(111)
     y = 10**x
     ax.plot(x, y, 'k+')
@@ -69,26 +136,31 @@ def test_ylog() -> pathlib.Path:
     m = np.vstack((x, y)).transpose()
     name = 'ylog'
     ext = '.txt'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     np.savetxt(fpath, X=m, header='x\ty', delimiter='\t')
     ext = '.png'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     fig.savefig(fpath, dpi=100, format='png')
 
     return fpath
 
 
-def test_xlog() -> pathlib.Path:
+def test_xlog(folder: Optional[pathlib.Path] = None) -> pathlib.Path:
     r"""
     Generate the semi-log plot and data.
 
+    Parameters
+    ----------
+    folder: Path, optional
+        Folder of the plot and data, the configuration folder by default.
+
     Returns
     -------
     fpath: Path object
         Path to the semi-log plot.
     """
     x = np.arange(0, 10, 1)
-    fig = plt.figure()
+    fig = _figure()
     ax = fig.add_subplot(111)
     y = 10**x
     ax.plot(y, x, 'k+')
@@ -96,26 +168,31 @@ def test_xlog() -> pathlib.Path:
     m = np.vstack((x, y)).transpose()
     name = 'xlog'
     ext = '.txt'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     np.savetxt(fpath, X=m, header='x\ty', delimiter='\t')
     ext = '.png'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     fig.savefig(fpath, dpi=100, format='png')
 
     return fpath
 
 
-def test_loglog() -> pathlib.Path:
+def test_loglog(folder: Optional[pathlib.Path] = None) -> pathlib.Path:
     r"""
     Generate the log-log plot and data.
 
+    Parameters
+    ----------
+    folder: Path, optional
+        Folder of the plot and data, the configuration folder by default.
+
     Returns
     -------
     fpath: Path object
         Path to the log-log plot.
     """
     x = np.arange(0, 10, 1)
-    fig = plt.figure()
+    fig = _figure()
     ax = fig.add_subplot(111)
     y = 10**x
     ax.plot(y, y, 'k+')
@@ -123,10 +200,10 @@ def test_loglog() -> pathlib.Path:
     m = np.vstack((x, y)).transpose()
     name = 'loglog'
     ext = '.txt'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     np.savetxt(fpath, X=m, header='x\ty', delimiter='\t')
     ext = '.png'
-    fpath = pathlib.Path(CFG_FOLDER) / (str(name) + ext)
+    fpath = _folder(folder) / (str(name) + ext)
     fig.savefig(fpath, dpi=100, format='png')
 
     return fpath
@@ -152,4 +229,907 @@ class TestPlotData(unittest.TestCase):
     def test_loglog(self):
         r"""Test log-log plot."""
         fpath = test_loglog()
-        self.assertTrue(isinstance(fpath, pathlib.Path))
\ No newline at end of file
+        self.assertTrue(isinstance(fpath, pathlib.Path))
+
+
+class TestRefinement(unittest.TestCase):
+    r"""Test sub-pixel refinement."""
+
+    @staticmethod
+    def _blobs(centers, shape=(60, 80), sigma=1.5):
+        ii, jj = np.indices(shape)
+        gray = np.ones(shape)
+        for ic, jc in centers:
+            gray -= np.exp(-((ii - ic)**2 + (jj - jc)**2) / (2 * sigma**2))
+        return gray
+
+    def test_grayscale(self):
+        r"""Test grayscale conversion of RGBA and integer images."""
+        rgba = np.zeros((2, 2, 4))
+        rgba[0, 0] = (0, 0, 0, 1)
+        self.assertTrue(np.allclose(grayscale(rgba), [[0, 1], [1, 1]]))
+        rgb = np.full((2, 2, 3), 255, dtype=np.uint8)
+        self.assertTrue(np.allclose(grayscale(rgb), 1))
+
+    def test_centroid(self):
+        r"""Test refinement of a batch of points."""
+        centers = np.array([[20.3, 30.7], [40.6, 55.2]])
+        gray = self._blobs(centers)
+        i, j = refine_centroid(gray, [20, 41], [31, 55], half_width=5)
+        self.assertTrue(np.allclose(i, centers[:, 0], atol=0.05))
+        self.assertTrue(np.allclose(j, centers[:, 1], atol=0.05))
+
+    def test_empty_window(self):
+        r"""Test that points without marker pixels are left unchanged."""
+        gray = np.ones((20, 20))
+        i, j = refine_centroid(gray, 10, 0, half_width=3)
+        self.assertEqual((i, j), (10.0, 0.0))
+
+
+class TestExport(unittest.TestCase):
+    r"""Test the export of several series."""
+
+    def setUp(self):
+        dtypes = [('type', 'U32'), ('i', 'f8'), ('j', 'f8'), ('Xpix', 'f8'), ('Ypix', 'f8'),
+                  ('x', 'f8'), ('y', 'f8'), ('selected', 'i2'), ('series', 'i4')]
+        self.data = np.zeros(shape=(5,), dtype=dtypes)
+        self.data['type'] = ['data', 'xmin', 'data', 'data', 'data']
+        self.data['x'] = [3.0, 0.0, 1.0, 2.0, 5.0]
+        self.data['y'] = [30.0, 0.0, 10.0, 20.0, 50.0]
+        self.data['series'] = [0, 0, 0, 1, 0]
+        self.names = ['a', 'b']
+
+    def test_long_format(self):
+        r"""Test long format with series names."""
+        long_data = long_format(self.data, self.names)
+        self.assertEqual(list(long_data['type']), ['xmin', 'data', 'data', 'data', 'data'])
+        self.assertEqual(list(long_data['series']), ['a', 'a', 'a', 'a', 'b'])
+        self.assertEqual(list(long_data['x']), [0.0, 1.0, 3.0, 5.0, 2.0])
+
+    def test_column_blocks(self):
+        r"""Test column blocks padded with NaN."""
+        names, blocks = column_blocks(self.data, self.names)
+        self.assertEqual(names, ['x a', 'y a', 'x b', 'y b'])
+        self.assertEqual(blocks.shape, (3, 4))
+        self.assertTrue(np.allclose(blocks[:, 0], [1.0, 3.0, 5.0]))
+        self.assertTrue(np.allclose(blocks[0, 2:], [2.0, 20.0]))
+        self.assertTrue(np.isnan(blocks[1:, 2:]).all())
+
+    def test_decimate(self):
+        r"""Test the decimation modes on a broken line and a straight line."""
+        x = np.linspace(0, 10, 1001)
+        data = add_points(new_data(), np.zeros(2 * x.size), np.zeros(2 * x.size), 10,
+                          series=np.repeat([0, 1], x.size))
+        data['x'] = np.tile(x, 2)
+        data['y'] = np.concatenate((np.where(x < 5, x, 10 - x), 2 * x))
+        data = np.concatenate((self.data[1:2], data[::-1]))
+        for method, value, counts in (('rdp', 0.01, [3, 2]), ('uniform', 1.0, [11, 11]), ('max', 50, [50, 50]),
+                                      ('none', None, [1001, 1001])):
+            decimated = decimate(data, method, value)
+            self.assertEqual(list(decimated['type'][:1]), ['xmin'])
+            points = decimated[decimated['type'] == 'data']
+            self.assertEqual(list(np.bincount(points['series'])), counts)
+            self.assertEqual(list(points['x'][[0, -1]]), [0.0, 10.0])
+        self.assertTrue(np.allclose(decimate(data, 'rdp', 0.01)['x'][1:4], [0.0, 5.0, 10.0]))
+        with self.assertRaises(ValueError):
+            decimate(data, 'rdp')
+
+    def test_decimate_nan(self):
+        r"""Test that the rdp decimation keeps the points without finite position apart."""
+        x = np.linspace(0, 10, 101)
+        data = add_points(new_data(), np.zeros(x.size), np.zeros(x.size), 10)
+        data['x'] = x
+        data['y'] = np.where(x < 5, x, 10 - x)
+        data['x'][20] = np.nan
+        data['y'][[40, 70]] = np.nan
+        decimated = decimate(data, 'rdp', 0.01)
+        finite = np.isfinite(decimated['x']) & np.isfinite(decimated['y'])
+        self.assertTrue(np.allclose(decimated['x'][finite], [0.0, 5.0, 10.0]))
+        self.assertEqual(np.count_nonzero(~finite), 3)
+        # the point at x = 0 is at -inf on a log axis and the next one ends the simplified line
+        decimated = decimate(data, 'rdp', 0.01, xlog=True)
+        finite = np.isfinite(decimated['x']) & np.isfinite(decimated['y'])
+        self.assertEqual(list(decimated['x'][finite][[0, -1]]), [0.0, 10.0])
+        self.assertEqual(decimated['x'][finite][1], 0.1)
+        self.assertEqual(np.count_nonzero(~finite), 3)
+
+    def test_resample(self):
+        r"""Test the resampling of several series onto linear and log grids."""
+        rng = np.random.default_rng(0)
+        x = [np.sort(rng.uniform(1, 10, 50)), np.sort(rng.uniform(2, 100, 80)), np.array([])]
+        data = add_points(new_data(), np.zeros(130), np.zeros(130), 10, series=np.repeat([0, 1], [50, 80]))
+        data['x'] = np.concatenate(x)
+        data['y'] = np.exp(data['x'] / 50)
+        data = np.concatenate((self.data[1:2], data[::-1]))
+        for grid, xlog, ylog in ((make_grid(0, 120, 61), False, False),
+                                 (parse_grid('0.5:200:41', 'log'), True, True)):
+            names, columns = resample(data, ['a', 'b', 'c'], grid, xlog, ylog)
+            self.assertEqual(names, ['x', 'y a', 'y b', 'y c'])
+            self.assertTrue(np.array_equal(columns[:, 0], grid))
+            self.assertTrue(np.isnan(columns[:, 3]).all())
+            for k in range(2):
+                scale = np.log10 if xlog else np.asarray
+                values = np.exp(x[k] / 50)
+                expected = np.interp(scale(grid), scale(x[k]), np.log10(values) if ylog else values,
+                                     left=np.nan, right=np.nan)
+                expected = 10 ** expected if ylog else expected
+                self.assertTrue(np.allclose(columns[:, k + 1], expected, equal_nan=True))
+        self.assertTrue(np.array_equal(parse_grid('3, 1 2'), [1.0, 2.0, 3.0]))
+        with self.assertRaises(ValueError):
+            parse_grid('0:10:1')
+
+
+class TestCore(unittest.TestCase):
+    r"""Test the Tk-free point store."""
+
+    def setUp(self):
+        self.row = 100
+        self.data = add_points(new_data(), [90, 90, 90, 10], [10, 110, 10, 10], self.row)
+        self.data['type'] = LIMITS
+
+    def test_add_points(self):
+        r"""Test bulk insertion and pixel conversion."""
+        data = add_points(self.data, [50.5, 20], [30, 40], self.row, series=2)
+        self.assertEqual(data.size, 6)
+        self.assertTrue(np.allclose(data['Ypix'][4:], [49.5, 80]))
+        self.assertTrue(np.all(data['series'][4:] == 2))
+
+    def test_nearest_point(self):
+        r"""Test nearest point search."""
+        ix, distance = nearest_point(self.data, 12, 13)
+        self.assertEqual(ix, 3)
+        self.assertAlmostEqual(distance, np.hypot(2, 3))
+
+    def test_measure(self):
+        r"""Test values computed from the limits."""
+        data = add_points(self.data, 50, 60, self.row)
+        measure(data, xvalues=(1, 100), yvalues=(0, 8), xlog=True)
+        self.assertAlmostEqual(data['x'][-1], 10.0)
+        self.assertAlmostEqual(data['y'][-1], 4.0)
+
+
+class TestProfiler(unittest.TestCase):
+    r"""Test the latency instrumentation."""
+
+    def test_phases(self):
+        r"""Test the split of the wall time into phases."""
+        profiler = Profiler(enabled=True)
+
+        def _cb_test():
+            with profiler.phase('paint'):
+                pass
+            with profiler.phase('draw'):
+                pass
+
+        profiler.wrap(_cb_test)()
+        record = profiler.records[0]
+        self.assertEqual(record['callback'], '_cb_test')
+        self.assertAlmostEqual(record['model'] + record['paint'] + record['draw'], record['total'])
+        self.assertEqual(profiler.summary()['_cb_test']['total']['count'], 1)
+        counts, edges = profiler.histogram(bins=5)
+        self.assertEqual(counts.sum(), 1)
+
+    def test_disabled(self):
+        r"""Test that nothing is recorded when disabled."""
+        profiler = Profiler(enabled=False)
+        self.assertEqual(profiler.wrap(lambda: 1)(), 1)
+        self.assertEqual(profiler.records, [])
+
+
+class TestStartup(unittest.TestCase):
+    r"""Test that the start up does not pull slow imports nor configuration I/O."""
+
+    def test_lazy_imports(self):
+        r"""Test that matplotlib, the feature modules and the test plots are not imported by the GUI module."""
+        code = ('import sys, datadigitizer.gui; '
+                f'print(" ".join(m for m in {STARTUP_BANNED_MODULES!r} if m in sys.modules))')
+        process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                                 universal_newlines=True, check=True)
+        self.assertEqual(process.stdout.split(), [])
+
+    def test_no_configuration_io(self):
+        r"""Test that importing the settings and the help of the commands do not create the configuration folder."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, HOME=home, USERPROFILE=home)
+            subprocess.run([sys.executable, '-c', 'import datadigitizer.settings'],
+                           env=env, check=True)
+            for command in (['--help'], ['batch', '--help'], ['serve', '--help'], ['watch', '--help']):
+                subprocess.run([sys.executable, '-m', 'datadigitizer'] + command, env=env, cwd=root,
+                               stdout=subprocess.DEVNULL, check=True)
+            self.assertEqual(os.listdir(home), [])
+
+
+class TestSettingsStore(unittest.TestCase):
+    r"""Test the cached settings store."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_defaults(self):
+        r"""Test that the defaults are written once at the first save."""
+        store = SettingsStore(self.folder)
+        self.assertEqual(store.get('profiles', 'DEFAULT', 'folders'), 'LAST')
+        self.assertEqual(os.listdir(self.folder), [])
+        store.flush()
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'profiles.ini')))
+        mtime = os.stat(os.path.join(self.folder, 'profiles.ini')).st_mtime_ns
+        store.flush()
+        self.assertEqual(os.stat(os.path.join(self.folder, 'profiles.ini')).st_mtime_ns, mtime)
+
+    def test_dirty_sections(self):
+        r"""Test that only the modified sections overwrite the changes of other instances."""
+        first = SettingsStore(self.folder)
+        second = SettingsStore(self.folder)
+        first.get('folders', 'LAST', 'data name')
+        first.flush()
+        second.set('folders', 'OTHER', 'data name', 'other.txt')
+        second.flush()
+        first.set('folders', 'LAST', 'data name', 'data.txt')
+        first.flush()
+        third = SettingsStore(self.folder)
+        self.assertEqual(third.get('folders', 'LAST', 'data name'), 'data.txt')
+        self.assertEqual(third.get('folders', 'OTHER', 'data name'), 'other.txt')
+        self.assertEqual([f for f in os.listdir(self.folder) if f.endswith('.tmp')], [])
+
+    def test_batch_defaults(self):
+        r"""Test that the batch defaults are read from the USER section and the folder is created at the save."""
+        folder = os.path.join(self.folder, 'settings')
+        store = SettingsStore(folder)
+        self.assertEqual(store.get('batch', 'USER', 'method'), 'auto')
+        self.assertEqual(store.get('batch', 'USER', 'port'), 8000)
+        self.assertFalse(os.path.exists(folder))
+        store.flush()
+        with open(os.path.join(folder, 'batch.ini'), 'a') as fobj:
+            fobj.write('method = colors\n')
+        self.assertEqual(SettingsStore(folder).get('batch', 'USER', 'method'), 'colors')
+
+
+class TestCorpus(unittest.TestCase):
+    r"""Test the synthetic plot corpus."""
+
+    def test_ground_truth(self):
+        r"""Test that the ground truth lies on the plotted data and matches the calibration."""
+        from PIL import Image
+        with tempfile.TemporaryDirectory() as folder:
+            sidecars = corpus.generate(2, folder, seed=3, workers=1)
+            self.assertEqual(len(sidecars), 2)
+            for sidecar in sidecars:
+                truth = corpus.load(sidecar)
+                gray = np.asarray(Image.open(truth['image']).convert('L')) / 255
+                self.assertEqual(list(gray.shape), truth['shape'])
+                for series in truth['series']:
+                    i = np.round(series['i']).astype(int)
+                    j = np.round(series['j']).astype(int)
+                    window = [gray[a-1:a+2, b-1:b+2].min() for a, b in zip(i, j)]
+                    self.assertGreater(np.mean(np.array(window) < 0.8), 0.9)
+                self.assertEqual(truth['calibration'] is None, truth['spec']['rotation'] != 0)
+                if truth['calibration'] is not None:
+                    series = truth['series'][0]
+                    data = add_points(new_data(), series['i'], series['j'], gray.shape[0])
+                    truth['calibration'].apply(data)
+                    self.assertTrue(np.allclose(data['x'], series['x']))
+                    self.assertTrue(np.allclose(data['y'], series['y']))
+
+
+class TestExtraction(unittest.TestCase):
+    r"""Test the color-mask extraction."""
+
+    def test_extract_color(self):
+        r"""Test one point per vertical run of the series color."""
+        image = np.ones((20, 30, 3))
+        image[5:8, 10:20] = (1.0, 0.0, 0.0)
+        image[12, 10:20] = (0.5, 0.5, 0.5)
+        mask = color_mask(image, (1.0, 0.0, 0.0), bounds=(0, 20, 0, 15))
+        self.assertEqual(mask.sum(), 15)
+        i, j = extract_color(image, (1.0, 0.0, 0.0))
+        self.assertTrue(np.allclose(i, 6.0))
+        self.assertTrue(np.allclose(j, np.arange(10, 20)))
+
+    def test_components(self):
+        r"""Test the labeling of the connected components."""
+        mask = np.zeros((10, 12), dtype=bool)
+        mask[1:4, 1:4] = True
+        mask[4, 4] = True
+        mask[6:8, 8:11] = True
+        self.assertEqual(component_properties(mask, connectivity=4).size, 3)
+        properties = component_properties(mask, connectivity=8)
+        self.assertEqual(properties.size, 2)
+        self.assertTrue(np.array_equal(np.sort(properties['area']), [6, 10]))
+        big = properties[np.argmax(properties['area'])]
+        self.assertAlmostEqual(big['i'], 2.2)
+        self.assertEqual((big['height'], big['width']), (4, 4))
+
+    def test_detect_markers(self):
+        r"""Test that the markers are detected and the lines discarded."""
+        mask = np.zeros((40, 60), dtype=bool)
+        mask[30, 2:58] = True
+        for i, j in [(5, 10), (12, 30), (20, 45)]:
+            mask[i-1:i+2, j-1:j+2] = True
+        i, j = detect_markers(mask)
+        self.assertTrue(np.allclose(i, [5, 12, 20]))
+        self.assertTrue(np.allclose(j, [10, 30, 45]))
+
+
+class TestTracing(unittest.TestCase):
+    r"""Test the curve tracer."""
+
+    def test_dashed_crossing(self):
+        r"""Test that gaps are bridged and a crossing line of the same color is not followed."""
+        image = np.ones((100, 200, 3))
+        j = np.arange(10, 190)
+        i = np.rint(50 + 20 * np.sin(j / 20)).astype(int)
+        dashes = (j // 8) % 3 != 2
+        for di in (-1, 0, 1):
+            image[i[dashes] + di, j[dashes]] = (0.0, 0.0, 1.0)
+        image[5:95, 99:102] = (0.0, 0.0, 1.0)
+        ti, tj = trace(image, [(i[40], j[40])])
+        self.assertLess(tj.min(), 15)
+        self.assertGreater(tj.max(), 180)
+        self.assertTrue(np.all(np.diff(tj) > 0))
+        self.assertLess(np.max(np.abs(ti - (50 + 20 * np.sin(tj / 20)))), 2.0)
+
+
+class TestPreprocessing(unittest.TestCase):
+    r"""Test the memoized preprocessing stages."""
+
+    def setUp(self):
+        self.image = np.ones((60, 80, 3))
+        self.image[::20] = 0.6
+        self.image[:, ::20] = 0.6
+        self.image[30:33, 45:48] = 0.0
+
+    def test_memoization(self):
+        r"""Test that only the stages depending on a changed parameter are recomputed."""
+        pipeline = Pipeline(self.image)
+        binary = pipeline.get('nogrid')
+        self.assertIs(pipeline.get('nogrid'), binary)
+        pipeline.set_params(grid_length=30)
+        nogrid = pipeline.get('nogrid')
+        self.assertEqual(pipeline.computed, {'gray': 1, 'background': 1, 'binary': 1, 'nogrid': 2})
+        pipeline.set_params(threshold='adaptive')
+        pipeline.get('nogrid')
+        self.assertEqual(pipeline.computed, {'gray': 1, 'background': 1, 'binary': 2, 'nogrid': 3})
+        self.assertRaises(ValueError, pipeline.set_params, threshold='unknown')
+
+        # only the marker remains once the grid is removed
+        self.assertGreater(binary.sum(), 9)
+        self.assertEqual(nogrid.sum(), 9)
+        self.assertTrue(nogrid[30:33, 45:48].all())
+
+    def test_read_only(self):
+        r"""Test that the stages are read-only without freezing the image of the caller."""
+        gray = np.random.rand(20, 30)
+        pipeline = Pipeline(gray)
+        stage = pipeline.get('gray')
+        self.assertFalse(stage.flags.writeable)
+        self.assertTrue(gray.flags.writeable)
+        gray[0, 0] = 0.5
+
+    def test_otsu(self):
+        r"""Test the threshold between two populations."""
+        gray = np.concatenate((np.full(100, 0.2), np.full(300, 0.9)))
+        threshold = otsu_threshold(gray)
+        self.assertTrue(0.2 < threshold <= 0.9)
+
+
+class TestPalette(unittest.TestCase):
+    r"""Test the discovery of the series colors."""
+
+    def test_discover_colors(self):
+        r"""Test that the gray pixels are discarded and the anti-aliased edges merged."""
+        image = np.ones((200, 300, 3))
+        image[::25] = 0.8
+        image[:, 10:13] = 0.0
+        blue, red = np.array([0.1, 0.4, 0.8]), np.array([0.9, 0.1, 0.1])
+        image[50:56, 20:280] = blue
+        image[[49, 56], 20:280] = 0.5 + 0.5 * blue
+        image[120:130, 20:280] = red
+        image[[119, 130], 20:280] = 0.3 * red
+        colors, counts = discover_colors(image)
+        self.assertEqual(colors.shape, (2, 3))
+        self.assertTrue(np.allclose(colors, [red, blue]))
+        self.assertTrue(np.allclose(counts, [3120, 2080], rtol=0.15))
+        colors, counts = discover_colors(image, bounds=(0, 100, 0, 300))
+        self.assertTrue(np.allclose(colors, [blue]))
+
+
+class TestVector(unittest.TestCase):
+    r"""Test the import of vector figures."""
+
+    def test_parse_path(self):
+        r"""Test the absolute, relative, horizontal and vertical commands."""
+        (a, closed_a), (b, closed_b) = vector.parse_path('M 1 2 l 3 0 V 5 h -3 z m 1 1 C 0 0 0 0 4 4')
+        self.assertTrue(np.allclose(a, [[1, 2], [4, 2], [4, 5], [1, 5]]))
+        self.assertTrue(closed_a)
+        self.assertTrue(np.allclose(b, [[2, 3], [4, 4]]))
+        self.assertFalse(closed_b)
+        self.assertEqual(vector.parse_label(r'$\mathdefault{2\times10^{-3}}$'), 2e-3)
+
+    def test_matplotlib_figures(self):
+        r"""Test that the series and the calibration of SVG and PDF figures are exact."""
+        x = np.array([1.0, 2.0, 5.0, 10.0, 20.0, 50.0])
+        fig = Figure(figsize=(4, 3))
+        ax = fig.add_subplot(111)
+        ax.plot(x, 3 * x - 20, 'r-', label='line')
+        ax.plot(x, 100 - x, 'bo', label='markers')
+        ax.set_xscale('log')
+        ax.grid(True)
+        ax.legend()
+        with tempfile.TemporaryDirectory() as folder:
+            for suffix in vector.VECTOR_FORMATS:
+                fpath = pathlib.Path(folder) / f'figure{suffix}'
+                fig.savefig(fpath)
+                data, calibration = vector.read(fpath).to_data(scale=2.0)
+                self.assertIsNotNone(calibration)
+                self.assertTrue(calibration.xlog)
+                self.assertFalse(calibration.ylog)
+                points = data[data['type'] == 'data']
+                self.assertTrue(np.array_equal(np.unique(points['series']), [0, 1]))
+                line, markers = points[points['series'] == 0], points[points['series'] == 1]
+                self.assertTrue(np.allclose(line['x'], x, rtol=1e-4))
+                self.assertTrue(np.allclose(line['y'], 3 * x - 20, atol=1e-3))
+                self.assertTrue(np.allclose(markers['y'], 100 - x, atol=1e-3))
+
+
+class TestPages(unittest.TestCase):
+    r"""Test the page by page reading of documents."""
+
+    def test_tiff_and_scanned_pdf(self):
+        r"""Test the frames of a TIFF file and the images of scanned PDF pages."""
+        from PIL import Image
+        i, j = np.mgrid[0:40, 0:50]
+        frames = [Image.fromarray(np.dstack((i * 6, j * 5, (i + j + k * 20) % 256)).astype(np.uint8))
+                  for k in range(3)]
+        with tempfile.TemporaryDirectory() as folder:
+            fpath = pathlib.Path(folder) / 'report.tif'
+            frames[0].save(fpath, save_all=True, append_images=frames[1:], compression='tiff_deflate')
+            with pages.Document(fpath) as document:
+                self.assertEqual(len(document), 3)
+                image_array, figure = document.page(2)
+                self.assertIsNone(figure)
+                self.assertTrue(np.array_equal(image_array, np.asarray(frames[2])))
+            for mode in ('L', '1'):
+                fpath = pathlib.Path(folder) / f'report_{mode}.pdf'
+                converted = [frame.convert(mode) for frame in frames]
+                converted[0].save(fpath, save_all=True, append_images=converted[1:])
+                with pages.Document(fpath) as document:
+                    self.assertEqual(len(document), 3)
+                    image_array, figure = document.page(1)
+                    self.assertIsNone(figure)
+                    expected = np.asarray(converted[1].convert('L'), dtype=np.int64)
+                    # the gray pages are JPEG compressed
+                    self.assertLess(np.abs(image_array - expected).mean(), 2.0)
+
+    def test_batch(self):
+        r"""Test that each page of a vector PDF gives its data and its session."""
+        from matplotlib.backends.backend_pdf import PdfPages
+        x = np.array([1.0, 2.0, 3.0, 4.0])
+        with tempfile.TemporaryDirectory() as folder:
+            fpath = pathlib.Path(folder) / 'report.pdf'
+            with PdfPages(fpath) as pdf:
+                for k in range(2):
+                    fig = Figure(figsize=(4, 3))
+                    fig.add_subplot(111).plot(x, x ** 2 + k, 'r-')
+                    pdf.savefig(fig)
+            cache = ResultCache(pathlib.Path(folder) / 'cache')
+            sessions = list(batch.run([fpath], pathlib.Path(folder) / 'out', cache=cache))
+            self.assertEqual([path.name for path in sessions], ['report-p0001.json', 'report-p0002.json'])
+            # the rerun reads the results of the unchanged file from the cache
+            sessions = list(batch.run([fpath], pathlib.Path(folder) / 'out', cache=cache))
+            self.assertEqual(cache.hits, 2)
+            for k, path in enumerate(sessions):
+                session = batch.load(path)
+                self.assertEqual(session['method'], 'vector')
+                self.assertTrue(session['cached'])
+                values = np.loadtxt(path.parent / session['data'], usecols=(5, 6))
+                self.assertTrue(np.allclose(values[-x.size:], np.column_stack((x, x ** 2 + k)), atol=1e-3))
+
+    def test_resume(self):
+        r"""Test that an interrupted batch is resumed and that the failures are retried apart."""
+        with tempfile.TemporaryDirectory() as folder:
+            images = []
+            for k in range(3):
+                fpath = pathlib.Path(folder) / f'figure{k}.png'
+                fig = Figure(figsize=(3, 2))
+                FigureCanvasAgg(fig)
+                fig.add_subplot(111).plot([0, 1], [0, k], 'r-')
+                fig.savefig(fpath)
+                images.append(fpath)
+            broken = pathlib.Path(folder) / 'broken.png'
+            broken.write_bytes(b'not an image')
+            out = pathlib.Path(folder) / 'out'
+            # interrupted after the first page
+            run = batch.run(images + [broken], out, method='colors')
+            next(run)
+            run.close()
+            sessions = list(batch.run(images + [broken], out, method='colors', resume=True))
+            self.assertEqual([path.name for path in sessions], ['figure1-p0001.json', 'figure2-p0001.json'])
+            with batch.Journal(out / batch.JOURNAL_NAME) as journal:
+                failed = journal.failed()
+            self.assertEqual([entry['source'] for entry in failed], [str(broken.absolute())])
+            self.assertEqual(list(batch.run(images + [broken], out, method='colors', resume=True)), [])
+            images[0].write_bytes(images[1].read_bytes())
+            self.assertEqual(len(list(batch.run(images, out, method='colors', resume=True))), 1)
+            broken.write_bytes(images[1].read_bytes())
+            sessions = list(batch.run(images + [broken], out, method='colors', retry_failed=True))
+            self.assertEqual([path.name for path in sessions], ['broken-p0001.json'])
+            self.assertNotIn('error', batch.load(sessions[0]))
+
+    def test_unreadable(self):
+        r"""Test that the missing files and the pages which cannot be written are recorded as failed."""
+        with tempfile.TemporaryDirectory() as folder:
+            fpath = pathlib.Path(folder) / 'figure.png'
+            fig = Figure(figsize=(3, 2))
+            FigureCanvasAgg(fig)
+            fig.add_subplot(111).plot([0, 1], [0, 1], 'r-')
+            fig.savefig(fpath)
+            missing = pathlib.Path(folder) / 'missing.png'
+            out = pathlib.Path(folder) / 'out'
+            # the session file cannot replace a folder
+            (out / 'figure-p0001.json').mkdir(parents=True)
+            self.assertEqual(list(batch.run([missing, fpath], out, method='colors')), [])
+            with batch.Journal(out / batch.JOURNAL_NAME) as journal:
+                failed = journal.failed()
+            self.assertEqual([(entry['source'], entry['page']) for entry in failed],
+                             [(str(missing.absolute()), None), (str(fpath.absolute()), 0)])
+            self.assertIsNone(failed[0]['signature'])
+            self.assertNotIn('session', failed[1])
+
+    def test_summary(self):
+        r"""Test that the batch command reports only the failures of its own run."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as folder:
+            env = dict(os.environ, HOME=folder, USERPROFILE=folder)
+            outputs = []
+            for name in ('first.png', 'second.png'):
+                command = ['batch', os.path.join(folder, name), '--output', os.path.join(folder, 'out'),
+                           '--no-cache', '--resume']
+                process = subprocess.run([sys.executable, '-m', 'datadigitizer'] + command, env=env, cwd=root,
+                                         stdout=subprocess.PIPE, universal_newlines=True, check=True)
+                outputs.append(process.stdout)
+            self.assertNotIn('first.png', outputs[1])
+            self.assertIn('second.png', outputs[1])
+            self.assertIn('1 files could not be opened.', outputs[1])
+
+
+class TestTemplates(unittest.TestCase):
+    r"""Test the calibration templates."""
+
+    @staticmethod
+    def figure(offset: float, dpi: int = 100):
+        r"""Render a figure with fixed axes and return the image and the matrix indexes of the limits."""
+        fig = Figure(figsize=(6, 4), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        x = np.linspace(0, 10, 30)
+        ax.plot(x, np.sin(x + offset) + offset, 'b-o')
+        ax.set_xlim(0, 10)
+        ax.set_ylim(-3, 3)
+        canvas.draw()
+        image_array = np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+        xd, yd = ax.transData.transform([[0, -3], [10, -3], [0, -3], [0, 3]]).T
+        return image_array, image_array.shape[0] - yd - 0.5, xd - 0.5
+
+    def test_phase_correlation(self):
+        r"""Test the translation of a random image."""
+        reference = np.random.default_rng(0).random((100, 120))
+        di, dj, peak = phase_correlation(reference, np.roll(reference, (5, -7), axis=(0, 1)))
+        self.assertAlmostEqual(di, 5, places=2)
+        self.assertAlmostEqual(dj, -7, places=2)
+        self.assertGreater(peak, 0.5)
+
+    def test_transfer(self):
+        r"""Test that the limits follow a shifted figure and a figure exported at another resolution."""
+        image_array, i, j = self.figure(0.0)
+        data = new_data()
+        for k, which in enumerate(LIMITS):
+            data = add_points(data, i[k], j[k], image_array.shape[0], which=which)
+        template = Template.from_data(data, image_array, (0, 10), (-3, 3), xunit='s')
+        with tempfile.TemporaryDirectory() as folder:
+            template.save(pathlib.Path(folder) / 'journal.npz')
+            template = Template.load(pathlib.Path(folder) / 'journal.npz')
+        self.assertEqual(template.xunit, 's')
+
+        image_array, i, j = self.figure(1.0)
+        shifted = np.pad(image_array, ((23, 0), (0, 17), (0, 0)), constant_values=255)[:, 17:]
+        limits, calibration, peak = template.apply(shifted)
+        self.assertTrue(np.allclose(limits['i'], i + 23, atol=1.0))
+        self.assertTrue(np.allclose(limits['j'], j - 17, atol=1.0))
+        self.assertEqual(calibration.yvalues, (-3.0, 3.0))
+
+        image_array, i, j = self.figure(1.0, dpi=150)
+        limits, _, _ = template.apply(image_array)
+        self.assertTrue(np.allclose(limits['i'], i, atol=1.5))
+        self.assertTrue(np.allclose(limits['j'], j, atol=1.5))
+        with self.assertRaises(ValueError):
+            template.apply(np.full_like(image_array, 255))
+
+
+class TestCache(unittest.TestCase):
+    r"""Test the cache of the digitization results."""
+
+    def test_eviction(self):
+        r"""Test the round trip of a result and the eviction of the least recently used ones."""
+        data = add_points(new_data(), np.arange(100.0), np.arange(100.0), 200, series=1)
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResultCache(folder)
+            keys = [make_key('image', k, {'method': 'colors'}) for k in range(3)]
+            self.assertEqual(len(set(keys)), 3)
+            self.assertIsNone(cache.get(keys[0]))
+            for k, key in enumerate(keys):
+                cache.put(key, data, {'page': k})
+                os.utime(cache.folder / f'{key}.npz', (k, k))
+            stored, meta = cache.get(keys[0])
+            self.assertTrue(np.array_equal(stored, data))
+            self.assertEqual(meta, {'page': 0})
+            # the first key was read last: the second one is the least recently used
+            cache.max_bytes = cache.size() - 1
+            cache.evict(cache.max_bytes)
+            self.assertIsNone(cache.get(keys[1]))
+            self.assertIsNotNone(cache.get(keys[0]))
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+
+
+class TestShared(unittest.TestCase):
+    r"""Test the images shared with the worker processes."""
+
+    def test_map_image(self):
+        r"""Test that the workers give the serial results and that the blocks are unlinked."""
+        image = np.ones((200, 300, 3))
+        image[50:56, 20:280] = (0.1, 0.4, 0.8)
+        image[120:130, 20:280] = (0.9, 0.1, 0.1)
+        args = [((0.1, 0.4, 0.8), 0.25), ((0.9, 0.1, 0.1), 0.25)]
+        expected = shared.map_image(extract_color, image, args, workers=1)
+        with shared.SharedImage.from_array(image) as block:
+            handle = block.handle
+            self.assertIs(shared.SharedImage.of(block.array), block)
+            results = shared.map_image(extract_color, block.array, args, workers=2)
+        for (i, j), (k, l) in zip(results, expected):
+            self.assertTrue(np.array_equal(i, k) and np.array_equal(j, l))
+        with self.assertRaises(FileNotFoundError):
+            shared.SharedImage.attach(handle)
+
+
+class TestTiling(unittest.TestCase):
+    r"""Test the band by band processing of the large images."""
+
+    def test_seams(self):
+        r"""Test that the stitched bands give the results of the whole image."""
+        rng = np.random.default_rng(0)
+        image = rng.random((120, 90, 3))
+        image[rng.random((120, 90)) < 0.3] = (0.9, 0.1, 0.1)
+        with unittest.mock.patch.object(tiling, 'TILE_PIXELS', 500):
+            self.assertEqual(len(tiling.row_bands(120, 90, workers=3)), 22)
+            results = [(color_mask(image, (0.9, 0.1, 0.1), workers=w),
+                        binarize(image[:, :, 0], 'adaptive', 15, workers=w),
+                        otsu_threshold(image[:, :, 1], workers=w)) for w in (1, 3)]
+            mask = results[0][0]
+            runs = [label_runs(mask, workers=w) for w in (1, 3)]
+            columns = [extraction.column_runs(mask, workers=w) for w in (1, 3)]
+        self.assertTrue(np.array_equal(results[0][0], results[1][0]))
+        self.assertTrue(np.array_equal(results[0][1], results[1][1]))
+        self.assertEqual(results[0][2], results[1][2])
+        for serial, parallel in zip(runs[0], runs[1]):
+            self.assertTrue(np.array_equal(serial, parallel))
+        for serial, parallel in zip(columns[0], columns[1]):
+            self.assertTrue(np.array_equal(serial, parallel))
+
+    def test_bounded_bands(self):
+        r"""Test that a single thread still processes a large image by bands bounded in memory."""
+        image = np.random.default_rng(0).random((120, 90, 3))
+        near_color = extraction._near_color
+        shapes = []
+
+        def spy(band, *args):
+            shapes.append(band.shape)
+            return near_color(band, *args)
+
+        with unittest.mock.patch.object(tiling, 'TILE_PIXELS', 500), \
+                unittest.mock.patch.object(extraction, '_near_color', spy):
+            self.assertEqual(len(tiling.row_bands(120, 90, workers=1)), 22)
+            mask = color_mask(image, (0.9, 0.1, 0.1), workers=1)
+        self.assertTrue(np.array_equal(mask, near_color(image, np.array([0.9, 0.1, 0.1]), 0.25)))
+        # the bands are bounded in elements, channels included
+        self.assertGreater(len(shapes), 1)
+        self.assertTrue(all(np.prod(shape) <= 2 * 500 for shape in shapes))
+
+
+class TestKernels(unittest.TestCase):
+    r"""Test that the kernels give the results of the NumPy implementations."""
+
+    @staticmethod
+    def compute():
+        r"""Paint crosses, label components and trace a curve with the current kernels."""
+        rng = np.random.default_rng(1)
+        data = add_points(new_data(), rng.uniform(-3, 62, 200), rng.uniform(-3, 82, 200), 60,
+                          series=rng.integers(0, 5, 200))
+        data['selected'][::7] = 1
+        data['type'][:4] = LIMITS
+        overlay = paint_overlay(np.zeros((60, 80, 4)), data, 4, 3)
+        labels = label_runs(rng.random((200, 200)) < 0.45, workers=1)
+        image = np.full((100, 200, 3), 255, dtype=np.uint8)
+        j = np.arange(10, 190)
+        image[np.rint(50 + 20 * np.sin(j / 20)).astype(int), j] = (200, 30, 30)
+        return (overlay,) + labels[:4] + trace(image, [(50, 100)])
+
+    def test_kernels(self):
+        r"""Test the kernels run as Python and, if Numba is installed, compiled."""
+        backend = kernels.get_backend()
+        try:
+            kernels.set_backend('numpy')
+            expected = self.compute()
+            with unittest.mock.patch.object(kernels, 'get', lambda name: getattr(kernels, name)):
+                for value, result in zip(expected, self.compute()):
+                    self.assertTrue(np.array_equal(value, result))
+            if kernels.available():
+                kernels.set_backend('numba')
+                # the trigonometric functions of Numba and NumPy may differ in the last bits
+                for value, result in zip(expected, self.compute()):
+                    self.assertTrue(np.allclose(value, result, rtol=0, atol=1e-9))
+        finally:
+            kernels.set_backend(backend)
+        with self.assertRaises(ValueError):
+            kernels.set_backend('cuda')
+
+
+class TestApi(unittest.TestCase):
+    r"""Test the digitization from Python."""
+
+    def test_digitize(self):
+        r"""Test the digitization of an array calibrated by its limits."""
+        import datadigitizer
+        image = np.ones((100, 200, 3))
+        image[49:52, 20:181] = (1, 0, 0)
+        limits = {'xmin': (90, 10), 'xmax': (90, 190), 'ymin': (90, 10), 'ymax': (10, 10)}
+        values = {'xmin': 0.0, 'xmax': 18.0, 'ymin': 1.0, 'ymax': 100.0}
+        data = datadigitizer.digitize(image, limits, values, scales=('linear', 'log'), method='colors')
+        self.assertEqual(data.dtype, new_data().dtype)
+        self.assertEqual(list(data['type'][:4]), list(LIMITS))
+        points = data[data['type'] == 'data']
+        self.assertTrue(np.allclose(points['y'], 10))
+        self.assertTrue(np.allclose(points['x'][[0, -1]], [1.0, 17.0]))
+        with self.assertRaises(ValueError):
+            datadigitizer.digitize(image, limits)
+
+    def test_lazy_import(self):
+        r"""Test that the API does not import tkinter nor matplotlib."""
+        code = ('import sys, datadigitizer; print("numpy" in sys.modules); datadigitizer.digitize; '
+                'print(any(m in sys.modules for m in ("tkinter", "matplotlib")))')
+        process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                                 universal_newlines=True, check=True)
+        self.assertEqual(process.stdout.split(), ['False', 'False'])
+
+
+class TestServer(unittest.TestCase):
+    r"""Test the HTTP job service on a free local port."""
+
+    def setUp(self):
+        self.server = Server(port=0, workers=1, queue_size=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_digitize(self):
+        r"""Test a posted image, the binary result and the rejection of a full pool."""
+        from PIL import Image
+        image = np.full((100, 200, 3), 255, dtype=np.uint8)
+        image[49:52, 20:181] = (255, 0, 0)
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format='png')
+        limits = {'xmin': (90, 10), 'xmax': (90, 190), 'ymin': (90, 10), 'ymax': (10, 10)}
+        values = {'xmin': 0.0, 'xmax': 18.0, 'ymin': 0.0, 'ymax': 8.0}
+        query = urllib.parse.urlencode({'method': 'colors', 'limits': json.dumps(limits),
+                                        'values': json.dumps(values)})
+        request = urllib.request.Request(f'{self.server.url}/digitize?{query}', data=buffer.getvalue(),
+                                         headers={'Content-Type': 'image/png'})
+        with urllib.request.urlopen(request) as response:
+            points = json.load(response)['points']
+        expected = api.digitize(image, limits, values, method='colors')
+        self.assertTrue(np.allclose(points['y'], expected['y']))
+        request.add_header('Accept', 'application/x-npy')
+        with urllib.request.urlopen(request) as response:
+            self.assertTrue(np.array_equal(np.load(io.BytesIO(response.read())), expected))
+        # the only slot is taken: the requests are rejected at once
+        future = self.server.service.submit(time.sleep, 0.5)
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request)
+        self.assertEqual(context.exception.code, 503)
+        future.result()
+        with urllib.request.urlopen(f'{self.server.url}/health') as response:
+            self.assertEqual(json.load(response)['rejected'], 1)
+
+    def test_content_length(self):
+        r"""Test that the invalid lengths are rejected without reading the body."""
+        for length in ('abc', '-1', '1e3'):
+            connection = http.client.HTTPConnection(*self.server.server_address[:2], timeout=5)
+            try:
+                connection.putrequest('POST', '/digitize')
+                connection.putheader('Content-Type', 'image/png')
+                connection.putheader('Content-Length', length)
+                connection.endheaders()
+                response = connection.getresponse()
+                self.assertEqual(response.status, 400)
+                self.assertIn('Content-Length', json.load(response)['error'])
+            finally:
+                connection.close()
+
+    def _post_headers(self, length: int) -> http.client.HTTPResponse:
+        r"""Send the headers of an image upload without its body and return the response."""
+        connection = http.client.HTTPConnection(*self.server.server_address[:2], timeout=5)
+        self.addCleanup(connection.close)
+        connection.putrequest('POST', '/digitize')
+        connection.putheader('Content-Type', 'image/png')
+        connection.putheader('Content-Length', str(length))
+        connection.endheaders()
+        return connection.getresponse()
+
+    def test_backpressure(self):
+        r"""Test that the bodies are not read when the workers are busy and that the connections are bounded."""
+        future = self.server.service.submit(time.sleep, 0.5)
+        # the body is never sent: the response only comes if it is not awaited
+        response = self._post_headers(8 * 2**20)
+        self.assertEqual((response.status, response.getheader('Retry-After')), (503, '1'))
+        future.result()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = Server(port=0, workers=1, queue_size=0, max_connections=1)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        with socket.create_connection(self.server.server_address[:2]):
+            # the idle connection holds the only handler thread
+            time.sleep(0.1)
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(f'{self.server.url}/health', timeout=5)
+            self.assertEqual(context.exception.code, 503)
+        for _ in range(50):
+            try:
+                with urllib.request.urlopen(f'{self.server.url}/health', timeout=5) as response:
+                    self.assertEqual(response.status, 200)
+                break
+            except urllib.error.HTTPError:
+                time.sleep(0.1)
+        else:
+            self.fail('the connection was not released')
+
+
+class TestWatch(unittest.TestCase):
+    r"""Test the watched folder."""
+
+    def test_scan(self):
+        r"""Test the settling of the written files, the processing and the restart."""
+        with tempfile.TemporaryDirectory() as folder:
+            folder = pathlib.Path(folder)
+            output = folder / 'digitized'
+            # the plot is generated in a subfolder: the subfolders are not watched
+            image = test_linear(folder / 'plots').read_bytes()
+            fpath = folder / 'plot.png'
+            with Watcher(folder, output, method='markers', settle=1.0) as watcher:
+                fpath.write_bytes(image[:100])
+                (folder / 'notes.txt').write_text('not an image')
+                self.assertEqual(watcher.scan(now=0.0), [])
+                fpath.write_bytes(image)
+                # the settling delay starts again when the file changes
+                self.assertEqual(watcher.scan(now=0.5), [])
+                self.assertEqual(watcher.scan(now=1.0), [])
+                self.assertEqual(watcher.scan(now=1.5), [fpath.absolute()])
+                self.assertEqual(watcher.scan(now=5.0), [])
+                watcher.process(fpath)
+                self.assertEqual(batch.load(output / 'plot-p0001.json')['method'], 'markers')
+            with Watcher(folder, output, method='markers', settle=1.0) as watcher:
+                self.assertEqual(watcher.scan(now=0.0) + watcher.scan(now=2.0), [])
+                stat = fpath.stat()
+                fpath.unlink()
+                self.assertEqual(watcher.scan(now=3.0), [])
+                # the deleted file is forgotten: the same file written again is processed again
+                fpath.write_bytes(image)
+                os.utime(fpath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                self.assertEqual(watcher.scan(now=4.0), [])
+                self.assertEqual(watcher.scan(now=5.0), [fpath.absolute()])
+                self.assertEqual(watcher.processed, 0)
@@ -0,0 +1,130 @@
+r"""
+Tiling module.
+
+Band by band processing of the large images on a thread pool. NumPy releases the
+GIL in the array operations so that the bands of rows are processed in parallel.
+The neighbourhood operations read halo rows around each band and the results are
+stitched by keeping the rows of each band only.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+from typing import Any, Callable, List, Optional, Tuple
+import numpy as np
+
+# pixels of a band: the images below are processed at once
+TILE_PIXELS = 1 << 22
+
+
+def row_bands(nrows: int, ncols: int, workers: Optional[int] = None,
+              tile_pixels: Optional[int] = None) -> List[Tuple[int, int]]:
+    r"""
+    Split the rows of an image into bands.
+
+    Parameters
+    ----------
+    nrows: int
+        Number of rows.
+    ncols: int
+        Number of elements per row.
+    workers: int, optional
+        Number of threads. By default, the number of processors.
+    tile_pixels: int, optional
+        Number of elements per band. TILE_PIXELS by default. The bands are not
+        larger even with one thread so that the temporary arrays of each band,
+        e.g. float copies, stay bounded.
+
+    Returns
+    -------
+    bands: list of tuple of int
+        Start and stop rows of each band.
+    """
+    tile_pixels = TILE_PIXELS if tile_pixels is None else tile_pixels
+    workers = workers or os.cpu_count() or 1
+    if nrows * ncols <= tile_pixels or nrows < 2:
+        return [(0, nrows)]
+    # bands bounded in memory and, with several threads, at least one band per thread
+    nbands = -(-nrows * ncols // tile_pixels)
+    if workers > 1:
+        nbands = max(workers, nbands)
+    nbands = min(nbands, nrows)
+    edges = np.linspace(0, nrows, nbands + 1).astype(int).tolist()
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def map_bands(function: Callable[[int, int], Any], bands: List[Tuple[int, int]],
+              workers: Optional[int] = None) -> List[Any]:
+    r"""
+    Call a function on each band on a thread pool.
+
+    Parameters
+    ----------
+    function: callable
+        Function called as function(start, stop).
+    bands: list of tuple of int
+        Bands as returned by row_bands.
+    workers: int, optional
+        Number of threads. By default, the number of processors.
+
+    Returns
+    -------
+    results: list
+        Results in the order of the bands.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(bands))
+    if workers == 1:
+        return [function(*band) for band in bands]
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda band: function(*band), bands))
+
+
+def tiled(function: Callable[[np.ndarray], np.ndarray], image_array: np.ndarray,
+          workers: Optional[int] = None, halo: int = 0) -> np.ndarray:
+    r"""
+    Apply a function band by band and stitch the results.
+
+    Parameters
+    ----------
+    function: callable
+        Function of an image returning an array with one row per image row.
+    image_array: array-like, shape (n, ...)
+        Input image.
+    workers: int, optional
+        Number of threads. By default, the number of processors.
+    halo: int, optional
+        Number of rows read above and below each band. It must cover the reach of
+        the neighbourhood operations so that the stitched result is the one of the
+        whole image.
+
+    Returns
+    -------
+    result: array-like, shape (n, ...)
+        Stitched result.
+    """
+    image_array = np.asarray(image_array)
+    nrows = image_array.shape[0]
+    bands = row_bands(nrows, int(np.prod(image_array.shape[1:])), workers)
+    if len(bands) == 1:
+        return function(image_array)
+
+    def band(start: int, stop: int) -> np.ndarray:
+        top, bottom = max(start - halo, 0), min(stop + halo, nrows)
+        return function(image_array[top:bottom])[start - top:stop - top]
+
+    return np.concatenate(map_bands(band, bands, workers))
@@ -0,0 +1,276 @@
+r"""
+Tracing module.
+
+Line-following curve tracer. From one or two seed points, the curve is followed by
+sampling the pixels on a short arc ahead of the current position, centered on the
+predicted direction. Only the pixels near the curve are read so that the cost does
+not depend on the size of the image.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+from typing import Callable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from . import kernels
+from .imaging import normalize
+from .extraction import Bounds
+
+
+def _rgb(pixels: np.ndarray) -> np.ndarray:
+    r"""Convert sampled pixels into RGB floats of shape (n, 3)."""
+    pixels = normalize(pixels)
+    if pixels.ndim == 1:
+        return np.repeat(pixels[:, np.newaxis], 3, axis=1)
+    return pixels[:, :3] if pixels.shape[1] >= 3 else np.repeat(pixels[:, :1], 3, axis=1)
+
+
+def snap_to_ink(image_array: np.ndarray, i: float, j: float,
+                half_width: int = 3) -> Tuple[float, float, np.ndarray]:
+    r"""
+    Move a click onto the nearest ink pixel and sample its color.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread.
+    i, j: float
+        Matrix indexes of the click.
+    half_width: int, optional
+        Half width of the searched window.
+
+    Returns
+    -------
+    i, j: float
+        Matrix indexes of the pixel of the window which is the furthest from white.
+    color: array-like, shape (3,)
+        RGB color of this pixel.
+    """
+    row, col = image_array.shape[:2]
+    i0, i1 = max(int(round(i)) - half_width, 0), min(int(round(i)) + half_width + 1, row)
+    j0, j1 = max(int(round(j)) - half_width, 0), min(int(round(j)) + half_width + 1, col)
+    ii, jj = np.mgrid[i0:i1, j0:j1]
+    rgb = _rgb(image_array[ii.ravel(), jj.ravel()])
+    k = np.argmax(np.sum((1 - rgb) ** 2, axis=1))
+    return float(ii.ravel()[k]), float(jj.ravel()[k]), rgb[k]
+
+
+def color_matcher(image_array: np.ndarray, color: Sequence[float],
+                  tolerance: float = 0.25) -> Callable:
+    r"""
+    Create a function testing whether pixels are close to a color.
+
+    The criteria are the same as for :func:`datadigitizer.extraction.color_mask`
+    but only the requested pixels are read.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread.
+    color: sequence of float
+        RGB color between 0 and 1.
+    tolerance: float, optional
+        Maximal euclidean distance in the RGB space.
+
+    Returns
+    -------
+    match: callable
+        match(i, j) returns a boolean array for integer indexes i, j.
+    """
+    color = np.asarray(color, dtype=np.float64)[:3]
+    chroma = np.ptp(color)
+
+    def match(i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        rgb = _rgb(image_array[i, j])
+        inside = np.sum((rgb - color) ** 2, axis=1) <= tolerance ** 2
+        if chroma > 0.1:
+            inside &= np.ptp(rgb, axis=1) >= chroma / 2
+        return inside
+
+    return match
+
+
+def _best_run(hits: np.ndarray) -> Tuple[Optional[float], int]:
+    r"""Return the fractional index of the center and the length of the run of hits closest to the middle."""
+    if not hits.any():
+        return None, 0
+    padded = np.concatenate(([False], hits, [False]))
+    transitions = np.flatnonzero(padded[1:] != padded[:-1])
+    centers = (transitions[0::2] + transitions[1::2] - 1) / 2
+    k = np.argmin(np.abs(centers - (hits.size - 1) / 2))
+    return float(centers[k]), int(transitions[2 * k + 1] - transitions[2 * k])
+
+
+def _look_ahead(match: Callable, i: float, j: float, theta: float, offsets: np.ndarray,
+                step: float, max_gap: int, bounds: Bounds, narrowing: bool = True):
+    r"""
+    Find the ink closest to the predicted direction on arcs of increasing radius.
+
+    The arcs are sampled pixel by pixel from one step up to the maximal gap. The cone
+    narrows with the radius so that its lateral width is constant.
+    Return the angle of the ink, the radius and the fraction of the arc covered by the
+    ink, or None when nothing is found.
+    """
+    imin, imax, jmin, jmax = bounds
+    for radius in np.arange(step, (max_gap + 1) * step + 0.5):
+        cone = offsets * np.sqrt(step / radius) if narrowing else offsets
+        ai = np.rint(i + radius * np.sin(theta + cone)).astype(int)
+        aj = np.rint(j + radius * np.cos(theta + cone)).astype(int)
+        inside = (ai >= imin) & (ai < imax) & (aj >= jmin) & (aj < jmax)
+        if not inside.any():
+            return None
+        hits = np.zeros(offsets.size, dtype=bool)
+        hits[inside] = match(ai[inside], aj[inside])
+        center, length = _best_run(hits)
+        if center is not None:
+            angle = theta + np.interp(center, np.arange(offsets.size), cone)
+            return angle, radius, length / offsets.size
+    return None
+
+
+def _recenter(match: Callable, i: float, j: float, angle: float, half_width: float,
+              bounds: Bounds) -> Tuple[float, float]:
+    r"""Move a point onto the middle of the ink across the direction of the curve."""
+    imin, imax, jmin, jmax = bounds
+    shifts = np.arange(-half_width, half_width + 0.5)
+    ai = np.rint(i + shifts * np.cos(angle)).astype(int)
+    aj = np.rint(j - shifts * np.sin(angle)).astype(int)
+    inside = (ai >= imin) & (ai < imax) & (aj >= jmin) & (aj < jmax)
+    hits = np.zeros(shifts.size, dtype=bool)
+    hits[inside] = match(ai[inside], aj[inside])
+    center, _ = _best_run(hits)
+    if center is None:
+        return i, j
+    shift = np.interp(center, np.arange(shifts.size), shifts)
+    return i + shift * np.cos(angle), j - shift * np.sin(angle)
+
+
+def _follow_compiled(kernel: Callable, image_array: np.ndarray, color: Sequence[float], tolerance: float,
+                     i: float, j: float, theta: float, step: float, max_angle: float, max_gap: int,
+                     max_points: int, bounds: Bounds) -> List[Tuple[float, float]]:
+    r"""Follow a curve with the compiled kernel, see _follow."""
+    image = image_array if image_array.ndim == 3 else image_array[:, :, np.newaxis]
+    maxval = float(np.iinfo(image.dtype).max) if np.issubdtype(image.dtype, np.integer) else 1.0
+    offsets = np.linspace(-max_angle, max_angle, max(int(4 * max_angle * step), 9) | 1)
+    radii = np.arange(step, (max_gap + 1) * step + 0.5)
+    shifts = np.arange(-step, step + 0.5)
+    points = kernel(image, maxval, np.asarray(color, dtype=np.float64)[:3], float(tolerance), float(i), float(j),
+                    float(theta), float(step), offsets, radii, shifts, int(max_points), *bounds)
+    return [(float(pi), float(pj)) for pi, pj in points]
+
+
+def _follow(match: Callable, i: float, j: float, theta: float, step: float,
+            max_angle: float, max_gap: int, max_points: int, bounds: Bounds) -> List[Tuple[float, float]]:
+    r"""Follow a curve from a point in a direction and return the visited points."""
+    offsets = np.linspace(-max_angle, max_angle, max(int(4 * max_angle * step), 9) | 1)
+    points = [(i, j)]
+    visited = {}
+    while len(points) <= max_points:
+        found = _look_ahead(match, i, j, theta, offsets, step, max_gap, bounds)
+        if found is None:
+            break
+        angle, radius, coverage = found
+        # a wide run is a marker or a crossing: the predicted direction is kept
+        if coverage > 0.5:
+            angle = theta
+        i, j = _recenter(match, i + radius * np.sin(angle), j + radius * np.cos(angle),
+                         angle, step, bounds)
+
+        # stop when coming back onto the already traced path
+        cell = (int(i // step), int(j // step))
+        if visited.get(cell, len(points)) < len(points) - 2:
+            break
+        visited.setdefault(cell, len(points))
+        points.append((i, j))
+
+        # the direction is predicted from the last steps so that markers do not deflect it
+        i_back, j_back = points[max(len(points) - 4, 0)]
+        theta = np.arctan2(i - i_back, j - j_back)
+    return points[1:]
+
+
+def trace(image_array: np.ndarray, seeds: Sequence[Tuple[float, float]],
+          color: Optional[Sequence[float]] = None, tolerance: float = 0.25,
+          step: float = 3.0, max_angle: float = 60.0, max_gap: int = 5,
+          max_points: int = 10000, bounds: Optional[Bounds] = None) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Trace a curve from one or two seed points.
+
+    With one seed, the curve is followed on both sides starting with the direction
+    closest to the increasing columns. With two seeds, the starting direction goes
+    from the first seed to the second one. Gaps of dashed lines are bridged by
+    extrapolating the direction and, at crossings, the branch closest to the
+    predicted direction is followed.
+
+    Parameters
+    ----------
+    image_array: array-like, shape (n, m) or (n, m, c)
+        Image as returned by imread.
+    seeds: sequence of tuple
+        One or two matrix indexes i, j close to the curve.
+    color: sequence of float, optional
+        RGB color of the curve between 0 and 1. By default, the color of the ink
+        under the first seed.
+    tolerance: float, optional
+        Maximal euclidean distance in the RGB space.
+    step: float, optional
+        Distance in pixels between consecutive points.
+    max_angle: float, optional
+        Maximal change of direction in degrees between consecutive points.
+    max_gap: int, optional
+        Maximal number of steps without ink before stopping.
+    max_points: int, optional
+        Maximal number of points on each side of the first seed.
+    bounds: tuple of int, optional
+        imin, imax, jmin, jmax. The tracing stops outside.
+
+    Returns
+    -------
+    i: array-like
+        Row indexes of the ordered points.
+    j: array-like
+        Column indexes of the ordered points.
+    """
+    if len(seeds) not in (1, 2):
+        raise ValueError(f'one or two seeds are expected (got {len(seeds)}).')
+    image_array = np.asarray(image_array)
+    if bounds is None:
+        bounds = (0, image_array.shape[0], 0, image_array.shape[1])
+    i0, j0, ink = snap_to_ink(image_array, *seeds[0])
+    match = color_matcher(image_array, ink if color is None else color, tolerance)
+
+    if len(seeds) == 2:
+        i1, j1, _ = snap_to_ink(image_array, *seeds[1])
+        theta = np.arctan2(i1 - i0, j1 - j0)
+    else:
+        # full circle around the seed: the branch closest to the increasing columns
+        angles = np.linspace(-np.pi, np.pi, max(int(8 * np.pi * step), 16), endpoint=False)
+        found = _look_ahead(match, i0, j0, 0.0, angles, step, max_gap, bounds, narrowing=False)
+        theta = 0.0 if found is None else found[0]
+
+    max_angle = np.deg2rad(max_angle)
+    kernel = kernels.get('follow')
+    if kernel is not None:
+        color = ink if color is None else color
+        forward, backward = (_follow_compiled(kernel, image_array, color, tolerance, i0, j0, angle, step,
+                                              max_angle, max_gap, max_points, bounds)
+                             for angle in (theta, theta + np.pi))
+    else:
+        forward = _follow(match, i0, j0, theta, step, max_angle, max_gap, max_points, bounds)
+        backward = _follow(match, i0, j0, theta + np.pi, step, max_angle, max_gap, max_points, bounds)
+    points = np.array(backward[::-1] + [(i0, j0)] + forward)
+    return points[:, 0], points[:, 1]
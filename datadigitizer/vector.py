@@ -0,0 +1,1005 @@
+r"""
+Vector module.
+
+Import of vector figures. The paths of SVG files, and of the content streams of
+PDF files when they are not compressed or compressed with the Flate filter, are
+read without rasterizing so that the data points are exact. The frame of the axes
+and the ticks are recognized from the geometry and the tick labels, when they are
+readable, give the calibration of the axes.
+
+The coordinates are in document units, x to the right and y downwards, which
+are used as the column and row indexes of the point store.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import re
+import mmap
+import zlib
+import pathlib
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from .core import Calibration, new_data, add_points, LIMITS
+
+VECTOR_FORMATS = ('.svg', '.pdf')
+
+_NUMBER = r'[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?'
+_PATH_TOKENS = re.compile(r'[MmLlHhVvCcSsQqTtAaZz]|' + _NUMBER)
+_PATH_ARGS = {'m': 2, 'l': 2, 'h': 1, 'v': 1, 'c': 6, 's': 4, 'q': 4, 't': 2, 'a': 7, 'z': 0}
+# elements only rendered through a reference
+_SKIPPED = {'defs', 'clipPath', 'mask', 'marker', 'symbol', 'pattern', 'metadata', 'style',
+            'title', 'desc', 'linearGradient', 'radialGradient', 'filter'}
+
+
+def _affine(a: float = 1.0, b: float = 0.0, c: float = 0.0, d: float = 1.0,
+            e: float = 0.0, f: float = 0.0) -> np.ndarray:
+    r"""Return the 3x3 matrix of the affine transform x' = a x + c y + e, y' = b x + d y + f."""
+    return np.array([[a, c, e], [b, d, f], [0.0, 0.0, 1.0]])
+
+
+def _apply(matrix: np.ndarray, points: np.ndarray) -> np.ndarray:
+    r"""Apply an affine transform to points of shape (n, 2)."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+def parse_transform(text: Optional[str]) -> np.ndarray:
+    r"""
+    Parse the transform attribute of an SVG element.
+
+    Parameters
+    ----------
+    text: str
+        List of matrix, translate, scale, rotate, skewX and skewY transforms.
+
+    Returns
+    -------
+    matrix: array-like, shape (3, 3)
+        Affine transform.
+    """
+    matrix = _affine()
+    for name, args in re.findall(r'(\w+)\s*\(([^)]*)\)', text or ''):
+        v = [float(x) for x in re.findall(_NUMBER, args)]
+        if name == 'matrix' and len(v) == 6:
+            m = _affine(*v)
+        elif name == 'translate':
+            m = _affine(e=v[0], f=v[1] if len(v) > 1 else 0.0)
+        elif name == 'scale':
+            m = _affine(a=v[0], d=v[1] if len(v) > 1 else v[0])
+        elif name == 'rotate':
+            t = np.deg2rad(v[0])
+            m = _affine(np.cos(t), np.sin(t), -np.sin(t), np.cos(t))
+            if len(v) == 3:
+                m = _affine(e=v[1], f=v[2]) @ m @ _affine(e=-v[1], f=-v[2])
+        elif name == 'skewX':
+            m = _affine(c=np.tan(np.deg2rad(v[0])))
+        elif name == 'skewY':
+            m = _affine(b=np.tan(np.deg2rad(v[0])))
+        else:
+            continue
+        matrix = matrix @ m
+    return matrix
+
+
+def parse_path(d: str) -> List[Tuple[np.ndarray, bool]]:
+    r"""
+    Parse the d attribute of an SVG path.
+
+    Only the vertices are kept: the control points of the curves are dropped.
+
+    Parameters
+    ----------
+    d: str
+        Path data.
+
+    Returns
+    -------
+    subpaths: list of tuple
+        Vertices of shape (n, 2) and closed flag of each subpath.
+    """
+    subpaths = []
+    vertices = []
+    closed = False
+    x = y = x0 = y0 = 0.0
+    command = None
+    tokens = _PATH_TOKENS.findall(d or '')
+    k = 0
+    while k < len(tokens):
+        if tokens[k].isalpha():
+            command = tokens[k]
+            k += 1
+        if command is None:
+            break
+        low = command.lower()
+        n = _PATH_ARGS[low]
+        if low == 'z':
+            closed = True
+            x, y = x0, y0
+            command = None
+            continue
+        if k + n > len(tokens) or any(t.isalpha() for t in tokens[k:k + n]):
+            break
+        v = [float(t) for t in tokens[k:k + n]]
+        k += n
+        dx, dy = (x, y) if command.islower() else (0.0, 0.0)
+        if low == 'm':
+            if len(vertices) > 0:
+                subpaths.append((np.array(vertices), closed))
+            vertices, closed = [], False
+            x, y = v[0] + dx, v[1] + dy
+            x0, y0 = x, y
+            # the following pairs are implicit lines
+            command = 'l' if command == 'm' else 'L'
+        elif low == 'h':
+            x = v[0] + dx
+        elif low == 'v':
+            y = v[0] + dy
+        else:
+            x, y = v[-2] + dx, v[-1] + dy
+        vertices.append((x, y))
+    if len(vertices) > 0:
+        subpaths.append((np.array(vertices), closed))
+    return subpaths
+
+
+def parse_color(text: Optional[str]) -> Optional[Tuple[float, float, float]]:
+    r"""Convert an SVG color into RGB floats, None for none, gradients and unknown colors."""
+    if text is None or text.strip() in ('', 'none', 'transparent') or text.strip().startswith('url'):
+        return None
+    from matplotlib.colors import to_rgb
+    try:
+        return tuple(float(c) for c in to_rgb(text.strip()))
+    except ValueError:
+        return None
+
+
+def parse_label(text: str) -> Optional[float]:
+    r"""
+    Convert a tick label into a number.
+
+    Plain numbers, unicode minus signs, powers of ten and the mathtext markup of
+    Matplotlib are understood.
+
+    Parameters
+    ----------
+    text: str
+        Tick label.
+
+    Returns
+    -------
+    value: float or None
+        None if the label is not a number.
+    """
+    text = text.strip().strip('$').replace('\\mathdefault', '').replace('−', '-')
+    text = text.replace('{', '').replace('}', '').replace(' ', '')
+    text = text.replace('\\times', 'x').replace('×', 'x')
+    match = re.fullmatch(r'(?:(' + _NUMBER + r')x)?10\^(' + _NUMBER + r')', text)
+    try:
+        if match:
+            return float(match.group(1) or 1.0) * 10 ** float(match.group(2))
+        return float(text)
+    except ValueError:
+        return None
+
+
+class VectorFigure(object):
+    r"""Class for the shapes of a vector figure. See __init__.__doc__."""
+
+    def __init__(self, width: float, height: float, shapes: List[Dict],
+                 labels: List[Tuple[str, float, float]]):
+        r"""
+        Shapes and text labels of a vector figure.
+
+        Parameters
+        ----------
+        width, height: float
+            Size of the figure in document units.
+        shapes: list of dict
+            Shapes with the keys kind (path or markers), points of shape (n, 2), closed,
+            stroke and fill RGB colors or None and, for the markers, the outline of
+            shape (k, 2) relative to the points.
+        labels: list of tuple
+            Text, x and y of the centers of the text labels.
+        """
+        self.width = float(width)
+        self.height = float(height)
+        self.shapes = shapes
+        self.labels = labels
+
+    def _segments(self) -> np.ndarray:
+        r"""Return the straight segments of all the shapes as an array of shape (n, 4)."""
+        segments = []
+        for shape in self.shapes:
+            if shape['kind'] == 'path':
+                points = shape['points']
+                if shape['closed']:
+                    points = np.vstack((points, points[:1]))
+                segments.append(np.hstack((points[:-1], points[1:])))
+            else:
+                outline = shape['outline']
+                if outline.shape[0] == 2:
+                    for anchor in shape['points']:
+                        segments.append(np.hstack((outline[:1], outline[1:])) + np.tile(anchor, 2))
+        return np.vstack(segments) if segments else np.empty((0, 4))
+
+    def axes(self, tolerance: float = 1.0) -> Optional[Dict]:
+        r"""
+        Recognize the frame of the axes and the ticks.
+
+        The frame encloses the long horizontal and vertical segments. The ticks are
+        the short segments perpendicular to the bottom and left edges, or to the top
+        and right edges if there are none, ending on the edge.
+
+        Parameters
+        ----------
+        tolerance: float, optional
+            Distance in document units for the alignment of the segments.
+
+        Returns
+        -------
+        axes: dict or None
+            frame as xmin, xmax, ymin, ymax, xticks and yticks as lists of position
+            and value, the value being None for the ticks without a readable label.
+        """
+        segments = self._segments()
+        x0, y0, x1, y1 = segments.T
+        length = np.hypot(x1 - x0, y1 - y0)
+        vertical = np.abs(x1 - x0) <= tolerance / 10
+        horizontal = np.abs(y1 - y0) <= tolerance / 10
+        page = (length >= 0.99 * self.width) & horizontal | (length >= 0.99 * self.height) & vertical
+        long_v = vertical & (length >= 0.3 * self.height) & ~page
+        long_h = horizontal & (length >= 0.3 * self.width) & ~page
+        if not long_v.any() or not long_h.any():
+            return None
+        frame = (float(x0[long_v].min()), float(x0[long_v].max()),
+                 float(y0[long_h].min()), float(y0[long_h].max()))
+        left, right, top, bottom = frame
+
+        short = length <= 0.05 * min(self.width, self.height)
+
+        def ticks(mask, edge, along, across):
+            on_edge = mask & short & ((np.abs(across[0] - edge) <= tolerance) | (np.abs(across[1] - edge) <= tolerance))
+            return np.unique(np.round(along[on_edge], 6))
+
+        xs = ticks(vertical, bottom, x0, (y0, y1))
+        xs = xs if xs.size else ticks(vertical, top, x0, (y0, y1))
+        ys = ticks(horizontal, left, y0, (x0, x1))
+        ys = ys if ys.size else ticks(horizontal, right, y0, (x0, x1))
+        xs = xs[(xs >= left - tolerance) & (xs <= right + tolerance)]
+        ys = ys[(ys >= top - tolerance) & (ys <= bottom + tolerance)]
+
+        def values(positions, outside, position):
+            # each label is matched to the nearest tick if it is closer than half the spacing
+            matched = [None] * positions.size
+            if positions.size == 0:
+                return []
+            spacing = np.min(np.diff(positions)) if positions.size > 1 else np.inf
+            for text, x, y in self.labels:
+                value = parse_label(text)
+                if value is None or not outside(x, y):
+                    continue
+                k = int(np.argmin(np.abs(positions - position(x, y))))
+                if abs(positions[k] - position(x, y)) < spacing / 2 and matched[k] is None:
+                    matched[k] = value
+            return [(float(p), v) for p, v in zip(positions, matched)]
+
+        return {'frame': frame,
+                'xticks': values(xs, lambda x, y: y > bottom or y < top, lambda x, y: x),
+                'yticks': values(ys, lambda x, y: x < left or x > right, lambda x, y: y)}
+
+    def calibration(self, tolerance: float = 1.0) -> Optional[Calibration]:
+        r"""
+        Compute the calibration from the labeled ticks.
+
+        The scale of an axis is logarithmic if the positions of the ticks are better
+        fitted by the logarithm of their values or, with two labels only, if the ticks
+        are not evenly spaced.
+
+        Parameters
+        ----------
+        tolerance: float, optional
+            Distance in document units for the alignment of the segments.
+
+        Returns
+        -------
+        calibration: Calibration or None
+            Calibration in graph pixels, Ypix being height - y, or None if there are
+            not two labeled ticks on each axis.
+        """
+        axes = self.axes(tolerance)
+        if axes is None:
+            return None
+        scales = []
+        for ticks in (axes['xticks'], axes['yticks']):
+            labeled = [(p, v) for p, v in ticks if v is not None]
+            if len(labeled) < 2:
+                return None
+            p, v = np.array(labeled).T
+            log = False
+            if np.all(v > 0) and len(labeled) > 2:
+                residuals = [np.sum((np.polyval(np.polyfit(p, u, 1), p) - u) ** 2) / np.ptp(u) ** 2
+                             for u in (v, np.log10(v))]
+                log = residuals[1] < residuals[0]
+            elif np.all(v > 0):
+                # with two labels only, the minor ticks of a log scale are not evenly spaced
+                spacings = np.diff([position for position, _ in ticks])
+                log = spacings.size > 1 and np.std(spacings) > 0.1 * np.mean(spacings)
+            k0, k1 = np.argmin(v), np.argmax(v)
+            scales.append(((p[k0], p[k1]), (v[k0], v[k1]), log))
+        (xpix, xvalues, xlog), (ypos, yvalues, ylog) = scales
+        ypix = (self.height - ypos[0], self.height - ypos[1])
+        return Calibration(xpix, ypix, xvalues, yvalues, xlog, ylog)
+
+    def series(self, min_points: int = 3, tolerance: float = 1.0) -> List[Dict]:
+        r"""
+        Select the shapes holding data: the open paths and the markers inside the frame.
+
+        The frame, the grid lines, the ticks, the closed paths and the shapes with less
+        than min_points points, e.g. the samples of the legend, are discarded.
+
+        Parameters
+        ----------
+        min_points: int, optional
+            Minimal number of points.
+        tolerance: float, optional
+            Distance in document units for the alignment of the segments.
+
+        Returns
+        -------
+        shapes: list of dict
+            Selected shapes in the document order.
+        """
+        axes = self.axes(tolerance)
+        left, right, top, bottom = axes['frame'] if axes else (0.0, self.width, 0.0, self.height)
+        selected = []
+        for shape in self.shapes:
+            points = shape['points']
+            if (shape['kind'] == 'path' and shape['closed']) or points.shape[0] < min_points:
+                continue
+            x, y = points.T
+            inside = (x >= left - tolerance) & (x <= right + tolerance) \
+                & (y >= top - tolerance) & (y <= bottom + tolerance)
+            if inside.mean() < 0.5:
+                continue
+            # straight horizontal or vertical lines are grid lines
+            if np.ptp(x) <= tolerance / 10 or np.ptp(y) <= tolerance / 10:
+                continue
+            selected.append(shape)
+        return selected
+
+    def to_data(self, scale: float = 1.0, row: Optional[int] = None, min_points: int = 3,
+                tolerance: float = 1.0) -> Tuple[np.ndarray, Optional[Calibration]]:
+        r"""
+        Fill the point store with the limits given by the ticks and one series per data shape.
+
+        Parameters
+        ----------
+        scale: float, optional
+            Number of pixels per document unit of the rendered image.
+        row: int, optional
+            Number of rows of the rendered image. By default, the height times the scale.
+        min_points: int, optional
+            Minimal number of points of a series.
+        tolerance: float, optional
+            Distance in document units for the alignment of the segments.
+
+        Returns
+        -------
+        data: structured array, shape (n,)
+            Limits and data points with their values computed if the calibration is found.
+        calibration: Calibration or None
+            Calibration of the limits registered in the data.
+        """
+        row = self.height * scale if row is None else row
+        data = new_data()
+        calibration = self.calibration(tolerance)
+        if calibration is not None:
+            left, right, top, bottom = self.axes(tolerance)['frame']
+            xpix, ypix = np.array(calibration.xpix), self.height - np.array(calibration.ypix)
+            for which, i, j in zip(LIMITS, (bottom, bottom, ypix[0], ypix[1]),
+                                   (xpix[0], xpix[1], left, left)):
+                data = add_points(data, i * scale, j * scale, row, which=which)
+            calibration = Calibration.from_data(data, calibration.xvalues, calibration.yvalues,
+                                                calibration.xlog, calibration.ylog)
+        for k, shape in enumerate(self.series(min_points, tolerance)):
+            x, y = shape['points'].T
+            data = add_points(data, y * scale, x * scale, row, series=k)
+        if calibration is not None:
+            calibration.apply(data)
+        return data, calibration
+
+    def render(self, scale: float = 1.0) -> np.ndarray:
+        r"""
+        Rasterize the shapes for displaying the figure.
+
+        Parameters
+        ----------
+        scale: float, optional
+            Number of pixels per document unit.
+
+        Returns
+        -------
+        image_array: array-like, shape (n, m, 3)
+            RGB image between 0 and 1.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        dpi = 100
+        fig = Figure(figsize=(self.width * scale / dpi, self.height * scale / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_axis_off()
+        ax.set_xlim(0, self.width)
+        ax.set_ylim(self.height, 0)
+        for shape in self.shapes:
+            x, y = shape['points'].T
+            if shape['kind'] == 'markers':
+                color = shape['fill'] or shape['stroke'] or (0.0, 0.0, 0.0)
+                outline = shape['outline']
+                if outline.shape[0] == 2:
+                    for anchor in shape['points']:
+                        ax.plot(*(outline + anchor).T, color=color, linewidth=0.8 * scale)
+                else:
+                    ax.plot(x, y, linestyle='none', marker='o', color=color,
+                            markersize=max(np.ptp(outline, axis=0).max(), 1.0) * scale * 72 / dpi)
+            elif shape['closed'] and shape['fill'] is not None:
+                ax.fill(x, y, color=shape['fill'], linewidth=0)
+            elif shape['stroke'] is not None:
+                if shape['closed']:
+                    x, y = np.append(x, x[0]), np.append(y, y[0])
+                ax.plot(x, y, color=shape['stroke'], linewidth=scale * 72 / dpi)
+        for text, x, y in self.labels:
+            text = ''.join(c for c in text if c.isprintable())
+            if text.count('$') % 2:
+                text = text.replace('$', r'\$')
+            ax.text(x, y, text, ha='center', va='center', fontsize=8 * scale)
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba())[:, :, :3].astype(np.float64) / 255
+
+
+def _group_markers(primitives: List[Dict]) -> List[Dict]:
+    r"""Gather the consecutive references to the same shape with the same style into markers."""
+    shapes = []
+    for primitive in primitives:
+        if primitive.get('ref') is None:
+            shapes.append(primitive)
+            continue
+        key = (primitive['ref'], primitive['stroke'], primitive['fill'])
+        last = shapes[-1] if shapes else None
+        if last is not None and last['kind'] == 'markers' and last['key'] == key:
+            last['anchors'].append(primitive['anchor'])
+        else:
+            shapes.append({'kind': 'markers', 'key': key, 'anchors': [primitive['anchor']],
+                           'outline': primitive['points'] - primitive['anchor'], 'closed': primitive['closed'],
+                           'stroke': primitive['stroke'], 'fill': primitive['fill']})
+    for shape in shapes:
+        if shape['kind'] == 'markers':
+            shape['points'] = np.array(shape.pop('anchors'))
+            shape.pop('key')
+    return shapes
+
+
+class _SVGReader(object):
+    r"""Walker of the SVG tree accumulating the shapes and the labels."""
+
+    def __init__(self, root):
+        self.ids = {e.get('id'): e for e in root.iter() if e.get('id') is not None}
+        self.primitives = []
+        self.labels = []
+
+    @staticmethod
+    def _tag(element) -> str:
+        return element.tag.split('}')[-1] if isinstance(element.tag, str) else ''
+
+    @staticmethod
+    def _style(element, inherited: Dict) -> Dict:
+        style = dict(inherited)
+        for name in ('stroke', 'fill'):
+            if element.get(name) is not None:
+                style[name] = element.get(name)
+        for declaration in (element.get('style') or '').split(';'):
+            name, _, value = declaration.partition(':')
+            if name.strip() in ('stroke', 'fill'):
+                style[name.strip()] = value.strip()
+        return style
+
+    def _emit(self, points, closed, matrix, style, ref=None, anchor=None, label=None):
+        points = _apply(matrix, points)
+        if label is not None:
+            label.append(points)
+            return
+        primitive = {'kind': 'path', 'points': points, 'closed': closed,
+                     'stroke': parse_color(style.get('stroke')), 'fill': parse_color(style.get('fill'))}
+        if ref is not None:
+            primitive['ref'] = ref
+            primitive['anchor'] = anchor
+        self.primitives.append(primitive)
+
+    def walk(self, element, matrix: np.ndarray, style: Dict, ref=None, anchor=None, label=None):
+        tag = self._tag(element)
+        if tag in _SKIPPED:
+            return
+        matrix = matrix @ parse_transform(element.get('transform'))
+        style = self._style(element, style)
+
+        def number(name):
+            return float(re.findall(_NUMBER, element.get(name) or '0')[0])
+
+        if tag in ('svg', 'g', 'a', 'switch'):
+            children = list(element)
+            # Matplotlib writes the string of the text rendered as glyphs in a comment
+            if label is None and children and children[0].tag is ElementTree.Comment:
+                outlines = []
+                for child in children[1:]:
+                    self.walk(child, matrix, style, label=outlines)
+                if outlines:
+                    center = (np.min(np.vstack(outlines), axis=0) + np.max(np.vstack(outlines), axis=0)) / 2
+                    self.labels.append((children[0].text.strip(), float(center[0]), float(center[1])))
+                return
+            for child in children:
+                if isinstance(child.tag, str):
+                    self.walk(child, matrix, style, ref, anchor, label)
+        elif tag == 'use':
+            target = self.ids.get((element.get('{http://www.w3.org/1999/xlink}href')
+                                   or element.get('href') or '').lstrip('#'))
+            if target is not None:
+                matrix = matrix @ _affine(e=number('x'), f=number('y'))
+                if ref is None and label is None:
+                    ref, anchor = target.get('id'), _apply(matrix, (0.0, 0.0))[0]
+                self.walk(target, matrix, style, ref, anchor, label)
+        elif tag == 'path':
+            for points, closed in parse_path(element.get('d')):
+                self._emit(points, closed, matrix, style, ref, anchor, label)
+        elif tag in ('polyline', 'polygon'):
+            values = [float(v) for v in re.findall(_NUMBER, element.get('points') or '')]
+            if len(values) >= 2:
+                points = np.reshape(values[:len(values) // 2 * 2], (-1, 2))
+                self._emit(points, tag == 'polygon', matrix, style, ref, anchor, label)
+        elif tag == 'line':
+            points = [(number('x1'), number('y1')), (number('x2'), number('y2'))]
+            self._emit(points, False, matrix, style, ref, anchor, label)
+        elif tag == 'rect':
+            x, y, w, h = number('x'), number('y'), number('width'), number('height')
+            self._emit([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], True, matrix, style, ref, anchor, label)
+        elif tag in ('circle', 'ellipse'):
+            cx, cy = number('cx'), number('cy')
+            rx = number('r') if tag == 'circle' else number('rx')
+            ry = number('r') if tag == 'circle' else number('ry')
+            t = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+            points = np.column_stack((cx + rx * np.cos(t), cy + ry * np.sin(t)))
+            # a circle is a marker centered on its data point
+            if ref is None and label is None:
+                ref, anchor = f'{tag}:{rx}:{ry}', _apply(matrix, (cx, cy))[0]
+            self._emit(points, True, matrix, style, ref, anchor, label)
+        elif tag == 'text':
+            # the tspans raised above the first one are exponents
+            pieces = [(element.text or '', element)] + [(child.text or '', child) for child in element]
+            pieces = [(text.strip(), piece) for text, piece in pieces if text.strip()]
+            if pieces:
+                text, raised = '', False
+                baseline = number('y') if element.get('y') is not None else None
+                for piece_text, piece in pieces:
+                    y = float(re.findall(_NUMBER, piece.get('y'))[0]) if piece.get('y') else baseline
+                    baseline = y if baseline is None else baseline
+                    up = y is not None and y < baseline - 1e-6
+                    text += ('^' if up and not raised else '') + piece_text
+                    raised = up
+                size = re.search(r'font-size:\s*(' + _NUMBER + ')', (pieces[0][1].get('style') or '')
+                                 + (element.get('style') or ''))
+                size = float(size.group(1)) if size else 10.0
+                # center of the string approximated from the font size
+                x, y = _apply(matrix, (number('x') + 0.3 * len(text) * size, (baseline or 0.0) - 0.35 * size))[0]
+                self.labels.append((text, float(x), float(y)))
+
+
+def read_svg(fpath: Union[str, pathlib.Path]) -> VectorFigure:
+    r"""
+    Read the shapes of an SVG file.
+
+    Parameters
+    ----------
+    fpath: str or Path
+        Path to the SVG file.
+
+    Returns
+    -------
+    figure: VectorFigure
+    """
+    try:
+        parser = ElementTree.XMLParser(target=ElementTree.TreeBuilder(insert_comments=True))
+    except TypeError:
+        # python < 3.8: the labels written in comments are not available
+        parser = None
+    root = ElementTree.parse(str(fpath), parser=parser).getroot()
+    viewbox = [float(v) for v in re.findall(_NUMBER, root.get('viewBox') or '')]
+    if len(viewbox) == 4:
+        width, height = viewbox[2], viewbox[3]
+        matrix = _affine(e=-viewbox[0], f=-viewbox[1])
+    else:
+        width = float(re.findall(_NUMBER, root.get('width') or '0')[0])
+        height = float(re.findall(_NUMBER, root.get('height') or '0')[0])
+        matrix = _affine()
+    reader = _SVGReader(root)
+    reader.walk(root, matrix, {'fill': 'black'})
+    return VectorFigure(width, height, _group_markers(reader.primitives), reader.labels)
+
+
+# tokens of the PDF content streams and objects: strings, arrays, dictionaries, names,
+# numbers, operators and comments
+PDF_TOKENS = re.compile(rb'\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>|\[|\]|<<|>>|/[^\s/\[\]()<>{}%]*|'
+                         rb'[-+]?(?:\d*\.\d+|\d+\.?)|[A-Za-z\'"*]+\d?\*?|%[^\r\n]*')
+
+
+def pdf_string(token: bytes) -> str:
+    r"""
+    Decode a literal or hexadecimal PDF string.
+
+    Parameters
+    ----------
+    token: bytes
+        String token matched by PDF_TOKENS, with its parentheses or angle brackets.
+
+    Returns
+    -------
+    text: str
+        Bytes of the string with the escape sequences resolved, decoded as latin-1.
+    """
+    if token.startswith(b'<'):
+        return bytes.fromhex(token[1:-1].decode('ascii')).decode('latin-1')
+    body = re.sub(rb'\\([nrtbf()\\])', lambda m: {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b',
+                                                    b'f': b'\f'}.get(m.group(1), m.group(1)), token[1:-1])
+    body = re.sub(rb'\\([0-7]{1,3})', lambda m: bytes([int(m.group(1), 8) & 255]), body)
+    return body.decode('latin-1')
+
+
+class PDFFile(object):
+    r"""Class for the lazy access to the objects of a PDF file. See __init__.__doc__."""
+
+    def __init__(self, fpath: Union[str, pathlib.Path]):
+        r"""
+        Lazy access to the objects of a PDF file.
+
+        The file is memory mapped and only the offsets of the objects are indexed when
+        opening: the objects are parsed and their streams decoded when requested, so
+        that the memory used for a page does not depend on the number of pages.
+        The objects inside object streams are not supported.
+
+        Parameters
+        ----------
+        fpath: str or Path
+            Path to the PDF file.
+        """
+        self.fpath = pathlib.Path(fpath)
+        self._fobj = open(self.fpath, 'rb')
+        try:
+            self._data = mmap.mmap(self._fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fobj.close()
+            raise ValueError(f'{fpath} is empty.')
+        # the last definition of an object wins as in incremental updates
+        self._offsets = {int(match.group(1)): match.end()
+                         for match in re.finditer(rb'(\d+)\s+\d+\s+obj\b', self._data)}
+
+    def close(self):
+        r"""Release the memory map and the file."""
+        self._data.close()
+        self._fobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _span(self, number: int):
+        r"""Return the offsets of the dictionary and of the stream of an object."""
+        start = self._offsets.get(number)
+        if start is None:
+            return None
+        end = self._data.find(b'endobj', start)
+        end = len(self._data) if end < 0 else end
+        found = re.compile(rb'stream\r?\n').search(self._data, start, end)
+        if found is None:
+            return start, end, None, None
+        stream_end = self._data.rfind(b'endstream', found.end(), end)
+        return start, found.start(), found.end(), stream_end if stream_end >= 0 else end
+
+    def object(self, number: int) -> bytes:
+        r"""Return the content of an object without its stream, empty if it does not exist."""
+        span = self._span(number)
+        return b'' if span is None else self._data[span[0]:span[1]]
+
+    def raw_stream(self, number: int) -> Optional[bytes]:
+        r"""Return the stream of an object without decoding it."""
+        span = self._span(number)
+        if span is None or span[2] is None:
+            return None
+        return self._data[span[2]:span[3]].rstrip(b'\r\n')
+
+    def stream(self, number: int) -> Optional[bytes]:
+        r"""Return the stream of an object decoded if it has no filter or the Flate filter, None otherwise."""
+        body, raw = self.object(number), self.raw_stream(number)
+        if raw is None:
+            return None
+        if b'/FlateDecode' in body:
+            try:
+                return zlib.decompress(raw)
+            except zlib.error:
+                return None
+        # other filters are not supported
+        return None if b'/Filter' in body else raw
+
+    def resolve(self, body: bytes, key: bytes) -> bytes:
+        r"""Return the value of a key of a dictionary, following the indirect reference."""
+        match = re.search(rb'/' + key + rb'\s*(\d+)\s+\d+\s+R', body)
+        if match:
+            return self.object(int(match.group(1)))
+        match = re.search(rb'/' + key + rb'\s*<<', body)
+        if match is None:
+            return b''
+        # balanced dictionary
+        depth, k = 0, match.end() - 2
+        while k < len(body):
+            if body[k:k + 2] == b'<<':
+                depth, k = depth + 1, k + 2
+            elif body[k:k + 2] == b'>>':
+                depth, k = depth - 1, k + 2
+                if depth == 0:
+                    break
+            else:
+                k += 1
+        return body[match.end() - 2:k]
+
+    def inherited(self, body: bytes, key: bytes) -> bytes:
+        r"""Return the value of a key of a page, looking into the parents of the page tree if needed."""
+        for _ in range(32):
+            if re.search(rb'/' + key + rb'\b', body):
+                return body
+            parent = re.search(rb'/Parent\s+(\d+)\s+\d+\s+R', body)
+            if parent is None:
+                break
+            body = self.object(int(parent.group(1)))
+        return b''
+
+    def xobjects(self, resources: bytes) -> Dict[str, int]:
+        r"""Return the object numbers of the XObjects of resources."""
+        xobjects = self.resolve(resources, b'XObject')
+        return {name.decode(): int(n) for name, n in re.findall(rb'/([^\s/]+)\s+(\d+)\s+\d+\s+R', xobjects)}
+
+    def pages(self) -> List[int]:
+        r"""Return the object numbers of the pages following the page tree, or in the order of the file."""
+        root = None
+        for match in re.finditer(rb'/Root\s+(\d+)\s+\d+\s+R', self._data):
+            root = int(match.group(1))
+        pages = []
+
+        def walk(number, depth):
+            body = self.object(number)
+            if re.search(rb'/Type\s*/Page\b', body):
+                pages.append(number)
+            elif depth < 32:
+                kids = re.search(rb'/Kids\s*\[([^\]]*)\]', body)
+                for kid in re.findall(rb'(\d+)\s+\d+\s+R', kids.group(1)) if kids else []:
+                    walk(int(kid), depth + 1)
+
+        tree = re.search(rb'/Pages\s+(\d+)\s+\d+\s+R', self.object(root)) if root is not None else None
+        if tree is not None:
+            walk(int(tree.group(1)), 0)
+        if not pages:
+            pages = [n for n in self._offsets if re.search(rb'/Type\s*/Page\b', self.object(n))]
+        return pages
+
+    def media_box(self, page: int) -> Tuple[float, float, float, float]:
+        r"""Return x0, y0, x1, y1 of the media box of a page."""
+        box = re.search(rb'/MediaBox\s*\[([^\]]*)\]', self.inherited(self.object(page), b'MediaBox'))
+        return tuple(float(v) for v in box.group(1).split()) if box else (0.0, 0.0, 612.0, 792.0)
+
+    def contents(self, page: int) -> bytes:
+        r"""Return the decoded content streams of a page."""
+        contents = re.search(rb'/Contents\s*(\[[^\]]*\]|\d+\s+\d+\s+R)', self.object(page))
+        numbers = [int(n) for n in re.findall(rb'(\d+)\s+\d+\s+R', contents.group(1))] if contents else []
+        return b'\n'.join(self.stream(n) or b'' for n in numbers)
+
+
+class _PDFReader(object):
+    r"""Interpreter of the path and text operators of PDF content streams."""
+
+    def __init__(self, pdf: PDFFile):
+        self.pdf = pdf
+        self.primitives = []
+        self.labels = []
+
+    def run(self, content: bytes, ctm: np.ndarray, xobjects: Dict[str, int], height: float,
+            ref=None, anchor=None, depth: int = 0, stroke=(0.0, 0.0, 0.0), fill=(0.0, 0.0, 0.0)):
+        r"""Interpret a content stream with the current transformation matrix and colors."""
+        stack = []
+        states = []
+        subpaths = []
+        current = []
+        pieces = []
+        font_size = 1.0
+        text_matrix = _affine()
+        line_matrix = _affine()
+        flip = _affine(d=-1.0, f=height)
+
+        def emit(do_stroke, do_fill):
+            paths = subpaths + ([(current, False)] if current else [])
+            for points, closed in paths:
+                if len(points) > 0:
+                    primitive = {'kind': 'path', 'points': _apply(flip @ ctm, points), 'closed': closed,
+                                 'stroke': stroke if do_stroke else None, 'fill': fill if do_fill else None}
+                    if ref is not None:
+                        primitive['ref'] = ref
+                        primitive['anchor'] = anchor
+                    self.primitives.append(primitive)
+
+        def show(text):
+            if text.strip():
+                # center of the string approximated from the font size
+                x, y = _apply(flip @ ctm @ text_matrix, (0.3 * len(text.strip()) * font_size, 0.35 * font_size))[0]
+                # the pieces raised above the first one are exponents
+                raised = bool(pieces) and text_matrix[1, 2] - pieces[0][3] > 0.25 * pieces[0][4]
+                if raised and not (len(pieces) > 1 and pieces[-1][5]):
+                    text = '^' + text
+                pieces.append((text, x, y, text_matrix[1, 2], font_size, raised))
+
+        for token in PDF_TOKENS.findall(content):
+            if token[:1] in b'(<' and token != b'<<':
+                stack.append(pdf_string(token))
+                continue
+            try:
+                stack.append(float(token))
+                continue
+            except ValueError:
+                pass
+            if token.startswith(b'/') or token in (b'[', b']', b'<<', b'>>') or token.startswith(b'%'):
+                stack.append(token)
+                continue
+            op = token.decode('latin-1')
+            numbers = [v for v in stack if isinstance(v, float)]
+            if op == 'q':
+                states.append((ctm, stroke, fill))
+            elif op == 'Q' and states:
+                ctm, stroke, fill = states.pop()
+            elif op == 'cm' and len(numbers) >= 6:
+                ctm = ctm @ _affine(*numbers[-6:])
+            elif op == 'm' and len(numbers) >= 2:
+                if current:
+                    subpaths.append((current, False))
+                current = [tuple(numbers[-2:])]
+            elif op in ('l', 'c', 'v', 'y') and len(numbers) >= 2:
+                current.append(tuple(numbers[-2:]))
+            elif op == 're' and len(numbers) >= 4:
+                x, y, w, h = numbers[-4:]
+                subpaths.append(([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], True))
+            elif op == 'h' and current:
+                subpaths.append((current, True))
+                current = []
+            elif op in ('S', 's', 'f', 'F', 'f*', 'B', 'B*', 'b', 'b*', 'n'):
+                if op in ('s', 'b', 'b*') and current:
+                    subpaths.append((current, True))
+                    current = []
+                if op != 'n':
+                    emit(op in ('S', 's', 'B', 'B*', 'b', 'b*'), op not in ('S', 's'))
+                subpaths, current = [], []
+            elif op in ('RG', 'rg') and len(numbers) >= 3:
+                color = tuple(min(max(v, 0.0), 1.0) for v in numbers[-3:])
+                stroke, fill = (color, fill) if op == 'RG' else (stroke, color)
+            elif op in ('G', 'g') and numbers:
+                color = (numbers[-1],) * 3
+                stroke, fill = (color, fill) if op == 'G' else (stroke, color)
+            elif op in ('K', 'k') and len(numbers) >= 4:
+                c, m, y, k = numbers[-4:]
+                color = ((1 - c) * (1 - k), (1 - m) * (1 - k), (1 - y) * (1 - k))
+                stroke, fill = (color, fill) if op == 'K' else (stroke, color)
+            elif op in ('SC', 'SCN', 'sc', 'scn') and len(numbers) >= 3:
+                color = tuple(numbers[-3:])
+                stroke, fill = (color, fill) if op in ('SC', 'SCN') else (stroke, color)
+            elif op == 'BT':
+                text_matrix = line_matrix = _affine()
+                pieces = []
+            elif op == 'ET' and pieces:
+                # the pieces of a text object form one label
+                x, y = np.mean([piece[1:3] for piece in pieces], axis=0)
+                self.labels.append((''.join(piece[0] for piece in pieces), float(x), float(y)))
+                pieces = []
+            elif op == 'Tf' and numbers:
+                font_size = numbers[-1]
+            elif op in ('Td', 'TD') and len(numbers) >= 2:
+                line_matrix = line_matrix @ _affine(e=numbers[-2], f=numbers[-1])
+                text_matrix = line_matrix
+            elif op == 'Tm' and len(numbers) >= 6:
+                text_matrix = line_matrix = _affine(*numbers[-6:])
+            elif op in ('Tj', "'", '"') and stack and isinstance(stack[-1], str):
+                show(stack[-1])
+            elif op == 'TJ':
+                show(''.join(v for v in stack if isinstance(v, str)))
+            elif op == 'Do' and stack and isinstance(stack[-1], bytes) and depth < 8:
+                number = xobjects.get(stack[-1][1:].decode('latin-1'))
+                body = self.pdf.object(number)
+                stream = self.pdf.stream(number) if re.search(rb'/Subtype\s*/Form', body) else None
+                if stream is not None:
+                    matrix = re.search(rb'/Matrix\s*\[([^\]]*)\]', body)
+                    form = ctm @ (_affine(*[float(v) for v in matrix.group(1).split()]) if matrix else _affine())
+                    if ref is None:
+                        self.run(stream, form, xobjects, height, f'xobject:{number}',
+                                 _apply(flip @ form, (0.0, 0.0))[0], depth + 1, stroke, fill)
+                    else:
+                        self.run(stream, form, xobjects, height, ref, anchor, depth + 1, stroke, fill)
+            stack = []
+
+
+def read_pdf(fpath: Union[str, pathlib.Path, PDFFile], page: int = 0) -> VectorFigure:
+    r"""
+    Read the shapes of a page of a PDF file.
+
+    Only the content streams without filter or with the Flate filter are read. The
+    text is read from the literal strings: the labels of fonts with custom encodings
+    are not understood and the calibration must then be entered by hand.
+
+    Parameters
+    ----------
+    fpath: str, Path or PDFFile
+        Path to the PDF file or opened PDF file.
+    page: int, optional
+        Index of the page.
+
+    Returns
+    -------
+    figure: VectorFigure
+    """
+    if not isinstance(fpath, PDFFile):
+        with PDFFile(fpath) as pdf:
+            return read_pdf(pdf, page)
+    pdf = fpath
+    pages = pdf.pages()
+    if not 0 <= page < len(pages):
+        raise ValueError(f'{pdf.fpath} has {len(pages)} pages.')
+    x0, y0, x1, y1 = pdf.media_box(pages[page])
+    resources = pdf.resolve(pdf.inherited(pdf.object(pages[page]), b'Resources'), b'Resources')
+    xobjects = pdf.xobjects(resources)
+    for number in list(xobjects.values()):
+        # the forms may have their own XObjects
+        forms = pdf.xobjects(pdf.resolve(pdf.object(number), b'Resources'))
+        xobjects.update({k: v for k, v in forms.items() if k not in xobjects})
+    reader = _PDFReader(pdf)
+    reader.run(pdf.contents(pages[page]), _affine(e=-x0, f=-y0), xobjects, y1 - y0)
+    return VectorFigure(x1 - x0, y1 - y0, _group_markers(reader.primitives), reader.labels)
+
+
+def read(fpath: Union[str, pathlib.Path]) -> VectorFigure:
+    r"""
+    Read a vector figure according to the extension of the file.
+
+    Parameters
+    ----------
+    fpath: str or Path
+        Path to an SVG or a PDF file.
+
+    Returns
+    -------
+    figure: VectorFigure
+    """
+    suffix = pathlib.Path(fpath).suffix.lower()
+    if suffix == '.svg':
+        return read_svg(fpath)
+    elif suffix == '.pdf':
+        return read_pdf(fpath)
+    raise ValueError(f'{suffix} is not a vector format: {VECTOR_FORMATS}.')
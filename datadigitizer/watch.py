@@ -0,0 +1,265 @@
+r"""
+Watch module.
+
+Unattended digitization of the files dropped into a folder, e.g. by an instrument.
+The folder is scanned periodically and, on Linux, inotify wakes the scan up as soon
+as a file is written. A file is taken once its size and modification time have not
+changed for a settling delay so that the files being written are not read. The
+ready files are queued in a bounded queue and digitized one by one into the output
+folder as by a batch job, with the same data and session files and the same journal.
+
+The state kept in memory only concerns the files present in the folder and the
+journal entries are written, not kept: the memory does not grow with the running
+time.
+
+Copyright (C) 2020-2021 Milan Skocic.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Author: Milan Skocic <milan.skocic@gmail.com>
+"""
+import os
+import sys
+import time
+import queue
+import select
+import pathlib
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from . import batch
+from .core import Calibration
+from .templates import Template
+
+SUFFIXES = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.gif', '.pdf', '.svg')
+# inotify events of a file written or moved into the folder
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+
+
+class _Inotify(object):
+    r"""Wake-up on the changes of a folder by inotify, Linux only."""
+
+    def __init__(self, folder: pathlib.Path):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+
+    def wait(self, timeout: float):
+        r"""Wait for events at most timeout seconds and discard them: the folder is scanned anyway."""
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+    r"""Class for watching a folder. See __init__.__doc__."""
+
+    def __init__(self, folder: Union[str, pathlib.Path], output: Union[str, pathlib.Path],
+                 method: str = 'auto', template: Optional[Union[str, pathlib.Path, Template]] = None,
+                 calibration: Optional[Calibration] = None, fmt: str = 'long', workers: int = 1,
+                 interval: float = 2.0, settle: float = 2.0, queue_size: int = 64,
+                 suffixes: Sequence[str] = SUFFIXES, inotify: Optional[bool] = None,
+                 callback: Optional[Callable[[pathlib.Path], None]] = None):
+        r"""
+        Digitize the new and the modified files of a folder.
+
+        The files already digitized into the output folder, as recorded in its journal,
+        are skipped at the start unless they were modified.
+
+        Parameters
+        ----------
+        folder: str or Path
+            Watched folder. Its subfolders are not watched.
+        output: str or Path
+            Output folder, see :func:`datadigitizer.batch.run`.
+        method: str, optional
+            Extraction method, one of BATCH_METHODS.
+        template: str, Path or Template, optional
+            Calibration template, its name or its file, aligned onto each page.
+        calibration: Calibration, optional
+            Calibration applied to all the pages when there is no template.
+        fmt: str, optional
+            Format of the data files.
+        workers: int, optional
+            Number of worker processes sharing each page.
+        interval: float, optional
+            Maximal time in seconds between two scans.
+        settle: float, optional
+            Time in seconds during which a file must not change before being read.
+        queue_size: int, optional
+            Number of ready files waiting to be digitized. The scan waits when the
+            queue is full.
+        suffixes: sequence of str, optional
+            Suffixes of the watched files.
+        inotify: bool, optional
+            Use inotify to wake up the scan. By default, if available.
+        callback: callable, optional
+            Function called with the path of each written session file.
+        """
+        self.folder = pathlib.Path(folder)
+        self.output = pathlib.Path(output)
+        if not self.folder.is_dir():
+            raise ValueError(f'{self.folder} is not a folder.')
+        if template is not None and not isinstance(template, Template):
+            template = Template.load(template)
+        self.options = {'method': method, 'calibration': calibration, 'fmt': fmt, 'template': template,
+                        'workers': workers}
+        self.interval = interval
+        self.settle = settle
+        self.suffixes = tuple(suffix.lower() for suffix in suffixes)
+        self.callback = callback
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.processed = 0
+        # signature and first time seen with it of the files not ready yet
+        self._pending: Dict[str, Tuple[List[int], float]] = {}
+        # signature of the files queued or digitized
+        self._done: Dict[str, List[int]] = {}
+        self.output.mkdir(parents=True, exist_ok=True)
+        self._journal = batch.Journal(self.output / batch.JOURNAL_NAME, append=True, remember=False)
+        for (source, page), entry in self._journal.entries.items():
+            if page is None and entry['status'] == 'complete':
+                self._done[source] = entry['signature']
+        self._journal.entries.clear()
+        self._inotify = None
+        if inotify or (inotify is None and sys.platform.startswith('linux')):
+            try:
+                self._inotify = _Inotify(self.folder)
+            except (OSError, AttributeError):
+                if inotify:
+                    raise
+
+    def scan(self, now: Optional[float] = None) -> List[pathlib.Path]:
+        r"""
+        Scan the folder once.
+
+        Parameters
+        ----------
+        now: float, optional
+            Current time as given by time.monotonic.
+
+        Returns
+        -------
+        ready: list of Path
+            New or modified files which did not change during the settling delay.
+        """
+        now = time.monotonic() if now is None else now
+        present, ready = set(), []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if (entry.name.startswith('.') or not entry.name.lower().endswith(self.suffixes)
+                        or not entry.is_file()):
+                    continue
+                source = str(pathlib.Path(entry.path).absolute())
+                present.add(source)
+                stat = entry.stat()
+                signature = [stat.st_size, stat.st_mtime_ns]
+                if self._done.get(source) == signature:
+                    continue
+                previous = self._pending.get(source)
+                if previous is None or previous[0] != signature:
+                    # new or still being written: the settling delay starts again
+                    self._pending[source] = (signature, now)
+                elif stat.st_size > 0 and now - previous[1] >= self.settle:
+                    del self._pending[source]
+                    self._done[source] = signature
+                    ready.append(pathlib.Path(source))
+        # the removed files are forgotten: the state is bounded by the folder
+        for state in (self._pending, self._done):
+            for source in set(state) - present:
+                del state[source]
+        return sorted(ready)
+
+    def _wait(self, timeout: float):
+        if self._inotify is None:
+            self.stopped.wait(timeout)
+        else:
+            self._inotify.wait(timeout)
+
+    def _scan_loop(self):
+        r"""Scan the folder and queue the ready files until stopped."""
+        while not self.stopped.is_set():
+            for fpath in self.scan():
+                while not self.stopped.is_set():
+                    try:
+                        self.queue.put(fpath, timeout=self.interval)
+                        break
+                    except queue.Full:
+                        continue
+            # the pending files are scanned again once settled
+            self._wait(min(self.interval, self.settle) if self._pending else self.interval)
+
+    def process(self, fpath: pathlib.Path):
+        r"""
+        Digitize all the pages of a file into the output folder.
+
+        Parameters
+        ----------
+        fpath: Path
+            Path to the file.
+        """
+        # the files removed after being queued are recorded as failed by run
+        for spath in batch.run([fpath], self.output, journal=self._journal, **self.options):
+            if self.callback is not None:
+                self.callback(spath)
+        self.processed += 1
+
+    def run(self):
+        r"""Scan the folder in a thread and digitize the queued files until stop is called."""
+        scanner = threading.Thread(target=self._scan_loop, name='datadigitizer-scan', daemon=True)
+        scanner.start()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    fpath = self.queue.get(timeout=self.interval)
+                except queue.Empty:
+                    continue
+                self.process(fpath)
+        finally:
+            self.stopped.set()
+            scanner.join()
+
+    def stop(self):
+        r"""Stop the scan and the digitization after the current file."""
+        self.stopped.set()
+
+    def close(self):
+        r"""Close the journal and the inotify watch."""
+        self._journal.close()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -35,10 +35,11 @@ setup(name=datadigitizer.__package_name__,
       long_description=read('README.rst'),
       url='https://milanskocic.github.io/PyDatadigitizer/index.html',
       download_url='https://github.com/MilanSkocic/PyDatadigitizer/',
-      packages=find_packages(),
+      packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
       include_package_data=True,
       python_requires='>=3.6',
       install_requires=read('./requirements.txt').split('\n'),
+      extras_require={'jit': ['numba>=0.50']},
       classifiers=["Development Status :: 5 - Production/Stable",
                    "Intended Audience :: Science/Research",
                    "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",